@@ -1,10 +1,21 @@
-from .bot.akyuu import AkyuuBot
-from .config import logger
-from .bot.extensions import sanity, boneka, dev_commands, help
-# run all the extensions to add them to the bot
+from .config import logger, get_config
 
 
-if __name__ == '__main__':
+def main():
     logger.info("Starting Akyuu Bot")
+    conf = get_config()  # fail on a missing config before importing everything else
+    if conf.bot_data.SHARD_COUNT > 1:
+        from .bot.shards import run_supervisor
+
+        run_supervisor(conf.bot_data.SHARD_COUNT)
+        return
+    from .bot.akyuu import AkyuuBot
+    from .bot.extensions import sanity, boneka, stat_query, moves, matchups, dev_commands, help
+    # run all the extensions to add them to the bot
+
     bot = AkyuuBot()
     bot.start()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,67 @@
-from typing import Type, Optional
+import asyncio
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Type, Optional, Union, TYPE_CHECKING
 
+import aiohttp
 import interactions
 from interactions.api.models.flags import Intents
 import interactions.ext.wait_for as wait_for
 
-from ..config import config, logger, ConfigError, Config
+from attr import evolve
+
+from ..config import get_config, logger, ConfigError, Config, apply_config, save_config
+from ..rom_api.dataset import Dataset, build_dataset, rebuild_dataset, dataset_version, save_snapshot, load_snapshot, \
+    share_records
+from ..rom_api.offset_discovery import Discovery, OffsetsMovedError, corrected_offsets, describe, \
+    discover_offsets_blocking
 from ..rom_api.rom import Rom
-from ..rom_api.stats import get_all_boneka_data, Boneka
-from ..rom_api.wild_data import get_all_wild_data, WildLocation
+from ..rom_api.stats import Boneka
+from ..rom_api.wild_data import WildLocation
 from ..ups_wrapper import UpsPatch
 
-SCOPE = config.bot_data.DEV_SERVERS if config.bot_data.DEV_MODE else None
+if TYPE_CHECKING:
+    from ..rom_api.learners import LearnerIndex
+    from ..rom_api.stat_table import StatTable
+    from ..util.async_mega import AsyncMega
+    from ..util.sprite_cdn import SpriteCdn
+
+SCOPE: Optional[list[int]]
+VERSIONS: tuple[str, ...]
+
+
+def __getattr__(name):
+    # worked out from the config when the extensions are loaded, so importing this module doesn't load the config
+    if name == 'SCOPE':
+        conf = get_config()
+        return conf.bot_data.DEV_SERVERS if conf.bot_data.DEV_MODE else None
+    if name == 'VERSIONS':
+        conf = get_config()
+        return conf.bot_data.MAIN_VERSION, *conf.bot_data.VERSION_PATCHES
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class AkyuuBot(interactions.Client):
     extensions: list[str] = []
     listener = interactions.api.dispatch.Listener()
 
-    def __init__(self, **kwargs):
-        super().__init__(token=config.bot_data.TOKEN, intents=Intents.DEFAULT | Intents.GUILD_MESSAGE_CONTENT, **kwargs)
-
-        self.config: Config = config
-        self.boneka_data = self.wild_data = None
+    def __init__(self, shard: Optional[tuple[int, int]] = None, **kwargs):
+        """
+        `shard` is (shard id, shard count) when this is one of the processes started by the shard supervisor
+        """
+        if shard is not None:
+            kwargs.update(shards=list(shard), disable_sync=shard[0] != 0)  # one shard is enough to sync commands
+        super().__init__(token=get_config().bot_data.TOKEN, intents=Intents.DEFAULT | Intents.GUILD_MESSAGE_CONTENT,
+                         **kwargs)
+        self.init_state()
+        self.shard = shard
+        # so commands can be answered as soon as we're logged in
+        if shard is None:
+            self.load_snapshot()
+        else:
+            self.attach_generation()
 
         logger.debug("Adding extensions")
         for ext in self.extensions:
@@ -33,10 +73,27 @@ class AkyuuBot(interactions.Client):
         self.listener.dispatch("ON_READY")
         wait_for.setup(self, True)
 
+    def init_state(self):
+        """
+        Sets up everything the bot keeps besides the Discord client itself.
+        Separate from __init__ so the data side can be used without connecting to Discord
+        """
+        self.config: Config = get_config()
+        self.dataset: Optional[Dataset] = None  # the main version
+        self.versions: dict[str, Dataset] = {}  # every other version, without their roms
+        self.offset_discoveries: list[Discovery] = []  # where the tables were found on the last /update
+        self._revalidate_task: Optional[asyncio.Task] = None
+        self.shard: Optional[tuple[int, int]] = None
+        self.generation: Optional[str] = None  # the published generation the data came from, when sharded
+        self._generation_task: Optional[asyncio.Task] = None
+        self._http_session: Optional[aiohttp.ClientSession] = None
+        self._mega: Optional['AsyncMega'] = None
+        self._sprite_cdn: Optional['SpriteCdn'] = None
+
     @staticmethod
-    def get_patch() -> bytes:
+    def get_patch(patch_path: Optional[str] = None) -> bytes:
         logger.debug("Getting patch")
-        patch_path = config.bot_data.PATCH_PATH
+        patch_path = patch_path or get_config().bot_data.PATCH_PATH
         try:
             with open(patch_path, 'rb') as f:
                 return f.read()
@@ -46,50 +103,421 @@ class AkyuuBot(interactions.Client):
     @staticmethod
     def get_rom() -> bytes:
         logger.debug("Getting rom")
-        rom_path = config.bot_data.ROM_PATH
+        rom_path = get_config().bot_data.ROM_PATH
         try:
             with open(rom_path, 'rb') as f:
                 return f.read()
         except FileNotFoundError:
             raise ConfigError(f"No patch file found at {rom_path!r}. Change ROM_PATH in the config") from None
 
+    @property
+    def patch_hash(self) -> Optional[str]:
+        """
+        sha256 of the patch the current data was extracted from
+        """
+        return self.dataset.patch_hash if self.dataset is not None else None
+
+    @property
+    def dataset_version(self) -> Optional[str]:
+        return self.dataset.version if self.dataset is not None else None
+
+    @property
+    def boneka_data(self) -> Optional[tuple[Boneka, ...]]:
+        return self.dataset.boneka_data if self.dataset is not None else None
+
+    @property
+    def wild_data(self) -> Optional[tuple[WildLocation, ...]]:
+        return self.dataset.wild_data if self.dataset is not None else None
+
+    @property
+    def stat_table(self) -> Optional['StatTable']:
+        return self.dataset.stat_table if self.dataset is not None else None
+
+    @property
+    def learners(self) -> Optional['LearnerIndex']:
+        return self.dataset.learners if self.dataset is not None else None
+
+    def get_dataset(self, version: Optional[str] = None, guild_id=None) -> Optional[Dataset]:
+        """
+        The data for a version. Without one, the guild's version or else the main one
+        """
+        if version is None:
+            version = self.config.bot_data.GUILD_VERSIONS.get(str(guild_id), self.config.bot_data.MAIN_VERSION)
+        if version == self.config.bot_data.MAIN_VERSION:
+            return self.dataset
+        return self.versions.get(version)
+
+    def other_datasets(self, version: str) -> list[Dataset]:
+        """
+        Every loaded version besides `version`. New data shares its records with these
+        """
+        datasets = [dataset for name, dataset in self.versions.items() if name != version]
+        if self.dataset is not None and version != self.config.bot_data.MAIN_VERSION:
+            datasets.append(self.dataset)
+        return datasets
+
+    @staticmethod
+    def version_snapshot_path(version: str) -> str:
+        root, ext = os.path.splitext(get_config().bot_data.SNAPSHOT_PATH)
+        return f'{root}.{version}{ext}'
+
     def write_boneka_data(self):
-        boneka_data_path = config.bot_data.BONEKA_DATA_PATH
+        boneka_data_path = self.config.bot_data.BONEKA_DATA_PATH
         logger.debug(f"Writing Boneka data to {boneka_data_path!r}.")
 
-        with open(boneka_data_path, 'w+') as f:
-            f.write(
-                Boneka.to_json_list(self.boneka_data, indent=4)
-            )
+        # indented by 2 so orjson can write it
+        Boneka.dump_to_file(self.boneka_data, boneka_data_path, indent=2)
+
+    def write_wild_data(self):
+        WildLocation.dump_to_file(self.wild_data, 'wild.json', indent=2)
+
+    def write_data(self):
+        self.write_wild_data()
+        self.write_boneka_data()
+        save_snapshot(self.dataset, self.config.bot_data.SNAPSHOT_PATH)
+
+    def load_snapshot(self) -> bool:
+        """
+        Loads the data saved by the last run. It could be stale, so it gets revalidated once the bot is ready.
+        This blocks, but it only happens before the bot connects
+        """
+        for version in self.config.bot_data.VERSION_PATCHES:
+            dataset = load_snapshot(self.version_snapshot_path(version), self.config)
+            if dataset is not None:
+                self.versions[version] = share_records(dataset, self.other_datasets(version))
+                logger.debug(f"Loaded dataset snapshot for version {version!r}")
+
+        dataset = load_snapshot(self.config.bot_data.SNAPSHOT_PATH, self.config)
+        if dataset is None:
+            return False
+        self.dataset = share_records(dataset, self.other_datasets(self.config.bot_data.MAIN_VERSION))
+        logger.debug(f"Loaded dataset snapshot. Dataset version: {self.dataset_version}")
+        return True
+
+    def attach_generation(self) -> bool:
+        """
+        Loads the generation that the shard supervisor published last, instead of extracting anything
+        """
+        from .shards import load_generation, read_current
+
+        name = read_current(Path(self.config.bot_data.GENERATIONS_DIR))
+        loaded = load_generation(name) if name is not None else None
+        if loaded is None:
+            logger.warning("No dataset generation has been published yet")
+            return False
+        conf, self.dataset, self.versions = loaded
+        apply_config(conf)
+        self.generation = name
+        logger.debug(f"Attached to dataset generation {name!r}. Dataset version: {self.dataset_version}")
+        return True
+
+    def publish(self):
+        """
+        Lets the other shards know about new data. Does nothing if the bot isn't sharded
+        """
+        if self.shard is not None:
+            from .shards import publish_generation
+
+            self.generation = publish_generation(self)
+
+    @staticmethod
+    def patch_rom(rom: bytes, patch: Union[bytes, memoryview], rom_hash: str, patch_hash: str) -> Rom:
+        """
+        Applies a patch to a rom, or loads the result from the patched rom cache if it was done before.
+        This blocks, so run it in an executor. The Rust side releases the GIL while patching.
+        """
+        cache_dir = Path(get_config().bot_data.PATCHED_ROM_CACHE_DIR)
+        cache_path = cache_dir / f'{rom_hash}_{patch_hash}.gba'
+        try:
+            patched_rom = Rom.from_file(cache_path)  # mapped, so nothing is copied
+        except FileNotFoundError:
+            pass
+        else:
+            logger.debug(f"Using cached patched rom {cache_path.name!r}")
+            os.utime(cache_path)  # eviction goes by mtime, so this counts as a use
+            return patched_rom
+
+        patched = memoryview(UpsPatch(patch).apply(rom))  # wraps the patch output without copying
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(patched)
+        os.replace(tmp_path, cache_path)  # so a crash never leaves a half written rom in the cache
+        # the rom is mapped from the cache too, so the patch output can be freed, and the sprite decoder's streams
+        # share the mapping instead of each copying the rom
+        patched.release()
+        patched_rom = Rom.from_file(cache_path)
+
+        # only keep the most recently used patched roms around
+        cached = sorted(cache_dir.glob('*.gba'), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in cached[get_config().bot_data.PATCHED_ROM_CACHE_SIZE:]:
+            try:
+                old.unlink(missing_ok=True)
+            except PermissionError:  # Windows won't delete a file that's mapped. It goes the next time
+                logger.debug(f"Couldn't evict patched rom {old.name!r}, it's still in use")
+
+        return patched_rom
+
+    def is_active_patch(self, patch_hash: str) -> bool:
+        return self.boneka_data is not None and patch_hash == self.patch_hash
+
+    async def update_patch(self, rom: bytes, patch: Union[bytes, memoryview], *, update_patch_file: bool = True,
+                           patch_hash: Optional[str] = None, rom_hash: Optional[str] = None,
+                           force: bool = False) -> bool:
+        """
+        Extracts all the data from the patched rom. Returns False without doing anything
+        if `patch` is the patch the current data came from, unless `force` is set.
+        """
+        if patch_hash is None:
+            patch_hash = hashlib.sha256(patch).hexdigest()
+        if not force and self.is_active_patch(patch_hash):
+            logger.debug("Patch is unchanged. Skipping update")
+            return False
 
-    async def update_patch(self, rom: bytes, patch: bytes, *, update_patch_file: bool = True):
         logger.debug("Updating patch data")
-        ups_patch = UpsPatch(patch)
+        loop = asyncio.get_running_loop()
+        if rom_hash is None:
+            rom_hash = await loop.run_in_executor(None, sha256_hex, rom)
+        patched_rom = await loop.run_in_executor(None, self.patch_rom, rom, patch, rom_hash, patch_hash)
 
-        patched_rom = Rom(ups_patch.apply(rom))
+        self.offset_discoveries = await self.discover_offsets(patched_rom)
+        moved = [d for d in self.offset_discoveries if d.moved]
+        build_config = self.config
+        if moved and self.config.bot_data.AUTO_APPLY_OFFSETS:
+            build_config = evolve(self.config, offsets=corrected_offsets(self.config.offsets, moved))
 
-        self.boneka_data = await get_all_boneka_data(patched_rom)
-        self.wild_data = await get_all_wild_data(patched_rom, self.boneka_data)
-        with open('wild.json', 'w+') as f:
-            f.write(WildLocation.to_json_list(self.wild_data, indent=4))
-        self.write_boneka_data()
+        try:
+            dataset = await build_dataset(patched_rom, build_config, rom_hash, patch_hash)
+        except Exception as e:
+            if moved and build_config is self.config:
+                raise OffsetsMovedError(f"Some tables moved, so the offsets need updating:\n"
+                                        f"{describe(self.offset_discoveries)}") from e
+            raise
+        if build_config is not self.config:
+            self.config.offsets = build_config.offsets
+            save_config(self.config)
+            logger.info(f"Applied the offsets of {len(moved)} moved tables")
+        self.dataset = share_records(dataset, self.other_datasets(self.config.bot_data.MAIN_VERSION))
+        self.write_data()
 
         if update_patch_file:
             logger.debug('Updating patch file')
-            with open(config.bot_data.PATCH_PATH, 'wb') as f:
+            with open(self.config.bot_data.PATCH_PATH, 'wb') as f:
                 f.write(patch)
-        logger.debug("Patch data update was successful!")
+        self.publish()
+        logger.debug(f"Patch data update was successful! Dataset version: {self.dataset_version}")
+        return True
+
+    async def discover_offsets(self, patched_rom: Rom) -> list[Discovery]:
+        """
+        Checks where the tables in the patched rom are, using the current data as the reference.
+        Finds nothing when there's no data yet to compare against
+        """
+        if self.dataset is None:
+            return []
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:  # a few hundred ms of cpu work when tables moved, so not on the event loop
+            discoveries = await loop.run_in_executor(None, discover_offsets_blocking, patched_rom, self.config,
+                                                     self.dataset)
+        except Exception:  # the update can still go through with the configured offsets
+            logger.exception("Could not check the offsets")
+            return []
+        logger.debug(f"Checked the offsets in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return discoveries
+
+    def offsets_report(self) -> str:
+        """
+        The tables the last update found moved or couldn't find, if any
+        """
+        return describe(self.offset_discoveries)
+
+    async def reload_config(self, new_config: Config):
+        """
+        Applies a new config. Only the extractors that the change affects are re-run, into a new snapshot.
+        If that fails, the snapshot is thrown away and the current config and data are left untouched.
+        """
+        new_config.bot_data.TOKEN = self.config.bot_data.TOKEN
+        new_dataset = None
+        rom = rom_hash = None
+        if self.dataset is not None and self.dataset.rom is None:
+            # loaded from disk, so there's nothing to only re-run some extractors on
+            rom, patch, rom_hash, patch_hash = await self.read_sources()
+            if self.dataset_version != dataset_version(rom_hash, patch_hash, new_config):
+                loop = asyncio.get_running_loop()
+                patched_rom = await loop.run_in_executor(None, self.patch_rom, rom, patch, rom_hash, patch_hash)
+                new_dataset = await build_dataset(patched_rom, new_config, rom_hash, patch_hash)
+        elif self.dataset is not None:  # otherwise, the data will be extracted with the new config when it loads
+            new_dataset = await rebuild_dataset(self.dataset, new_config)
+        new_versions = await self.build_versions(new_config, new_dataset or self.dataset, rom, rom_hash)
+
+        # everything was built, so the config and the data change together
+        apply_config(new_config)
+        if new_dataset is not None:
+            self.dataset = share_records(new_dataset, list(new_versions.values()))
+            self.write_data()
+        self.set_versions(new_versions)
+        self.publish()
+        logger.debug("Config reload was successful!")
+
+    async def read_sources(self) -> tuple[bytes, bytes, str, str]:
+        """
+        The rom and patch files and their hashes
+        """
+        loop = asyncio.get_running_loop()
+        rom, patch = await asyncio.gather(loop.run_in_executor(None, self.get_rom),
+                                          loop.run_in_executor(None, self.get_patch))
+        rom_hash, patch_hash = await asyncio.gather(loop.run_in_executor(None, sha256_hex, rom),
+                                                    loop.run_in_executor(None, sha256_hex, patch))
+        return rom, patch, rom_hash, patch_hash
+
+    async def load_data(self):
+        """
+        Makes sure the data matches the current rom, patch and config.
+        Everything is only extracted again if one of them changed since the data was extracted
+        """
+        rom, patch, rom_hash, patch_hash = await self.read_sources()
+        if self.dataset_version == dataset_version(rom_hash, patch_hash, self.config):
+            logger.debug("Dataset is up to date")
+        else:
+            await self.update_patch(rom, patch, update_patch_file=False, patch_hash=patch_hash, rom_hash=rom_hash,
+                                    force=True)
+        await self.load_versions(rom, rom_hash)
+
+    async def build_versions(self, conf: Config, main: Optional[Dataset], rom: Optional[bytes] = None,
+                             rom_hash: Optional[str] = None) -> dict[str, Dataset]:
+        """
+        The data of every version besides the main one for `conf`. Their data is extracted from the same rom with the
+        same config, but with their own patch. Versions that are already up to date are reused, and versions that
+        aren't in `conf` are left out. Nothing on the bot is changed
+        """
+        if not conf.bot_data.VERSION_PATCHES:
+            return {}
 
+        loop = asyncio.get_running_loop()
+        if rom is None:
+            rom = await loop.run_in_executor(None, self.get_rom)
+        if rom_hash is None:
+            rom_hash = await loop.run_in_executor(None, sha256_hex, rom)
+        versions = {}
+        for version, patch_path in conf.bot_data.VERSION_PATCHES.items():
+            patch = await loop.run_in_executor(None, self.get_patch, patch_path)
+            patch_hash = await loop.run_in_executor(None, sha256_hex, patch)
+            current = self.versions.get(version)
+            if current is not None and current.version == dataset_version(rom_hash, patch_hash, conf):
+                versions[version] = current
+                continue
+
+            logger.debug(f"Extracting data for version {version!r}")
+            patched_rom = await loop.run_in_executor(None, self.patch_rom, rom, patch, rom_hash, patch_hash)
+            # only the main version keeps its rom around for partial rebuilds
+            dataset = (await build_dataset(patched_rom, conf, rom_hash, patch_hash)).without_rom()
+            others = [*versions.values(), *(d for name, d in self.versions.items() if name not in versions)]
+            versions[version] = share_records(dataset, [*others, main] if main is not None else others)
+            logger.debug(f"Version {version!r} is up to date. Dataset version: {dataset.version}")
+        return versions
+
+    def set_versions(self, versions: dict[str, Dataset]):
+        """
+        Swaps in the data of the other versions, and saves the snapshots of the ones that changed
+        """
+        old, self.versions = self.versions, versions
+        for version, dataset in versions.items():
+            if old.get(version) is not dataset:
+                save_snapshot(dataset, self.version_snapshot_path(version))
+
+    async def load_versions(self, rom: Optional[bytes] = None, rom_hash: Optional[str] = None):
+        """
+        load_data for every version besides the main one. Versions that were removed from the config are dropped
+        """
+        self.set_versions(await self.build_versions(self.config, self.dataset, rom, rom_hash))
 
     async def on_ready(self):
         logger.info(f"Successfully logged on as {self.me.name}")
-        if self.boneka_data is None:
-            await self.update_patch(self.get_rom(), self.get_patch(), update_patch_file=False)
+        if self.shard is not None:
+            # the supervisor keeps the data up to date. Just keep up with what it publishes
+            if self._generation_task is None or self._generation_task.done():
+                from .shards import watch_generations
+
+                self._generation_task = asyncio.create_task(watch_generations(self))
+        elif self.dataset is None:
+            await self.load_data()
+        elif self._revalidate_task is None or self._revalidate_task.done():
+            # serve the saved snapshot while checking if it's still valid
+            self._revalidate_task = asyncio.create_task(self.load_data())
+            self._revalidate_task.add_done_callback(self._revalidated)
+
+    @staticmethod
+    def _revalidated(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Could not revalidate the dataset snapshot. Still serving the old data",
+                         exc_info=task.exception())
 
     async def wait_for(self, event: Optional[str] = None, *, check=None, timeout: int = 15):
         # overridden by the wait_for setup
         pass
 
+    async def get_http_session(self) -> aiohttp.ClientSession:
+        """
+        A pooled http session for everything that doesn't go through interactions, kept for the lifetime of the bot
+        """
+        if self._http_session is None or self._http_session.closed:
+            connector = aiohttp.TCPConnector(limit=self.config.bot_data.HTTP_POOL_SIZE, keepalive_timeout=60)
+            self._http_session = aiohttp.ClientSession(connector=connector)
+        return self._http_session
+
+    async def get_mega(self) -> 'AsyncMega':
+        """
+        A long-lived Mega client that shares the pooled http session and caches its login and folder listings
+        """
+        from ..util.async_mega import AsyncMega  # the mega/crypto stack is only needed for /update mega
+
+        session = await self.get_http_session()
+        if self._mega is None or self._mega.async_session is not session:
+            self._mega = AsyncMega(session=session)
+        await self._mega.ensure_logged_in()
+        return self._mega
+
+    async def sprite_url(self, boneka: Boneka, sprite: Optional[bytes] = None, variant: str = 'sprite',
+                         wait: Optional[float] = None) -> Optional[str]:
+        """
+        A link to the boneka's sprite, or to `sprite` if it's given (like the shiny one). `variant` goes in the
+        filename. None if there's no sprite, sprites aren't set up or the upload failed. An upload that takes longer
+        than `wait` seconds keeps going in the background, and None is returned for now
+        """
+        sprite = sprite if sprite is not None else boneka.sprite
+        if sprite is None or self.config.bot_data.SPRITE_CHANNEL is None:
+            return None
+        from ..rom_api.sprite_png import sprite_format
+        from ..util.sprite_cdn import SpriteCdn
+
+        if self._sprite_cdn is None or self._sprite_cdn.path != self.config.bot_data.SPRITE_URL_CACHE_PATH:
+            self._sprite_cdn = SpriteCdn(self.config.bot_data.SPRITE_URL_CACHE_PATH)
+        session = await self.get_http_session()
+        try:
+            filename = f'{boneka.name.lower()}_{variant}.{sprite_format(sprite)}'
+            # the upload itself is shielded, so timing out only stops waiting for it
+            return await asyncio.wait_for(self._sprite_cdn.url(session, sprite, filename), wait)
+        except asyncio.TimeoutError:
+            logger.debug(f"The sprite of {boneka.name!r} is still uploading. Answering without it")
+            return None
+        except Exception as e:  # the embed is still useful without it
+            logger.error(f"Could not upload the sprite of {boneka.name!r}", exc_info=e)
+            return None
+        from ..rom_api.sprite_png import sprite_format
+        from ..util.sprite_cdn import SpriteCdn
+
+        if self._sprite_cdn is None or self._sprite_cdn.path != self.config.bot_data.SPRITE_URL_CACHE_PATH:
+            self._sprite_cdn = SpriteCdn(self.config.bot_data.SPRITE_URL_CACHE_PATH)
+        session = await self.get_http_session()
+        try:
+            filename = f'{boneka.name.lower()}_{variant}.{sprite_format(sprite)}'
+            return await self._sprite_cdn.url(session, sprite, filename)
+        except Exception as e:  # the embed is still useful without it
+            logger.error(f"Could not upload the sprite of {boneka.name!r}", exc_info=e)
+            return None
+
     @property
     def http(self):
         return self._http
@@ -103,6 +531,10 @@ class AkyuuBot(interactions.Client):
         pass
 
 
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
 def akyuu_ext(cls) -> Type:
     logger.debug(f"Found extension {cls.__module__!r}")
     modname = cls.__module__
@@ -1,12 +1,20 @@
-from io import BytesIO
-from typing import Sequence
+from typing import Optional, Sequence, TYPE_CHECKING
 
-from interactions.api.models.message import Embed, EmbedImageStruct, EmbedAuthor, EmbedField, Attachment
+from interactions.api.models.message import Embed, EmbedImageStruct, EmbedAuthor, EmbedField, EmbedFooter
 
 from ..rom_api.stats import Boneka, BonekaDexData
 from ..config import config
 from ..rom_api.wild_data import WildLocation
 
+if TYPE_CHECKING:
+    from ..rom_api.stat_table import StatTable
+    from ..rom_api.type_chart import TeamCoverage, TypeChart
+
+
+def sprite_thumbnail(sprite_url: Optional[str]) -> Optional[dict]:
+    # as a dict, since Embed only turns the footer, author and fields into json itself
+    return EmbedImageStruct(url=sprite_url)._json if sprite_url is not None else None
+
 
 class BaseEmbed(Embed):
     _fields: list[EmbedField]
@@ -17,10 +25,10 @@ class BaseEmbed(Embed):
 
 class BonekaStatEmbed(BaseEmbed):
     """
-    Creates an embed that represents boneka data. When sending, remember to send the file too!
+    Creates an embed that represents boneka data. `sprite_url` is shown as the thumbnail
     """
 
-    def __init__(self, boneka: Boneka):
+    def __init__(self, boneka: Boneka, sprite_url: Optional[str] = None):
         self._fields = []
 
         author = EmbedAuthor(name="")
@@ -30,11 +38,6 @@ class BonekaStatEmbed(BaseEmbed):
         else:
             self.description = "OUT OF DEX"
 
-        sprite_file_name = f'{boneka.name.lower()}_sprite.png'
-
-        # self.file = Attachment(fp=BytesIO(boneka.sprite), filename=sprite_file_name)
-        # im = EmbedImageStruct(url=f"attachment:/{sprite_name}")
-
         # Type Field
 
         types = ' / '.join({boneka.stats.type_1, boneka.stats.type_2})
@@ -58,8 +61,7 @@ class BonekaStatEmbed(BaseEmbed):
         # Init super
 
         super().__init__(title=boneka.name, color=config.bot_data.BONEKA_EMBED_COLOR, author=author, fields=self._fields,
-                         description=self.description  # image=im
-                         )
+                         description=self.description, thumbnail=sprite_thumbnail(sprite_url))
 
     def add_stat(self, name, value: int):
         self.add_field(name=name, value=str(value), inline=True)
@@ -67,7 +69,7 @@ class BonekaStatEmbed(BaseEmbed):
 
 class BonekaLevelupMoveEmbed(BaseEmbed):
 
-    def __init__(self, boneka: Boneka):
+    def __init__(self, boneka: Boneka, sprite_url: Optional[str] = None):
         self._fields = []
         self.boneka = boneka
 
@@ -78,23 +80,25 @@ class BonekaLevelupMoveEmbed(BaseEmbed):
         else:
             self.description = "OUT OF DEX"
 
-        sprite_file_name = f'{boneka.name.lower()}_sprite.png'
-
-        # self.file = Attachment(fp=BytesIO(boneka.sprite), filename=sprite_file_name)
-        # im = EmbedImageStruct(url=f"attachment:/{sprite_name}")
-
         self.add_field("Levelup Moves", "\u200b", False)  # abuse zero-width space
         self.add_level_up_moves()
 
         super().__init__(title=boneka.name, color=config.bot_data.BONEKA_EMBED_COLOR, author=author, fields=self._fields,
-                         description=self.description  # image=im
-                         )
+                         description=self.description, thumbnail=sprite_thumbnail(sprite_url))
 
     def add_level_up_moves(self):
         for move in self.boneka.level_up_moves:
             self.add_field(move.move, str(move.level), True)
 
 
+class BonekaSpriteEmbed(BaseEmbed):
+    def __init__(self, boneka: Boneka, sprite_url: str, shiny: bool = False):
+        self._fields = []
+        title = f"{boneka.name} (Shiny)" if shiny else boneka.name
+        super().__init__(title=title, color=config.bot_data.BONEKA_EMBED_COLOR, fields=self._fields,
+                         image=sprite_thumbnail(sprite_url))
+
+
 class BonekaWildLocationsEmbed(BaseEmbed):
     def __init__(self, boneka: Boneka, grass: Sequence[WildLocation], surf: Sequence[WildLocation],
                  tree: Sequence[WildLocation], fish: Sequence[WildLocation]):
@@ -116,3 +120,95 @@ class BonekaWildLocationsEmbed(BaseEmbed):
 
 
 
+
+
+class BonekaQueryEmbed(BaseEmbed):
+    """
+    One page of rows from a stat query
+    """
+
+    def __init__(self, title: str, table: 'StatTable', rows: Sequence[int], first_rank: int, page: int, pages: int):
+        self._fields = []
+        lines = []
+        for rank, row in enumerate(rows, first_rank):
+            stats = table.row_stats(row)
+            types = ' / '.join(table.row_types(row))
+            lines.append(f"`{rank:>3}.` **{table.names[row]}** ({types}) "
+                         f"{stats['hp']}/{stats['attack']}/{stats['defense']}/"
+                         f"{stats['sp_atk']}/{stats['sp_def']}/{stats['speed']} = {stats['bst']}")
+        self.description = '\n'.join(lines) if lines else "Nothing matched"
+
+        super().__init__(title=title, description=self.description, color=config.bot_data.BONEKA_EMBED_COLOR,
+                         fields=self._fields, footer=EmbedFooter(text=f"Page {page}/{pages} "
+                                                                       f"• HP/Atk/Def/SpA/SpD/Spe = BST"))
+
+
+class DexSearchEmbed(BaseEmbed):
+    """
+    One page of boneka whose dex entries match a search
+    """
+
+    def __init__(self, query: str, results: Sequence[Boneka], total: int, first_rank: int, page: int, pages: int):
+        from ..rom_api.dex_search import highlight
+
+        self._fields = []
+        lines = []
+        for rank, boneka in enumerate(results, first_rank):
+            entry = boneka.dex_data.dex_entry.replace('\n', ' ')
+            entry = entry if len(entry) <= 150 else entry[:149] + '…'
+            lines.append(f"`{rank:>3}.` **{boneka.name}** ({boneka.dex_data.species}): {highlight(entry, query)}")
+        self.description = '\n'.join(lines) if lines else "Nothing matched"
+
+        super().__init__(title=f"{total} dex entries match {query!r}", description=self.description,
+                         color=config.bot_data.BONEKA_EMBED_COLOR, fields=self._fields,
+                         footer=EmbedFooter(text=f"Page {page}/{pages}"))
+
+
+class MoveLearnersEmbed(BaseEmbed):
+    """
+    One page of the boneka that learn a move by level up
+    """
+
+    def __init__(self, move: str, learners: Sequence[tuple[str, int]], total: int, page: int, pages: int):
+        self._fields = []
+        lines = [f"**{name}** at level {level}" for name, level in learners]
+        self.description = '\n'.join(lines) if lines else "No boneka learn this move by level up"
+
+        super().__init__(title=f"{total} ways to learn {move} by level up", description=self.description,
+                         color=config.bot_data.BONEKA_EMBED_COLOR, fields=self._fields,
+                         footer=EmbedFooter(text=f"Page {page}/{pages}"))
+
+
+class TypeWeaknessEmbed(BaseEmbed):
+    """
+    What each attacking type does to a boneka, grouped by multiplier. Neutral types are left out
+    """
+
+    def __init__(self, boneka: Boneka, groups: dict[float, list[str]]):
+        self._fields = []
+        for multiplier, types in groups.items():
+            self.add_field("Immune" if multiplier == 0 else f"x{multiplier:g}", ', '.join(types), False)
+        types = ' / '.join({boneka.stats.type_1: None, boneka.stats.type_2: None})
+        super().__init__(title=f"{boneka.name} ({types})", color=config.bot_data.BONEKA_EMBED_COLOR,
+                         fields=self._fields, description=None if groups else "Every type is neutral")
+
+
+class TeamCoverageEmbed(BaseEmbed):
+    """
+    The attacking types a team has trouble with, and the types it can't hit super effectively
+    """
+
+    def __init__(self, team: Sequence[str], chart: 'TypeChart', coverage: 'TeamCoverage'):
+        self._fields = []
+        shown = chart.shown_types.tolist()
+        weak_spots = sorted((i for i in shown if coverage.weak[i] > coverage.resist[i]),
+                            key=lambda i: coverage.resist[i] - coverage.weak[i])  # most net weaknesses first
+        lines = [f"**{chart.type_names[i]}**: {coverage.weak[i]} weak, {coverage.resist[i]} resist"
+                 + (f" ({coverage.immune[i]} immune)" if coverage.immune[i] else "") for i in weak_spots]
+        self.add_field("Weak spots", '\n'.join(lines) or "None!", False)
+
+        unhit = [chart.type_names[i] for i in shown if coverage.best_attack[i] <= 1]
+        self.add_field("Not hit super effectively by the team's types", ', '.join(unhit) or "None!", False)
+
+        super().__init__(title="Team coverage", description=', '.join(team),
+                         color=config.bot_data.BONEKA_EMBED_COLOR, fields=self._fields)
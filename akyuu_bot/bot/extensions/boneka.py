@@ -1,11 +1,15 @@
 import asyncio
+from typing import Optional
 
 import interactions
 from interactions import extension_command, Option, OptionType
 
-from .ext import BaseExtension
+from .ext import BaseExtension, page_count, too_few_pages, version_option
 from ..akyuu import SCOPE, akyuu_ext
-from ..embeds import BonekaStatEmbed, BonekaLevelupMoveEmbed, BonekaWildLocationsEmbed
+from ...config import config
+from ..embeds import BonekaStatEmbed, BonekaLevelupMoveEmbed, BonekaWildLocationsEmbed, BonekaSpriteEmbed, \
+    DexSearchEmbed
+from ...rom_api.dataset import Dataset
 from ...rom_api.stats import Boneka
 from ...rom_api.wild_data import WildLocation
 
@@ -38,17 +42,19 @@ class BonekaExt(BaseExtension):
 
     ]
 
-    def get_boneka_data(self, name: str) -> list[Boneka]:  # no cache because data could update while the bot is running
-        return [dat for dat in self.bot.boneka_data if dat.name.lower() == name.lower()]
+    @staticmethod
+    def get_boneka_data(dataset: Dataset, name: str) -> list[Boneka]:  # no cache because data could update
+        return [dat for dat in dataset.boneka_data if dat.name.lower() == name.lower()]
 
-    def get_wild_locations(self, name: str) -> tuple[list[WildLocation], list[WildLocation],
-                                                     list[WildLocation], list[WildLocation]]:
+    @staticmethod
+    def get_wild_locations(dataset: Dataset, name: str) -> tuple[list[WildLocation], list[WildLocation],
+                                                                 list[WildLocation], list[WildLocation]]:
         grass = []
         surf = []
         tree = []
         fish = []
         name = name.lower()
-        for loc in self.bot.wild_data:
+        for loc in dataset.wild_data:
             try:
                 if name in (i.boneka.lower() for i in loc.grass):
                     grass.append(loc)
@@ -79,21 +85,23 @@ class BonekaExt(BaseExtension):
                                description="The boneka to get stats for",
                                type=OptionType.STRING,
                                required=True,
-                           )
+                           ),
+                           version_option(),
                        ])
-    async def stats(self, ctx, boneka: str, *, ephemeral: bool = False):
-        boneka_dat = self.get_boneka_data(boneka)
+    async def stats(self, ctx, boneka: str, version: Optional[str] = None, *, ephemeral: bool = False):
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+        boneka_dat = self.get_boneka_data(dataset, boneka)
         if not boneka_dat:
             await ctx.send(f"{boneka.title()!r} does not exist!", ephemeral=ephemeral)
             return
 
         b, = boneka_dat
 
-        embed = BonekaStatEmbed(b)
-
-        # files not implemented yet
-        await ctx.send(embeds=[embed],  # , files=[embed.file]
-                       ephemeral=ephemeral)
+        # a thumbnail isn't worth missing the interaction deadline for
+        embed = BonekaStatEmbed(b, await self.bot.sprite_url(b, wait=config.bot_data.SPRITE_THUMBNAIL_WAIT))
+        await ctx.send(embeds=[embed], ephemeral=ephemeral)
 
     @extension_command(name="levelup", description="Get levelup moves for a boneka", scope=SCOPE,
                        options=[
@@ -102,19 +110,62 @@ class BonekaExt(BaseExtension):
                                description="The boneka to get stats for",
                                type=OptionType.STRING,
                                required=True,
-                           )
+                           ),
+                           version_option(),
                        ])
-    async def levelup(self, ctx, boneka: str, *, ephemeral: bool = False):
-        boneka_dat = self.get_boneka_data(boneka)
+    async def levelup(self, ctx, boneka: str, version: Optional[str] = None, *, ephemeral: bool = False):
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+        boneka_dat = self.get_boneka_data(dataset, boneka)
         if not boneka_dat:
             await ctx.send(f"{boneka.title()!r} does not exist!", ephemeral=True)
             return
 
         b, = boneka_dat
 
-        embed = BonekaLevelupMoveEmbed(b)
-        await ctx.send(embeds=[embed], ephemeral=ephemeral  # , files=[embed.file]
-                       )
+        # a thumbnail isn't worth missing the interaction deadline for
+        embed = BonekaLevelupMoveEmbed(b, await self.bot.sprite_url(b, wait=config.bot_data.SPRITE_THUMBNAIL_WAIT))
+        await ctx.send(embeds=[embed], ephemeral=ephemeral)
+
+    @extension_command(name="sprite", description="Show a boneka's sprite", scope=SCOPE,
+                       options=[
+                           Option(
+                               name="boneka",
+                               description="The boneka to show",
+                               type=OptionType.STRING,
+                               required=True,
+                           ),
+                           Option(
+                               name="shiny",
+                               description="Show it with its shiny palette",
+                               type=OptionType.BOOLEAN,
+                               required=False,
+                           ),
+                           version_option(),
+                       ])
+    async def sprite(self, ctx, boneka: str, shiny: bool = False, version: Optional[str] = None):
+        if config.bot_data.SPRITE_CHANNEL is None:  # interactions can't attach files to responses yet
+            await ctx.send("Sprites aren't set up on this bot", ephemeral=True)
+            return
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+        boneka_dat = self.get_boneka_data(dataset, boneka)
+        if not boneka_dat:
+            await ctx.send(f"{boneka.title()!r} does not exist!", ephemeral=True)
+            return
+
+        b, = boneka_dat
+        await ctx.defer()  # the first upload of a sprite can take longer than discord waits for an answer
+        i = dataset.boneka_data.index(b)
+        sprite = dataset.sprite_sheets.render(i, shiny, scale=dataset.config.SPRITE_SCALE,
+                                              fmt=dataset.config.SPRITE_FORMAT)
+        url = await self.bot.sprite_url(b, sprite, 'shiny' if shiny else 'sprite') if sprite is not None else None
+        if url is None:
+            await ctx.send(f"Could not get a sprite for {b.name}", ephemeral=True)
+            return
+        await ctx.send(embeds=[BonekaSpriteEmbed(b, url, shiny)])
 
     @extension_command(name="locate", description="Find AWR locations for a boneka", scope=SCOPE,
                        options=[
@@ -123,18 +174,60 @@ class BonekaExt(BaseExtension):
                                description="The boneka to get stats for",
                                type=OptionType.STRING,
                                required=True,
-                           )
+                           ),
+                           version_option(),
                        ])
-    async def locate(self, ctx, boneka: str, *, ephemeral: bool = False):
-        boneka_dat = self.get_boneka_data(boneka)
+    async def locate(self, ctx, boneka: str, version: Optional[str] = None, *, ephemeral: bool = False):
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+        boneka_dat = self.get_boneka_data(dataset, boneka)
         if not boneka_dat:
             await ctx.send(f"{boneka.title()!r} does not exist!", ephemeral=True)
             return
         b, = boneka_dat
-        boneka_locs = self.get_wild_locations(boneka)
+        boneka_locs = self.get_wild_locations(dataset, boneka)
         embed = BonekaWildLocationsEmbed(b, *boneka_locs)
         await ctx.send(embeds=[embed], ephemeral=ephemeral)
 
+    @extension_command(name="dexsearch", description="Search the dex entries", scope=SCOPE,
+                       options=[
+                           Option(
+                               name="query",
+                               description="Words to look for. Put phrases in \"quotes\" to only find those",
+                               type=OptionType.STRING,
+                               required=True,
+                           ),
+                           Option(
+                               name="page",
+                               description="Which page of results to show",
+                               type=OptionType.INTEGER,
+                               required=False,
+                               min_value=1,
+                           ),
+                           version_option(),
+                       ])
+    async def dexsearch(self, ctx, query: str, page: int = 1, version: Optional[str] = None):
+        from ...rom_api.dex_search import DexQueryError
+
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+        try:
+            results = dataset.dex_index.search(query)
+        except DexQueryError as e:
+            await ctx.send(str(e), ephemeral=True)
+            return
+
+        page_size = config.bot_data.QUERY_PAGE_SIZE
+        pages = page_count(len(results), page_size)
+        if page > pages:
+            await ctx.send(too_few_pages(pages), ephemeral=True)
+            return
+        shown = [dataset.boneka_data[doc] for doc, _ in results[(page - 1) * page_size:page * page_size]]
+        embed = DexSearchEmbed(query, shown, len(results), (page - 1) * page_size + 1, page, pages)
+        await ctx.send(embeds=[embed])
+
     @extension_command(
         type=interactions.ApplicationCommandType.MESSAGE,
         name="Get Boneka Data",
@@ -143,7 +236,10 @@ class BonekaExt(BaseExtension):
     async def get_info(self, ctx):
         words = ctx.target.content.lower().split()
 
-        boneka_in_message = [i for i in self.bot.boneka_data if i.name.lower() in words]
+        dataset = await self.get_dataset(ctx)
+        if dataset is None:
+            return
+        boneka_in_message = [i for i in dataset.boneka_data if i.name.lower() in words]
         if not boneka_in_message:
             await ctx.send("No boneka found", ephemeral=True)
             return
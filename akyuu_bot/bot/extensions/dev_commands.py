@@ -1,20 +1,28 @@
 import asyncio
+import hashlib
+import mmap
+import os
 import traceback
-from copy import copy
+from contextlib import contextmanager
 from functools import wraps
-from io import BytesIO
 from pathlib import Path
-from typing import Optional
-from zipfile import ZipFile, Path as ZipPath
+from tempfile import SpooledTemporaryFile
+from typing import Optional, BinaryIO, Iterator, TYPE_CHECKING
 
 import interactions
-from attrs import fields_dict
 from interactions import extension_command, Message, Attachment
 
 from .ext import BaseExtension
 from ..akyuu import akyuu_ext, SCOPE
-from ...config import config, logger, Config
-from ...util.async_mega import AsyncMega, AsyncBase
+from ...config import config, logger, Config, save_config
+from ...util.aio import unblock
+
+if TYPE_CHECKING:
+    from zipfile import ZipFile, ZipInfo
+
+
+class PatchTooLargeError(Exception):
+    pass
 
 
 def report_error(cmd):
@@ -42,6 +50,21 @@ def report_error(cmd):
     return wrapper
 
 
+@contextmanager
+def spooled_buffer(spool: SpooledTemporaryFile) -> Iterator[memoryview]:
+    """
+    The contents of a spooled file as a buffer, without reading them into bytes.
+    The file is rolled over to disk (if it isn't already) and mapped
+    """
+    spool.rollover()
+    spool.flush()
+    if os.fstat(spool.fileno()).st_size == 0:  # empty files can't be mapped
+        yield memoryview(b'')
+        return
+    with mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+        yield view
+
+
 def is_dev(ctx):
     return int(ctx.author.id) in config.bot_data.DEVELOPERS
 
@@ -105,13 +128,19 @@ class DevExt(BaseExtension):
     @report_error
     @dev_only_cmd
     async def update_patch(self, ctx: interactions.CommandContext, source: str):
-        patch: Optional[bytes] = None
-
         if source == 'discord':
-            patch = await self.get_patch_from_attachment(ctx)
-            rom = self.bot.get_rom()
-            await self.bot.update_patch(rom, patch, update_patch_file=True)
+            with SpooledTemporaryFile(max_size=config.bot_data.DOWNLOAD_SPOOL_SIZE) as spool:
+                patch_hash = await self.get_patch_from_attachment(ctx, spool)
+                if patch_hash is None:
+                    return
+                if self.bot.is_active_patch(patch_hash):
+                    await ctx.send("That patch is already in use. Nothing was updated.")
+                    return
+                rom = await asyncio.get_running_loop().run_in_executor(None, self.bot.get_rom)
+                with spooled_buffer(spool) as patch:
+                    await self.bot.update_patch(rom, patch, update_patch_file=True, patch_hash=patch_hash)
             await ctx.send("All data has been updated successfully!")
+            await self.send_offsets_report(ctx)
         elif source == 'mega':
             modal = interactions.Modal(
                 title="File",
@@ -131,52 +160,119 @@ class DevExt(BaseExtension):
             )
             await ctx.popup(modal)
 
-    @staticmethod
-    async def get_patch_from_zipped_file(patch_file: AsyncBase, patch_path: str):
-        logger.debug("Getting patch from file")
-        raw = await patch_file.read()
-
-        data = BytesIO(raw)
-
-        with ZipFile(data, 'r') as f:
-            path: Optional[ZipPath] = None
+    async def send_offsets_report(self, ctx):
+        """
+        Tells the developer about tables the update found somewhere other than where the config says
+        """
+        report = self.bot.offsets_report()
+        if not report:
+            return
+        if config.bot_data.AUTO_APPLY_OFFSETS:
+            footer = "The offsets of the moved tables were saved to the config."
+        else:
+            footer = "Nothing was changed. Check the data, then set these offsets with `/config set`."
+        await ctx.send(f"Some tables aren't where the config says:\n{report}\n{footer}")
 
-            if config.bot_data.IGNORE_PARENT_DIR_IN_ZIP_FILE:
-                parent_dir = f.infolist()[0].filename
-                parent_folder = ZipPath(f, parent_dir)
-                path = (parent_folder / patch_path)
-            else:
-                path = ZipPath(patch_path)
+    @staticmethod
+    def find_zip_member(zip_file: 'ZipFile', path: str) -> 'ZipInfo':
+        """
+        Finds a member of a zip file by its path. If IGNORE_PARENT_DIR_IN_ZIP_FILE is set,
+        the path may also leave out the top level directory of the archive, whatever it is called.
+        """
+        path = path.strip('/')
+        try:
+            return zip_file.getinfo(path)
+        except KeyError:
+            if not config.bot_data.IGNORE_PARENT_DIR_IN_ZIP_FILE:
+                raise FileNotFoundError(f"{path!r} is not in the zip file") from None
 
-            return path.read_bytes()
+        # index every file by its path without the top level directory
+        index = {info.filename.partition('/')[2]: info for info in zip_file.infolist() if not info.is_dir()}
+        try:
+            return index[path]
+        except KeyError:
+            raise FileNotFoundError(f"{path!r} is not in the zip file") from None
 
-    async def get_attachment_data(self, attachment: Attachment) -> bytes:
-        async with self.bot.http.req._session.get(attachment.url) as resp:  # access the bot's underlying http client
-            return await resp.read()
+    @staticmethod
+    @unblock
+    def get_patch_from_zipped_file(patch_file: BinaryIO, patch_path: str) -> bytes:
+        """
+        Reads the patch out of a zip file without loading the rest of the archive.
+        Only the patch member gets decompressed
+        """
+        from zipfile import ZipFile
 
-    async def get_patch_from_attachment(self, ctx):
+        logger.debug("Getting patch from file")
+        with ZipFile(patch_file, 'r') as f:
+            info = DevExt.find_zip_member(f, patch_path)
+            with f.open(info) as member:
+                return member.read()
+
+    async def get_attachment_data(self, attachment: Attachment, spool: BinaryIO) -> str:
+        """
+        Streams an attachment into `spool` while hashing it, and returns its sha256 hex digest.
+        Raises PatchTooLargeError if the attachment is bigger than MAX_PATCH_SIZE
+        """
+        max_size = config.bot_data.MAX_PATCH_SIZE
+        too_large = PatchTooLargeError(f"The patch is bigger than the limit of {max_size} bytes")
+        if attachment.size is not None and attachment.size > max_size:
+            raise too_large
+
+        session = await self.bot.get_http_session()
+        digest = hashlib.sha256()
+        size = 0
+        async with session.get(attachment.url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                size += len(chunk)
+                if size > max_size:
+                    raise too_large
+                digest.update(chunk)
+                spool.write(chunk)
+        return digest.hexdigest()
+
+    async def get_patch_from_attachment(self, ctx, spool: BinaryIO) -> Optional[str]:
+        """
+        Asks for the patch and downloads it into `spool`. Returns its hash, or None if there's nothing to update with
+        """
         await ctx.send("Send the patch file here.")
         try:
             msg: Message = await self.bot.wait_for("on_message_create",
                                                    check=original_sender_and_has_attachment(ctx), timeout=120)
-            attachment = msg.attachments[0]
-            return await self.get_attachment_data(attachment)
         except asyncio.TimeoutError:
-            return await ctx.send("Took too long.", ephemeral=True)
+            await ctx.send("Took too long.", ephemeral=True)
+            return None
+
+        attachment = msg.attachments[0]
+        try:
+            return await self.get_attachment_data(attachment, spool)
+        except PatchTooLargeError as e:
+            await ctx.send(str(e), ephemeral=True)
+            return None
 
     @interactions.extension_modal('mega_input')
     async def _mega_download(self, ctx, link: str, path_in_zip: str):
         await ctx.defer()
-        logger.debug(f"Getting patch from {link}")
-        async with AsyncMega() as mega:
-            await mega.async_login_anonymous()
-            patch_file = await mega.async_download_public_url(link)
-            await patch_file.seek(0)
+        from ...util.async_mega import IntegrityError
 
-        patch = await self.get_patch_from_zipped_file(patch_file, path_in_zip)
-        rom = self.bot.get_rom()
-        await self.bot.update_patch(rom, patch, update_patch_file=True)
-        await ctx.send("All data has been updated successfully!")
+        logger.debug(f"Getting patch from {link}")
+        mega = await self.bot.get_mega()
+        with SpooledTemporaryFile(max_size=config.bot_data.DOWNLOAD_SPOOL_SIZE) as spool:
+            try:
+                await mega.async_download_public_url(
+                    link, outfile=spool, connections=config.bot_data.MEGA_DOWNLOAD_CONNECTIONS)
+            except IntegrityError:
+                await ctx.send("The downloaded file is corrupted or incomplete. Nothing was updated.")
+                raise
+            spool.seek(0)
+            patch = await self.get_patch_from_zipped_file(spool, path_in_zip)
+
+        rom = await asyncio.get_running_loop().run_in_executor(None, self.bot.get_rom)
+        if await self.bot.update_patch(rom, patch, update_patch_file=True):
+            await ctx.send("All data has been updated successfully!")
+            await self.send_offsets_report(ctx)
+        else:
+            await ctx.send("That patch is already in use. Nothing was updated.")
 
     async def _config_set(self, ctx: interactions.CommandContext):
         modal = interactions.Modal(
@@ -233,25 +329,16 @@ class DevExt(BaseExtension):
     @report_error
     @dev_only_cmd
     async def config_resp(self, ctx, response: str):
-
-        old_config = copy(config)
         new_config = Config.from_json(response)
         try:
-            for attr in fields_dict(type(config)):
-                setattr(config, attr, getattr(new_config, attr))
-            config.bot_data.TOKEN = old_config.bot_data.TOKEN
-            await self.bot.update_patch(self.bot.get_rom(), self.bot.get_patch(), update_patch_file=False)
-            with open('akyuu.json', 'w+') as f:
-                f.write(config.to_json(indent=4))
-            await ctx.send(f"New config: ```json\n{response}```", ephemeral=True)
-
+            await self.bot.reload_config(new_config)
         except Exception as e:
-            for attr in fields_dict(type(config)):
-                setattr(config, attr, getattr(old_config, attr))
-            await self.bot.update_patch(self.bot.get_rom(), self.bot.get_patch(), update_patch_file=False)
-            await ctx.send("Could not apply new config... Undoing changes...", ephemeral=True)
+            await ctx.send("Could not apply new config... Nothing was changed.", ephemeral=True)
             raise e
 
+        save_config(config)
+        await ctx.send(f"New config: ```json\n{response}```", ephemeral=True)
+
 
 def setup(client):
     DevExt(client)
@@ -1,5 +1,10 @@
-from interactions import Extension
-from ..akyuu import AkyuuBot
+from typing import Optional
+
+import interactions
+from interactions import Extension, Option, OptionType
+
+from ..akyuu import AkyuuBot, VERSIONS
+from ...rom_api.dataset import Dataset
 
 
 class BaseExtension(Extension):
@@ -8,3 +13,30 @@ class BaseExtension(Extension):
     """
     def __init__(self, bot: AkyuuBot):
         self.bot = bot
+
+    async def get_dataset(self, ctx, version: Optional[str] = None) -> Optional[Dataset]:
+        """
+        The data a command should use. Tells the user if it isn't there yet
+        """
+        dataset = self.bot.get_dataset(version, ctx.guild_id)
+        if dataset is None:
+            await ctx.send("The boneka data is still loading. Try again in a bit!", ephemeral=True)
+        return dataset
+
+
+def version_option() -> Option:
+    return Option(
+        name="version",
+        description="Which version of the game to use. Defaults to the server's version",
+        type=OptionType.STRING,
+        required=False,
+        choices=[interactions.Choice(name=version, value=version) for version in VERSIONS],
+    )
+
+
+def page_count(rows: int, page_size: int) -> int:
+    return max(1, -(-rows // page_size))
+
+
+def too_few_pages(pages: int) -> str:
+    return f"There {'is only 1 page' if pages == 1 else f'are only {pages} pages'}!"
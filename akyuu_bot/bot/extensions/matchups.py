@@ -0,0 +1,83 @@
+import re
+from typing import Optional
+
+from interactions import extension_command, Option, OptionType
+
+from .ext import BaseExtension, version_option
+from ..akyuu import SCOPE, akyuu_ext
+from ..embeds import TeamCoverageEmbed, TypeWeaknessEmbed
+
+MAX_TEAM_SIZE = 6
+MAX_EMBEDS = 10  # in one message
+
+
+@akyuu_ext
+class MatchupExt(BaseExtension):
+    """
+    Type matchups. These run on the dataset's type chart
+    """
+
+    @extension_command(name="weaknesses", description="Get a boneka's type weaknesses and resistances", scope=SCOPE,
+                       options=[
+                           Option(
+                               name="boneka",
+                               description="The boneka to get weaknesses for",
+                               type=OptionType.STRING,
+                               required=True,
+                           ),
+                           version_option(),
+                       ])
+    async def weaknesses(self, ctx, boneka: str, version: Optional[str] = None):
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+        rows = [i for i, b in enumerate(dataset.boneka_data) if b.name.lower() == boneka.lower()]
+        if not rows:
+            await ctx.send(f"{boneka.title()!r} does not exist!", ephemeral=True)
+            return
+
+        # names aren't unique, and boneka that share one can have different types. Each set of types is shown once
+        by_types: dict[tuple[str, str], int] = {}
+        for row in rows:
+            stats = dataset.boneka_data[row].stats
+            by_types.setdefault((stats.type_1, stats.type_2), row)
+        embeds = [TypeWeaknessEmbed(dataset.boneka_data[row], dataset.type_chart.weaknesses(row))
+                  for row in list(by_types.values())[:MAX_EMBEDS]]
+        await ctx.send(embeds=embeds)
+
+    @extension_command(name="coverage", description="Find the types a team is weak to and can't hit hard",
+                       scope=SCOPE,
+                       options=[
+                           Option(
+                               name="team",
+                               description=f"Up to {MAX_TEAM_SIZE} boneka, separated by commas",
+                               type=OptionType.STRING,
+                               required=True,
+                           ),
+                           version_option(),
+                       ])
+    async def coverage(self, ctx, team: str, version: Optional[str] = None):
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+
+        names = [name for name in re.split(r'\s*,\s*' if ',' in team else r'\s+', team.strip()) if name]
+        if not 0 < len(names) <= MAX_TEAM_SIZE:
+            await ctx.send(f"A team has 1 to {MAX_TEAM_SIZE} boneka!", ephemeral=True)
+            return
+        rows_by_name: dict[str, int] = {}
+        for i, b in enumerate(dataset.boneka_data):
+            rows_by_name.setdefault(b.name.lower(), i)
+        if missing := [name for name in names if name.lower() not in rows_by_name]:
+            await ctx.send(f"{', '.join(repr(name.title()) for name in missing)} "
+                           f"{'does' if len(missing) == 1 else 'do'} not exist!", ephemeral=True)
+            return
+
+        rows = [rows_by_name[name.lower()] for name in names]
+        chart = dataset.type_chart
+        embed = TeamCoverageEmbed([dataset.boneka_data[row].name for row in rows], chart, chart.coverage(rows))
+        await ctx.send(embeds=[embed])
+
+
+def setup(client):
+    MatchupExt(client)
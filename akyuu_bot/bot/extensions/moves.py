@@ -0,0 +1,66 @@
+from typing import Optional
+
+import interactions
+from interactions import extension_command, extension_autocomplete, Option, OptionType
+
+from .ext import BaseExtension, page_count, too_few_pages, version_option
+from ..akyuu import SCOPE, akyuu_ext
+from ..embeds import MoveLearnersEmbed
+from ...config import config
+
+
+@akyuu_ext
+class MoveExt(BaseExtension):
+
+    @extension_command(name="learners", description="Find every boneka that learns a move by level up", scope=SCOPE,
+                       options=[
+                           Option(
+                               name="move",
+                               description="The move to look up",
+                               type=OptionType.STRING,
+                               required=True,
+                               autocomplete=True,
+                           ),
+                           Option(
+                               name="page",
+                               description="Which page of results to show",
+                               type=OptionType.INTEGER,
+                               required=False,
+                               min_value=1,
+                           ),
+                           version_option(),
+                       ])
+    async def learners(self, ctx, move: str, page: int = 1, version: Optional[str] = None):
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+        index = dataset.learners
+        if move.lower() not in index.move_ids:
+            await ctx.send(f"{move.title()!r} does not exist!", ephemeral=True)
+            return
+
+        learners = index.learners_by_name(move)
+        page_size = config.bot_data.QUERY_PAGE_SIZE
+        pages = page_count(len(learners), page_size)
+        if page > pages:
+            await ctx.send(too_few_pages(pages), ephemeral=True)
+            return
+
+        names = dataset.boneka_data
+        shown = [(names[species].name, level) for species, level in
+                 learners[(page - 1) * page_size:page * page_size]]
+        move_name = index.move_names[index.move_ids[move.lower()][0]]
+        await ctx.send(embeds=[MoveLearnersEmbed(move_name, shown, len(learners), page, pages)])
+
+    @extension_autocomplete(command="learners", name="move")
+    async def move_autocomplete(self, ctx, user_input: str = ""):
+        # the version picked so far isn't known here, so complete from the server's version
+        dataset = self.bot.get_dataset(guild_id=ctx.guild_id)
+        if dataset is None:
+            await ctx.populate([])
+            return
+        await ctx.populate([interactions.Choice(name=name, value=name) for name in dataset.learners.search(user_input)])
+
+
+def setup(client):
+    MoveExt(client)
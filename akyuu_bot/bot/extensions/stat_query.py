@@ -0,0 +1,116 @@
+from typing import Optional
+
+import interactions
+from interactions import extension_command, Option, OptionType
+
+from .ext import BaseExtension, page_count, too_few_pages, version_option
+from ..akyuu import SCOPE, akyuu_ext
+from ..embeds import BonekaQueryEmbed
+from ...config import config
+
+_STAT_CHOICES = [
+    interactions.Choice(name=name, value=value) for name, value in (
+        ("BST", "bst"), ("HP", "hp"), ("Attack", "attack"), ("Defense", "defense"),
+        ("Sp. Atk", "sp_atk"), ("Sp. Def", "sp_def"), ("Speed", "speed"),
+    )
+]
+
+
+@akyuu_ext
+class StatQueryExt(BaseExtension):
+    """
+    Queries over the stats of every boneka at once. These run on the columnar stat table
+    """
+
+    @extension_command(name="filter", description="Find every boneka matching some conditions", scope=SCOPE,
+                       options=[
+                           Option(
+                               name="query",
+                               description="Conditions like: speed>100 type=Fire ability=\"Flash Fire\"",
+                               type=OptionType.STRING,
+                               required=True,
+                           ),
+                           Option(
+                               name="page",
+                               description="Which page of results to show",
+                               type=OptionType.INTEGER,
+                               required=False,
+                               min_value=1,
+                           ),
+                           version_option(),
+                       ])
+    async def filter(self, ctx, query: str, page: int = 1, version: Optional[str] = None):
+        from ...rom_api.stat_table import QueryError
+
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+        table = dataset.stat_table
+
+        page_size = config.bot_data.QUERY_PAGE_SIZE
+        try:
+            rows, total = table.filter(query, (page - 1) * page_size, page_size)
+        except QueryError as e:
+            await ctx.send(str(e), ephemeral=True)
+            return
+
+        pages = page_count(total, page_size)
+        if page > pages:
+            await ctx.send(too_few_pages(pages), ephemeral=True)
+            return
+        embed = BonekaQueryEmbed(f"{total} boneka match {query!r}", table, rows, (page - 1) * page_size + 1,
+                                 page, pages)
+        await ctx.send(embeds=[embed])
+
+    @extension_command(name="top", description="Get the boneka with the highest of a stat", scope=SCOPE,
+                       options=[
+                           Option(
+                               name="stat",
+                               description="The stat to rank by",
+                               type=OptionType.STRING,
+                               required=True,
+                               choices=_STAT_CHOICES,
+                           ),
+                           Option(
+                               name="count",
+                               description="How many boneka to rank",
+                               type=OptionType.INTEGER,
+                               required=False,
+                               min_value=1,
+                           ),
+                           Option(
+                               name="page",
+                               description="Which page of results to show",
+                               type=OptionType.INTEGER,
+                               required=False,
+                               min_value=1,
+                           ),
+                           version_option(),
+                       ])
+    async def top(self, ctx, stat: str, count: int = 10, page: int = 1, version: Optional[str] = None):
+        from ...rom_api.stat_table import QueryError
+
+        dataset = await self.get_dataset(ctx, version)
+        if dataset is None:
+            return
+        table = dataset.stat_table
+
+        count = min(count, len(table))
+        page_size = config.bot_data.QUERY_PAGE_SIZE
+        pages = page_count(count, page_size)
+        if page > pages:
+            await ctx.send(too_few_pages(pages), ephemeral=True)
+            return
+        start = (page - 1) * page_size
+        try:
+            rows = table.top(stat, start, min(page_size, count - start))
+        except QueryError as e:
+            await ctx.send(str(e), ephemeral=True)
+            return
+
+        embed = BonekaQueryEmbed(f"Top {count} boneka by {stat}", table, rows, start + 1, page, pages)
+        await ctx.send(embeds=[embed])
+
+
+def setup(client):
+    StatQueryExt(client)
@@ -0,0 +1,185 @@
+"""
+Running the bot as several gateway shards, each in its own process.
+
+The supervisor extracts the data once and publishes it as a generation: a directory with a mapped snapshot
+(see rom_api/mapped_snapshot.py) for every version.
+The CURRENT file names the newest generation. It's only ever replaced as a whole, so a shard sees either the old
+generation or the new one. Shards load the current generation when they start, and check for newer ones while
+they run. A shard that updates the data itself (like with /update) publishes a new generation for the others.
+The config goes with the data, so a change from /config reaches the other shards the same way.
+
+Memory: shards map the snapshots read only, so the sprites, palettes, learnsets and dex index are the same pages of
+the OS file cache in every shard. Only the strings and the small records (boneka, stats, wild locations) are built in
+each process, from the columns instead of from JSON. A shard keeps an old generation's pages mapped until nothing
+views into them anymore, so removing a generation that a shard still has only unlinks its files.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional, TYPE_CHECKING
+
+from attr import evolve
+
+from ..config import Config, apply_config, config, get_config, logger
+from ..rom_api.dataset import Dataset, share_records
+from ..rom_api.mapped_snapshot import attach_mapped, save_mapped, MAPPED_FORMAT
+
+if TYPE_CHECKING:
+    from .akyuu import AkyuuBot
+
+CURRENT = 'CURRENT'
+CONFIG = 'config.json'  # in every generation
+GENERATIONS_KEPT = 3  # old generations stay around for a bit, since a shard could still be loading one
+
+
+def published_config() -> str:
+    """
+    The config as a generation has it. The token is left out, every shard has its own copy of it
+    """
+    return evolve(config, bot_data=evolve(config.bot_data, TOKEN='')).to_json()
+
+
+def generation_name(datasets: dict[str, Dataset], conf_json: str) -> str:
+    """
+    Generations are named after what's in them, so publishing the same data and config twice is a no-op.
+    The file format is part of it, so a newer bot doesn't reuse a generation it can't read
+    """
+    versions = '\n'.join(f'{name}:{dataset.version}' for name, dataset in sorted(datasets.items()))
+    versions = f'{MAPPED_FORMAT}\n{versions}\n{conf_json}'
+    return hashlib.sha256(versions.encode()).hexdigest()[:16]
+
+
+def read_current(root: Path) -> Optional[str]:
+    try:
+        return (root / CURRENT).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_generation(bot: 'AkyuuBot') -> str:
+    """
+    Saves the data of every version and the config as a new generation and makes it the current one
+    """
+    datasets = {config.bot_data.MAIN_VERSION: bot.dataset, **bot.versions}
+    conf_json = published_config()
+    root = Path(config.bot_data.GENERATIONS_DIR)
+    name = generation_name(datasets, conf_json)
+    generation = root / name
+    if not generation.exists():
+        tmp = root / f'{name}.{os.getpid()}.tmp'
+        tmp.mkdir(parents=True, exist_ok=True)
+        for version, dataset in datasets.items():
+            save_mapped(dataset, str(tmp / f'{version}.map'))
+        (tmp / CONFIG).write_text(conf_json)
+        try:
+            os.replace(tmp, generation)
+        except OSError:  # another process published the same data first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    tmp_current = root / f'{CURRENT}.{os.getpid()}.tmp'
+    tmp_current.write_text(name)
+    os.replace(tmp_current, root / CURRENT)
+    logger.debug(f"Published dataset generation {name!r}")
+
+    old = sorted((p for p in root.iterdir() if p.is_dir() and p.suffix != '.tmp' and p.name != name),
+                 key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in old[GENERATIONS_KEPT - 1:]:
+        shutil.rmtree(path, ignore_errors=True)
+    return name
+
+
+def load_generation(name: str) -> Optional[tuple[Config, Optional[Dataset], dict[str, Dataset]]]:
+    """
+    The config, the main dataset and the other versions in a generation. None if it's gone
+    """
+    generation = Path(config.bot_data.GENERATIONS_DIR) / name
+    try:
+        conf = Config.from_json((generation / CONFIG).read_text())
+    except FileNotFoundError:
+        return None
+    conf.bot_data.TOKEN = config.bot_data.TOKEN
+    main = attach_mapped(str(generation / f'{conf.bot_data.MAIN_VERSION}.map'), conf)
+    loaded = [main] if main is not None else []
+    versions: dict[str, Dataset] = {}
+    for version in conf.bot_data.VERSION_PATCHES:
+        dataset = attach_mapped(str(generation / f'{version}.map'), conf)
+        if dataset is not None:
+            versions[version] = share_records(dataset, loaded)
+            loaded.append(versions[version])
+    return conf, main, versions
+
+
+async def watch_generations(bot: 'AkyuuBot'):
+    """
+    Switches the bot over to every generation that gets published
+    """
+    loop = asyncio.get_running_loop()
+    root = Path(config.bot_data.GENERATIONS_DIR)
+    while True:
+        await asyncio.sleep(config.bot_data.GENERATION_POLL_INTERVAL)
+        try:
+            name = await loop.run_in_executor(None, read_current, root)
+            if name is None or name == bot.generation:
+                continue
+            loaded = await loop.run_in_executor(None, load_generation, name)
+        except Exception as e:  # keep watching. The next generation might work
+            logger.error("Could not load the published dataset generation", exc_info=e)
+            continue
+        if loaded is None:  # replaced while we were looking. Get it next time
+            continue
+        conf, bot.dataset, bot.versions = loaded
+        apply_config(conf)
+        bot.generation = name
+        logger.info(f"Switched to dataset generation {name!r}. Dataset version: {bot.dataset_version}")
+
+
+def run_shard(shard_id: int, shard_count: int):
+    get_config()
+    from .akyuu import AkyuuBot
+    from .extensions import sanity, boneka, stat_query, moves, matchups, dev_commands, help
+
+    logger.info(f"Starting shard {shard_id + 1}/{shard_count}")
+    bot = AkyuuBot(shard=(shard_id, shard_count))
+    bot.start()
+
+
+def run_supervisor(shard_count: int):
+    """
+    Extracts the data, publishes it and keeps a process running for every shard
+    """
+    from .akyuu import AkyuuBot
+
+    bot = AkyuuBot.__new__(AkyuuBot)  # only the data side. The shards are the ones connecting to Discord
+    bot.init_state()
+    bot.load_snapshot()
+    asyncio.run(bot.load_data())
+    publish_generation(bot)
+
+    context = multiprocessing.get_context('spawn')  # no event loops or sockets inherited from here
+    processes: dict[int, multiprocessing.Process] = {}
+
+    def start(shard_id: int):
+        process = context.Process(target=run_shard, args=(shard_id, shard_count), name=f'akyuu-shard-{shard_id}')
+        process.start()
+        processes[shard_id] = process
+
+    for i in range(shard_count):
+        start(i)
+    try:
+        while True:
+            time.sleep(config.bot_data.GENERATION_POLL_INTERVAL)
+            for shard_id, process in list(processes.items()):
+                if not process.is_alive():
+                    logger.error(f"Shard {shard_id} exited with code {process.exitcode}. Restarting it")
+                    start(shard_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
@@ -1,16 +1,25 @@
 import logging
+import sys
+from base64 import b64decode, b64encode
 from functools import lru_cache
-from functools import wraps
-from typing import ClassVar, Iterable, Type, TypeVar
+from typing import Any, ClassVar, Iterable, Iterator, Optional, Type, TypeVar
 
-from attr import define
+from attr import Attribute, define, fields_dict
+from cattr.gen import make_dict_structure_fn, make_dict_unstructure_fn
 
 try:  # allow optional ujson dependency for faster json (not like it's needed)
+    import ujson as json_lib
     from cattr.preconf.ujson import make_converter, UjsonConverter as JsonConverter
 
 except ImportError:
+    import json as json_lib
     from cattr.preconf.json import make_converter, JsonConverter
 
+try:  # orjson is a lot faster than both, but it can only indent by 2
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 stream_handler = logging.StreamHandler()
@@ -23,53 +32,103 @@ logger.setLevel(logging.DEBUG)
 T = TypeVar('T', bound=Iterable['Jsonable'])
 
 
+def dumps(obj: Any, **kwargs) -> str:
+    """
+    Dumps already unstructured data. Uses orjson when it's installed and the options allow it
+    """
+    if orjson is not None and kwargs.keys() <= {'indent'} and kwargs.get('indent') in (None, 2):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if kwargs.get('indent') else 0).decode()
+    return json_lib.dumps(obj, **kwargs)
+
+
+def loads(json_str: str, **kwargs) -> Any:
+    if orjson is not None and not kwargs:
+        return orjson.loads(json_str)
+    return json_lib.loads(json_str, **kwargs)
+
+
 class Jsonable:
+    __slots__ = ()  # so slotted subclasses don't get a __dict__ from here
     converter: ClassVar[JsonConverter] = make_converter()
+    # the preconf converters use base85, which is done in Python and is most of the time spent on the sprites
+    converter.register_unstructure_hook(bytes, lambda v: b64encode(v).decode())
+    converter.register_structure_hook(bytes, lambda v, _: b64decode(v, validate=True))
+    # sprites and palettes of a mapped snapshot are views into the file. Optional[bytes] picks the hook by value
+    converter.register_unstructure_hook(memoryview, lambda v: b64encode(v).decode())
 
     def to_json(self, **kwargs) -> str:
-        return self.converter.dumps(self, **kwargs)
+        return dumps(self.converter.unstructure(self), **kwargs)
 
     @classmethod
     def to_json_list(cls, obj: Iterable['Jsonable'], **kwargs) -> str:
-        return cls.converter.dumps(obj, **kwargs)
+        return dumps(cls.converter.unstructure(obj), **kwargs)
+
+    @classmethod
+    def iter_json(cls, objs: Iterable['Jsonable'], **kwargs) -> Iterator[str]:
+        """
+        A json array of `objs`, produced one record at a time instead of as one big string
+        """
+        unstructure = cls.converter.unstructure
+        yield '['
+        for i, obj in enumerate(objs):
+            yield (',\n' if i else '\n') + dumps(unstructure(obj), **kwargs)
+        yield '\n]\n'
+
+    @classmethod
+    def dump_to_file(cls, objs: Iterable['Jsonable'], path: str, **kwargs):
+        with open(path, 'w') as f:
+            f.writelines(cls.iter_json(objs, **kwargs))
 
     @classmethod
     def from_json(cls, json_str: str, **kwargs) -> 'Jsonable':
-        return cls.converter.loads(json_str, cls, **kwargs)
+        return cls.converter.structure(loads(json_str, **kwargs), cls)
 
     @classmethod
     def from_json_list(cls, json_str: str, tp: Type[T], **kwargs) -> T:
-        return cls.converter.loads(json_str, tp, **kwargs)
-
+        return cls.converter.structure(loads(json_str, **kwargs), tp)
 
-def class_wraps(cls, wrapped):
-    cls.__name__ = wrapped.__name__
-    cls.__qualname__ = wrapped.__qualname__
-    cls.__doc__ = wrapped.__doc__
-    cls.__annotations__ = wrapped.__annotations__
 
-    return cls
+def _intern_optional(value: Optional[str]) -> Optional[str]:
+    return value if value is None else sys.intern(value)
 
 
-def data_json(cls=None, **kwargs):
+def intern_strings(cls, fields: list[Attribute]) -> list[Attribute]:
     """
-    Converts a class to an attrs dataclass, but with an api specialized for json serialization and deserialization
+    attrs field transformer that interns str fields on construction,
+    so the same name showing up in many places is only stored once
     """
+    interned = []
+    for field in fields:
+        if field.converter is None and field.type is str:
+            field = field.evolve(converter=sys.intern)
+        elif field.converter is None and field.type == Optional[str]:
+            field = field.evolve(converter=_intern_optional)
+        interned.append(field)
+    return interned
 
-    if cls is None:
-        @wraps(data_json)
-        def wrapper(cls_):
-            class H2(define(**kwargs)(cls_), Jsonable):
-                pass
 
-            return class_wraps(H2, cls_)
-
-        return wrapper
+def data_json(cls=None, *, frozen: bool = False, **kwargs):
+    """
+    Converts a class to a slotted attrs class, but with an api specialized for json serialization and deserialization.
+    String fields are interned
+    """
 
-    class H(define(cls), Jsonable):
-        pass
+    def wrap(cls_):
+        # Jsonable has to be a base before attrs makes the slotted class, otherwise it comes with a __dict__
+        body = {k: v for k, v in cls_.__dict__.items() if k not in ('__dict__', '__weakref__')}
+        body['__qualname__'] = cls_.__qualname__
+        bases = tuple(base for base in cls_.__bases__ if base is not object) + (Jsonable,)
+        new_cls = define(type(cls_)(cls_.__name__, bases, body), frozen=frozen, field_transformer=intern_strings,
+                         **kwargs)
+        # generate the (un)structuring code for this class now, instead of on the first (de)serialization
+        converter = Jsonable.converter
+        converter.register_unstructure_hook(new_cls, make_dict_unstructure_fn(new_cls, converter))
+        converter.register_structure_hook(new_cls, make_dict_structure_fn(new_cls, converter))
+        return new_cls
 
-    return class_wraps(H, cls)
+    if cls is None:
+        return wrap
+    return wrap(cls)
 
 
 class ConfigError(Exception):
@@ -80,6 +139,7 @@ class ConfigError(Exception):
 class Offsets:
     SPRITE_OFFSET: int = 0x082350AC
     PALETTE_OFFSET: int = 0x0823730C
+    SHINY_PALETTE_OFFSET: int = 0x082380CC
     BONEKA_STAT_OFFSET: int = 0x08254784
     BONEKA_NAME_OFFSET: int = 0x08245EE0
     MOVE_NAME_OFFSET: int = 0x08247094
@@ -88,6 +148,7 @@ class Offsets:
     # Contains the raw dex data with species names and entries
     ABILITY_NAME_OFFSET: int = 0x08879280
     TYPE_NAMES_OFFSET: int = 0x0824F1A0
+    TYPE_EFFECTIVENESS_OFFSET: int = 0x0824F050
     DEX_NUMBERS_OFFSET: int = 0x08251FEE  # The national dex ordering. HMA: data.pokedex.national
 
     MAP_BANKS_OFFSET: int = 0x087F1E8C
@@ -102,10 +163,30 @@ class BotData:
     ROM_PATH: str = 'firered.gba'
     BONEKA_DATA_PATH: str = 'boneka_data.json'
     PATCH_PATH: str = 'patch.ups'
+    SNAPSHOT_PATH: str = 'dataset_snapshot.json'  # the last extracted data, served on startup until it's revalidated
+    PATCHED_ROM_CACHE_DIR: str = 'patched_rom_cache'  # patched roms keyed by (rom hash, patch hash)
+    PATCHED_ROM_CACHE_SIZE: int = 3
+    MAIN_VERSION: str = 'stable'  # what the data from PATCH_PATH is called when picking a version
+    VERSION_PATCHES: dict[str, str] = {}  # more versions served next to the main one. name -> patch path
+    GUILD_VERSIONS: dict[str, str] = {}  # guild id -> the version its commands use when none is picked
+    SHARD_COUNT: int = 1  # gateway shards. More than 1 runs a supervisor that starts a process for each
+    GENERATIONS_DIR: str = 'dataset_generations'  # where the data is published for the shards
+    GENERATION_POLL_INTERVAL: float = 5.0  # seconds between shards checking for a newer generation
+    AUTO_APPLY_OFFSETS: bool = False  # /update saves the offsets of tables it found moved instead of only proposing them
 
     IGNORE_PARENT_DIR_IN_ZIP_FILE: bool = True
+    MAX_PATCH_SIZE: int = 32 * 1024 * 1024  # patches uploaded through Discord can't be bigger than this
+    DOWNLOAD_SPOOL_SIZE: int = 8 * 1024 * 1024  # downloads bigger than this are spooled to a temp file on disk
+    MEGA_DOWNLOAD_CONNECTIONS: int = 4  # concurrent range requests per Mega download
+    HTTP_POOL_SIZE: int = 16  # max connections in the bot's pooled (non-Discord) http session
+    SPRITE_CHANNEL: Optional[int] = None  # sprites get uploaded here once, so embeds can link them. None disables
+    SPRITE_URL_CACHE_PATH: str = 'sprite_urls.json'  # the urls of the uploaded sprites
+    SPRITE_URL_MIN_TTL: int = 60 * 60  # sprites are uploaded again if their url expires sooner than this (seconds)
+    SPRITE_THUMBNAIL_WAIT: float = 2.0  # seconds /stats and /levelup wait for an upload before answering without it
+    DISCORD_API_BASE: str = 'https://discord.com/api/v10'  # for uploading sprites
     
     BONEKA_EMBED_COLOR: int = 0xB4528D
+    QUERY_PAGE_SIZE: int = 15  # rows per page of /filter and /top
     DEV_SERVERS: list[int] = [855529286953467945]
     DEVELOPERS: list[int] = [692981485975633950, 218853068790300674]
     DEV_MODE: bool = True
@@ -135,6 +216,9 @@ class Config:
     NUM_TREE_ENCOUNTER_SLOTS: int = 5
     NUM_FISH_ENCOUNTER_SLOTS: int = 10
 
+    SPRITE_SCALE: int = 1  # sprites are 64x64. Bigger ones are scaled up with nearest neighbour
+    SPRITE_FORMAT: str = 'png'  # png or webp. See benchmarks/sprite_encoding.py
+
 
 @lru_cache
 def get_config():
@@ -153,4 +237,27 @@ def get_config():
                           "Modify the config and start the bot again") from None
 
 
-config: Config = get_config()  # temporarily until actual config system is implemented
+def save_config(conf: Config):
+    with open('akyuu.json', 'w+') as f:
+        f.write(conf.to_json(indent=4))
+
+
+def apply_config(conf: Config):
+    """
+    Makes `conf` the config. It's copied into the current one, so everything holding onto that sees the change.
+    The token is kept
+    """
+    current = get_config()
+    conf.bot_data.TOKEN = current.bot_data.TOKEN
+    for attr in fields_dict(type(current)):
+        setattr(current, attr, getattr(conf, attr))
+
+
+config: Config  # temporarily until actual config system is implemented
+
+
+def __getattr__(name):
+    # the config is loaded on first use instead of as a side effect of importing this module
+    if name == 'config':
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
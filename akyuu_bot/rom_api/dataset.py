@@ -0,0 +1,387 @@
+"""
+Keeps everything extracted from a patched rom together as one snapshot. Every extractor declares the config
+fields it reads, so a config change only re-runs the extractors (and their dependents) that it actually affects.
+Snapshots can be saved to disk, so the bot has data to serve right after a restart.
+Several snapshots (like the stable release and a beta) can be kept at once, sharing every record they have in common.
+"""
+import hashlib
+import os
+import tempfile
+from copy import deepcopy
+from typing import Any, Awaitable, Callable, Iterable, Optional, TYPE_CHECKING
+
+from attr import define, evolve, field, fields, fields_dict, has
+
+from .dex_search import DexIndex, DexIndexData
+from .rom import Rom
+from .stats import get_all_move_names, get_all_ability_names, get_all_type_names, get_all_dex_entries, \
+    get_all_boneka_names, get_all_boneka_stats, get_all_level_up_moves, get_all_sprite_data, get_all_dex_numbers, \
+    get_all_sprite_indices, get_all_palettes, get_all_shiny_palettes, get_sprite_sheets, assemble_boneka_data, \
+    get_type_effectiveness, Boneka, Learnsets, LevelUpMoves
+from .sprite_png import SpriteSheets, sprite_indices
+from .wild_data import get_all_wild_data, WildLocation
+from ..config import Config, data_json, loads, logger
+
+if TYPE_CHECKING:
+    from .learners import LearnerIndex
+    from .stat_table import StatTable
+    from .type_chart import TypeChart
+
+
+async def get_stat_table(rom: Rom, conf: Config, boneka: tuple[Boneka, ...]) -> 'StatTable':
+    from .stat_table import StatTable  # numpy isn't needed until there's data
+
+    return StatTable.from_boneka(boneka)
+
+
+async def get_learner_index(rom: Rom, conf: Config, level_up: Learnsets) -> 'LearnerIndex':
+    from .learners import LearnerIndex
+
+    return LearnerIndex.from_learnsets(level_up)
+
+
+async def get_dex_index(rom: Rom, conf: Config, boneka: tuple[Boneka, ...]) -> DexIndex:
+    return DexIndex.from_boneka(boneka)
+
+
+async def get_type_chart(rom: Rom, conf: Config, chart: tuple[tuple[float, ...], ...], type_names: tuple[str, ...],
+                         boneka: tuple[Boneka, ...]) -> 'TypeChart':
+    from .type_chart import TypeChart
+
+    return TypeChart.from_boneka(chart, type_names, boneka)
+
+
+@define
+class Extractor:
+    func: Callable[..., Awaitable[Any]]  # called as func(rom, conf, *results of deps)
+    fields: tuple[str, ...]  # the config fields it reads. Offsets are written as 'offsets.NAME'
+    deps: tuple[str, ...] = ()
+
+
+# in dependency order
+EXTRACTORS: dict[str, Extractor] = {
+    'move_names': Extractor(get_all_move_names, ('offsets.MOVE_NAME_OFFSET', 'MOVE_COUNT')),
+    'ability_names': Extractor(get_all_ability_names, ('offsets.ABILITY_NAME_OFFSET', 'ABILITY_TABLE_LEN')),
+    'type_names': Extractor(get_all_type_names, ('offsets.TYPE_NAMES_OFFSET', 'TYPE_TABLE_LEN')),
+    'type_effectiveness': Extractor(get_type_effectiveness, ('offsets.TYPE_EFFECTIVENESS_OFFSET', 'TYPE_TABLE_LEN')),
+    'dex_entries': Extractor(get_all_dex_entries, ('offsets.DEX_DATA_OFFSET', 'DEX_LENGTH')),
+    'names': Extractor(get_all_boneka_names, ('offsets.BONEKA_NAME_OFFSET', 'BONEKA_COUNT')),
+    'stats': Extractor(get_all_boneka_stats, ('offsets.BONEKA_STAT_OFFSET', 'BONEKA_COUNT')),
+    'level_up_moves': Extractor(get_all_level_up_moves, ('offsets.LEVEL_UP_MOVE_OFFSET', 'BONEKA_COUNT'),
+                                ('move_names',)),
+    'sprite_indices': Extractor(get_all_sprite_indices, ('offsets.SPRITE_OFFSET', 'BONEKA_COUNT')),
+    'palettes': Extractor(get_all_palettes, ('offsets.PALETTE_OFFSET', 'BONEKA_COUNT')),
+    'shiny_palettes': Extractor(get_all_shiny_palettes, ('offsets.SHINY_PALETTE_OFFSET', 'BONEKA_COUNT')),
+    'sprites': Extractor(get_all_sprite_data, ('SPRITE_SCALE', 'SPRITE_FORMAT'), ('sprite_indices', 'palettes')),
+    'dex_numbers': Extractor(get_all_dex_numbers, ('offsets.DEX_NUMBERS_OFFSET', 'BONEKA_COUNT')),
+    'boneka': Extractor(assemble_boneka_data, (),
+                        ('names', 'stats', 'level_up_moves', 'sprites', 'dex_numbers', 'ability_names', 'type_names',
+                         'dex_entries')),
+    'wild': Extractor(get_all_wild_data,
+                      ('offsets.MAP_BANKS_OFFSET', 'offsets.MAP_NAMES_OFFSET', 'offsets.WILD_DATA_OFFSET',
+                       'MAP_BANK_COUNT', 'MAPSECS_KANTO', 'NUM_MAP_NAMES', 'WILD_DATA_LEN',
+                       'NUM_GRASS_ENCOUNTER_SLOTS', 'NUM_SURF_ENCOUNTER_SLOTS', 'NUM_TREE_ENCOUNTER_SLOTS',
+                       'NUM_FISH_ENCOUNTER_SLOTS'),
+                      ('boneka',)),
+    'stat_table': Extractor(get_stat_table, (), ('boneka',)),
+    'learners': Extractor(get_learner_index, (), ('level_up_moves',)),
+    'sprite_sheets': Extractor(get_sprite_sheets, (), ('sprite_indices', 'palettes', 'shiny_palettes')),
+    'type_chart': Extractor(get_type_chart, (), ('type_effectiveness', 'type_names', 'boneka')),
+    'dex_index': Extractor(get_dex_index, (), ('boneka',)),
+}
+
+
+def config_fingerprint(conf: Config) -> str:
+    """
+    A hash of only the config fields that extraction reads
+    """
+    names = sorted({name for extractor in EXTRACTORS.values() for name in extractor.fields})
+    values = []
+    for name in names:
+        value = conf
+        for part in name.split('.'):
+            value = getattr(value, part)
+        values.append(f'{name}={value!r}')
+    return hashlib.sha256('\n'.join(values).encode()).hexdigest()
+
+
+def dataset_version(rom_hash: str, patch_hash: str, conf: Config) -> str:
+    """
+    Identifies what a snapshot was extracted from. Equal versions mean equal data
+    """
+    return hashlib.sha256(f'{rom_hash}:{patch_hash}:{config_fingerprint(conf)}'.encode()).hexdigest()
+
+
+@define
+class Dataset:
+    """
+    A snapshot of all data extracted from a patched rom with a specific config.
+    Snapshots are never modified. Changes produce a new snapshot. Results that a snapshot from disk doesn't have
+    are built the first time they're used, and kept next to `results` instead of in it, so snapshots that share
+    `results` don't share them.
+    """
+    rom: Optional[Rom]  # None if it was loaded from disk. Then only the boneka and wild data are available
+    config: Config  # a private copy of the config this was extracted with
+    results: dict[str, Any]
+    rom_hash: str
+    patch_hash: str
+    version: str
+    _derived: dict[str, Any] = field(factory=dict, init=False, eq=False, repr=False)
+
+    def _result(self, name: str, build: Callable[[], Any]) -> Any:
+        """
+        The result called `name`, built with `build()` the first time if the snapshot doesn't have it
+        """
+        try:
+            return self.results[name]
+        except KeyError:
+            pass
+        try:
+            return self._derived[name]
+        except KeyError:
+            value = self._derived[name] = build()
+            return value
+
+    @property
+    def boneka_data(self) -> tuple[Boneka, ...]:
+        return self.results['boneka']
+
+    @property
+    def wild_data(self) -> tuple[WildLocation, ...]:
+        return self.results['wild']
+
+    @property
+    def stat_table(self) -> 'StatTable':
+        return self._result('stat_table', self._build_stat_table)
+
+    def _build_stat_table(self) -> 'StatTable':
+        from .stat_table import StatTable
+
+        return StatTable.from_boneka(self.boneka_data)
+
+    @property
+    def learners(self) -> 'LearnerIndex':
+        return self._result('learners', self._build_learners)
+
+    def _build_learners(self) -> 'LearnerIndex':
+        from .learners import LearnerIndex
+
+        return LearnerIndex.from_learnsets(self.results['level_up_moves'])
+
+    @property
+    def dex_index(self) -> DexIndex:
+        return self.results['dex_index']  # snapshots save it, so it's always there
+
+    @property
+    def type_chart(self) -> 'TypeChart':
+        return self._result('type_chart', self._build_type_chart)
+
+    def _build_type_chart(self) -> 'TypeChart':
+        from .type_chart import TypeChart
+
+        return TypeChart.from_boneka(self.results['type_effectiveness'], self.results['type_names'], self.boneka_data)
+
+    @property
+    def sprite_sheets(self) -> SpriteSheets:
+        return self._result('sprite_sheets', self._build_sprite_sheets)
+
+    def _build_sprite_sheets(self) -> SpriteSheets:
+        palettes = self.results['palettes']
+        # png sprites give their indices back
+        indices = self.results.get('sprite_indices') or tuple(
+            None if boneka.sprite is None or palette is None else sprite_indices(boneka.sprite, palette)
+            for boneka, palette in zip(self.boneka_data, palettes))
+        return SpriteSheets(indices, palettes, self.results['shiny_palettes'])
+
+    def without_rom(self) -> 'Dataset':
+        """
+        The same snapshot, minus the rom and the intermediate results. Like it was loaded from disk
+        """
+        results = {name: self.results[name] for name in SNAPSHOT_RESULTS}
+        if not keeps_sprite_indices(self.config):
+            results['sprite_indices'] = self.results['sprite_indices']
+        return Dataset(None, self.config, results, self.rom_hash, self.patch_hash, self.version)
+
+
+# the results a snapshot from disk has
+SNAPSHOT_RESULTS = ('boneka', 'wild', 'move_names', 'level_up_moves', 'palettes', 'shiny_palettes', 'type_names',
+                    'type_effectiveness', 'dex_index')
+
+
+def keeps_sprite_indices(conf: Config) -> bool:
+    """
+    Whether the palette indices can be read back out of the encoded sprites. webp sprites only keep the colors,
+    and a palette can have the same color twice
+    """
+    return conf.SPRITE_FORMAT == 'png'
+
+
+def _shared(value, records: dict):
+    """
+    `value` with every record in it replaced by the equal one in `records`, if there is one.
+    Records that aren't there yet are added
+    """
+    if isinstance(value, tuple):
+        items = tuple(_shared(item, records) for item in value)
+        if any(new is not old for new, old in zip(items, value)):
+            value = items
+    elif has(type(value)):  # boneka, their stats, dex entries, wild locations...
+        changes = {}
+        for field in fields(type(value)):
+            old = getattr(value, field.name)
+            if (new := _shared(old, records)) is not old:
+                changes[field.name] = new
+        if changes:
+            value = evolve(value, **changes)
+    elif not isinstance(value, (bytes, memoryview, LevelUpMoves)):  # strings are already interned. The rest is small
+        return value
+    return records.setdefault(value, value)
+
+
+def share_records(dataset: Dataset, others: Iterable[Dataset]) -> Dataset:
+    """
+    A copy of `dataset` that reuses every record (boneka, stats, learnsets, sprites, encounter tables...)
+    that's equal to one in `others`, so keeping another version around only costs as much as what's different in it.
+    Records are matched by hash and equality, so they only have to be equal, not come from the same rom
+    """
+    records: dict = {}
+    for other in others:
+        for value in other.results.values():
+            if isinstance(value, tuple):
+                _shared(value, records)
+    results = {name: _shared(value, records) if isinstance(value, tuple) else value
+               for name, value in dataset.results.items()}
+    return evolve(dataset, results=results)
+
+
+def changed_config_fields(old: Config, new: Config) -> set[str]:
+    """
+    The names of the config fields that extraction depends on that differ between two configs
+    """
+    changed = {f'offsets.{name}' for name in fields_dict(type(old.offsets))
+               if getattr(old.offsets, name) != getattr(new.offsets, name)}
+    changed.update(name for name in fields_dict(type(old))
+                   if name not in ('bot_data', 'offsets') and getattr(old, name) != getattr(new, name))
+    return changed
+
+
+def dirty_extractors(changed_fields: Iterable[str]) -> set[str]:
+    """
+    The extractors that read any of `changed_fields`, plus everything that depends on them
+    """
+    changed_fields = set(changed_fields)
+    dirty: set[str] = set()
+    for name, extractor in EXTRACTORS.items():
+        if changed_fields.intersection(extractor.fields) or dirty.intersection(extractor.deps):
+            dirty.add(name)
+    return dirty
+
+
+async def _run_extractors(rom: Rom, conf: Config, names: set[str], results: dict[str, Any]) -> dict[str, Any]:
+    results = dict(results)
+    for name, extractor in EXTRACTORS.items():
+        if name in names:
+            logger.debug(f"Running extractor {name!r}")
+            results[name] = await extractor.func(rom, conf, *(results[dep] for dep in extractor.deps))
+    return results
+
+
+async def build_dataset(rom: Rom, conf: Config, rom_hash: str, patch_hash: str) -> Dataset:
+    """
+    Extracts everything from a patched rom. The hashes are of the unpatched rom and the patch that made it
+    """
+    conf = deepcopy(conf)
+    results = await _run_extractors(rom, conf, set(EXTRACTORS), {})
+    return Dataset(rom, conf, results, rom_hash, patch_hash, dataset_version(rom_hash, patch_hash, conf))
+
+
+async def rebuild_dataset(dataset: Dataset, conf: Config) -> Optional[Dataset]:
+    """
+    Creates a new snapshot for a new config, only re-running the extractors that the config change affects.
+    Everything else is shared with the old snapshot. Returns None if nothing that extraction uses changed.
+    Snapshots loaded from disk have no rom to re-run anything on, so those have to be built again from scratch.
+    """
+    if dataset.rom is None:
+        raise ValueError("Can't partially rebuild a snapshot that was loaded from disk")
+    dirty = dirty_extractors(changed_config_fields(dataset.config, conf))
+    if not dirty:
+        return None
+    logger.debug(f"Config change affects {sorted(dirty)}")
+    conf = deepcopy(conf)
+    results = await _run_extractors(dataset.rom, conf, dirty, dataset.results)
+    return Dataset(dataset.rom, conf, results, dataset.rom_hash, dataset.patch_hash,
+                   dataset_version(dataset.rom_hash, dataset.patch_hash, conf))
+
+
+@data_json(frozen=True)
+class DatasetSnapshot:
+    """
+    What gets saved to disk from a snapshot. Enough to answer commands until the data is revalidated
+    """
+    format: int  # SNAPSHOT_FORMAT when it was saved
+    rom_hash: str
+    patch_hash: str
+    version: str
+    config: Config  # the config it was extracted with, without the token
+    boneka: tuple[Boneka, ...]
+    wild: tuple[WildLocation, ...]
+    move_names: tuple[str, ...]
+    palettes: tuple[Optional[bytes], ...]
+    shiny_palettes: tuple[Optional[bytes], ...]
+    type_names: tuple[str, ...]
+    type_effectiveness: tuple[tuple[float, ...], ...]
+    dex_index: DexIndexData
+    sprite_indices: Optional[tuple[Optional[bytes], ...]] = None  # only when the sprites don't keep them
+
+
+SNAPSHOT_FORMAT = 7  # bump this when the saved json changes shape, so old snapshots get ignored
+
+
+def save_snapshot(dataset: Dataset, path: str):
+    conf = evolve(dataset.config, bot_data=evolve(dataset.config.bot_data, TOKEN=''))
+    snapshot = DatasetSnapshot(SNAPSHOT_FORMAT, dataset.rom_hash, dataset.patch_hash, dataset.version, conf,
+                               dataset.boneka_data, dataset.wild_data, dataset.results['move_names'],
+                               dataset.results['palettes'], dataset.results['shiny_palettes'],
+                               dataset.results['type_names'], dataset.results['type_effectiveness'],
+                               dataset.dex_index.to_data(),
+                               None if keeps_sprite_indices(dataset.config) else dataset.results['sprite_indices'])
+    # a name of its own, so processes saving the same snapshot at once don't write into each other's file
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with open(fd, 'w') as f:
+            f.write(snapshot.to_json())
+        os.replace(tmp_path, path)  # never leave a half written snapshot behind
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_snapshot(path: str, conf: Config) -> Optional[Dataset]:
+    """
+    Loads a saved snapshot. Returns None if there is none, or it can't be read
+    (like if it was saved by an older version of the bot).
+    The snapshot keeps the config it was extracted with. Only the bot settings are taken from `conf`
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = loads(f.read())
+        if data.get('format') != SNAPSHOT_FORMAT:
+            logger.warning(f"Ignoring dataset snapshot {path!r} saved by a different version of the bot")
+            return None
+        snapshot = DatasetSnapshot.converter.structure(data, DatasetSnapshot)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable dataset snapshot {path!r}: {e!r}")
+        return None
+    # move every learnset from its own little table into one packed table again
+    learnsets = Learnsets.pack((boneka.level_up_moves for boneka in snapshot.boneka), snapshot.move_names)
+    boneka = tuple(evolve(b, level_up_moves=moves) for b, moves in zip(snapshot.boneka, learnsets))
+    results = {'boneka': boneka, 'wild': snapshot.wild, 'move_names': snapshot.move_names,
+               'level_up_moves': learnsets, 'palettes': snapshot.palettes, 'shiny_palettes': snapshot.shiny_palettes,
+               'type_names': snapshot.type_names, 'type_effectiveness': snapshot.type_effectiveness,
+               'dex_index': DexIndex.from_data(snapshot.dex_index)}
+    if snapshot.sprite_indices is not None:
+        results['sprite_indices'] = snapshot.sprite_indices
+    return Dataset(None, evolve(snapshot.config, bot_data=deepcopy(conf.bot_data)), results,
+                   snapshot.rom_hash, snapshot.patch_hash, snapshot.version)
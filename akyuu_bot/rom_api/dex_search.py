@@ -0,0 +1,208 @@
+"""
+Full text search over the dex entries. A positional inverted index, so quoted phrases can be matched,
+with results ranked by BM25.
+"""
+import math
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+from attr import define
+
+from .stats import Boneka
+from ..config import data_json
+
+_TOKEN = re.compile(r"\w+(?:'\w+)*")
+_QUERY = re.compile(r'"([^"]*)"|([^\s"]+)')
+
+POSITION_GAP = 16  # between the name, species and entry, so phrases don't match across them
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class DexQueryError(Exception):
+    pass
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.casefold())
+
+
+def highlight(text: str, query: str) -> str:
+    """
+    `text` with the words in `query` in bold
+    """
+    terms = set(tokenize(query))
+    return _TOKEN.sub(lambda m: f'**{m[0]}**' if m[0].casefold() in terms else m[0], text)
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+@data_json(frozen=True)
+class DexIndexData:
+    """
+    A DexIndex as it's saved in a snapshot. The arrays are little endian
+    """
+    terms: tuple[str, ...]
+    term_offsets: bytes  # uint32
+    postings: bytes  # uint16
+    position_offsets: bytes  # uint32
+    positions: bytes  # uint16
+    doc_lengths: bytes  # uint16
+
+
+@define
+class DexIndex:
+    """
+    Documents are rows of boneka_data: the name, species and dex entry. Boneka out of the dex are empty documents.
+    The postings of term `t` are postings[term_offsets[t]:term_offsets[t + 1]], sorted by document.
+    The positions of posting `p` in its document are positions[position_offsets[p]:position_offsets[p + 1]]
+    """
+    terms: tuple[str, ...]  # sorted
+    term_offsets: array  # 'I', one more than there are terms
+    postings: array  # 'H' document ids
+    position_offsets: array  # 'I', one more than there are postings
+    positions: array  # 'H'
+    doc_lengths: array  # 'H', in tokens
+    term_ids: dict[str, int]
+
+    @classmethod
+    def from_arrays(cls, terms: tuple[str, ...], term_offsets: array, postings: array, position_offsets: array,
+                    positions: array, doc_lengths: array) -> 'DexIndex':
+        return cls(terms, term_offsets, postings, position_offsets, positions, doc_lengths,
+                   {term: i for i, term in enumerate(terms)})
+
+    @classmethod
+    def from_boneka(cls, boneka: Iterable[Boneka]) -> 'DexIndex':
+        occurrences: dict[str, dict[int, list[int]]] = {}  # term -> document -> positions
+        doc_lengths = array('H')
+        for doc, b in enumerate(boneka):
+            fields = (b.name, b.dex_data.species, b.dex_data.dex_entry) if b.dex_data is not None else ()
+            position = length = 0
+            for field in fields:
+                tokens = tokenize(field)
+                for offset, token in enumerate(tokens):
+                    occurrences.setdefault(token, {}).setdefault(doc, []).append(position + offset)
+                position += len(tokens) + POSITION_GAP
+                length += len(tokens)
+            doc_lengths.append(length)
+
+        terms = tuple(sorted(occurrences))
+        term_offsets, postings, position_offsets, positions = array('I', [0]), array('H'), array('I', [0]), array('H')
+        for term in terms:
+            for doc, doc_positions in occurrences[term].items():  # documents were added in order
+                postings.append(doc)
+                positions.extend(doc_positions)
+                position_offsets.append(len(positions))
+            term_offsets.append(len(postings))
+        return cls.from_arrays(terms, term_offsets, postings, position_offsets, positions, doc_lengths)
+
+    @classmethod
+    def from_data(cls, data: DexIndexData) -> 'DexIndex':
+        return cls.from_arrays(data.terms, _from_bytes('I', data.term_offsets), _from_bytes('H', data.postings),
+                               _from_bytes('I', data.position_offsets), _from_bytes('H', data.positions),
+                               _from_bytes('H', data.doc_lengths))
+
+    def to_data(self) -> DexIndexData:
+        return DexIndexData(self.terms, *map(_to_bytes, (self.term_offsets, self.postings, self.position_offsets,
+                                                         self.positions, self.doc_lengths)))
+
+    def _positions(self, term_id: int) -> dict[int, memoryview]:
+        """
+        Document -> the positions of the term in it
+        """
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        offsets, positions = self.position_offsets, memoryview(self.positions)
+        return {self.postings[p]: positions[offsets[p]:offsets[p + 1]] for p in range(start, end)}
+
+    def _term_counts(self, term: str) -> dict[int, int]:
+        """
+        Document -> how many times `term` is in it
+        """
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return {}
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        offsets = self.position_offsets
+        return {self.postings[p]: offsets[p + 1] - offsets[p] for p in range(start, end)}
+
+    def _phrase_counts(self, phrase: list[str]) -> dict[int, int]:
+        """
+        Same as _term_counts, but for the terms appearing one after another
+        """
+        term_ids = [self.term_ids.get(term) for term in phrase]
+        if None in term_ids:
+            return {}
+        # the rarest term has the fewest documents to check
+        postings = sorted(((place, self._positions(term_id)) for place, term_id in enumerate(term_ids)),
+                          key=lambda item: len(item[1]))
+        counts = {}
+        first_place, first = postings[0]
+        for doc, positions in first.items():
+            starts = {p - first_place for p in positions}
+            for place, other in postings[1:]:
+                if not starts or doc not in other:
+                    break
+                other_positions = other[doc]
+                starts = {s for s in starts if _contains(other_positions, s + place)}
+            else:
+                if starts:
+                    counts[doc] = len(starts)
+        return counts
+
+    def search(self, query: str) -> list[tuple[int, float]]:
+        """
+        (document, score) of every document matching `query`, best first. Quoted phrases and words have to be in a
+        document. The other words don't, but rank documents that have them higher
+        """
+        phrases: list[list[str]] = []
+        words: list[str] = []
+        for phrase, word in _QUERY.findall(query):
+            tokens = tokenize(phrase if phrase else word)
+            if phrase and tokens:  # even a single quoted word has to be in the document
+                phrases.append(tokens)
+            else:
+                words.extend(tokens)
+        if not phrases and not words:
+            raise DexQueryError("Search for at least one word")
+
+        doc_count = sum(1 for length in self.doc_lengths if length)
+        average_length = max(sum(self.doc_lengths) / max(doc_count, 1), 1)
+        scores: dict[int, float] = {}
+        required: Optional[set[int]] = None
+
+        def add(counts: dict[int, int]):
+            idf = math.log(1 + (doc_count - len(counts) + 0.5) / (len(counts) + 0.5))
+            for doc, count in counts.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc] / average_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+
+        for tokens in phrases:
+            counts = self._phrase_counts(tokens) if len(tokens) > 1 else self._term_counts(tokens[0])
+            required = set(counts) if required is None else required & counts.keys()
+            add(counts)
+        for word in dict.fromkeys(words):
+            add(self._term_counts(word))
+
+        docs = scores if required is None else required
+        return sorted(((doc, scores[doc]) for doc in docs), key=lambda item: (-item[1], item[0]))
+
+
+def _contains(positions: memoryview, position: int) -> bool:
+    i = bisect_left(positions, position)
+    return i < len(positions) and positions[i] == position
@@ -0,0 +1,62 @@
+"""
+An inverted index from moves to the boneka that learn them by level up.
+"""
+import numpy as np
+from attr import define
+
+from .stats import Learnsets
+
+
+@define
+class LearnerIndex:
+    """
+    The learners of move `i` are species[offsets[i]:offsets[i + 1]] at the matching levels,
+    sorted by (species, level). Species are indices into boneka_data.
+    """
+    move_names: tuple[str, ...]
+    offsets: np.ndarray  # uint32, one more than there are moves
+    species: np.ndarray  # uint16
+    levels: np.ndarray  # uint8
+    move_ids: dict[str, tuple[int, ...]]  # lowercase name -> every move id with that name
+
+    @classmethod
+    def from_learnsets(cls, learnsets: Learnsets) -> 'LearnerIndex':
+        move_names = learnsets.move_names
+        move_ids: dict[str, tuple[int, ...]] = {}
+        for i, name in enumerate(move_names):
+            move_ids[name.lower()] = (*move_ids.get(name.lower(), ()), i)
+
+        entries = np.frombuffer(learnsets.data, dtype=np.uint16)
+        moves = entries & 0b00000001_11111111
+        levels = (entries >> 9).astype(np.uint8)
+        species = np.repeat(np.arange(len(learnsets), dtype=np.uint16),
+                            np.frombuffer(learnsets.lengths, dtype=np.uint16))
+
+        order = np.lexsort((levels, species, moves))
+        counts = np.bincount(moves, minlength=len(move_names))
+        offsets = np.zeros(len(move_names) + 1, dtype=np.uint32)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(tuple(move_names), offsets, species[order], levels[order], move_ids)
+
+    def learners(self, move_id: int) -> list[tuple[int, int]]:
+        """
+        (species, level) for every time a boneka learns the move
+        """
+        start, end = self.offsets[move_id], self.offsets[move_id + 1]
+        return list(zip(self.species[start:end].tolist(), self.levels[start:end].tolist()))
+
+    def learners_by_name(self, name: str) -> list[tuple[int, int]]:
+        ids = self.move_ids.get(name.lower(), ())
+        return sorted(pair for move_id in ids for pair in self.learners(move_id))
+
+    def search(self, text: str, limit: int = 25) -> list[str]:
+        """
+        Names of moves that are learned by level up containing `text`. The ones starting with it go first
+        """
+        text = text.lower()
+        starts, contains = [], []
+        for name, ids in self.move_ids.items():
+            if text not in name or not any(self.offsets[i] != self.offsets[i + 1] for i in ids):
+                continue
+            (starts if name.startswith(text) else contains).append(self.move_names[ids[0]])
+        return (starts + contains)[:limit]
@@ -0,0 +1,268 @@
+"""
+Snapshots saved as flat little endian columns, for the generations that shards load. A shard maps the file read only
+instead of parsing it: sprites, palettes, learnsets and the dex index stay views into the mapping, so their pages are
+shared through the OS file cache by every process that maps the same file. Only the strings and the small records
+(boneka, stats, wild locations) are built in each process, straight from the columns.
+
+File layout: MAGIC, the header's length as a u64, then the header (json: what the snapshot is, its config and where
+each column starts), then the columns, each aligned to 8 bytes. Every string is stored once in a string table and
+every blob (sprite, palette, pixel indices) once in a blob table, and the other columns refer to them by index,
+with -1 for None.
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from copy import deepcopy
+from typing import Any, Iterable, Optional, Union
+
+from attr import evolve
+
+from .dataset import Dataset
+from .dex_search import DexIndex
+from .stats import Boneka, BonekaDexData, BonekaStatData, Learnsets
+from .wild_data import WildEncounterData, WildLocation
+from ..config import Config, dumps, loads, logger
+
+MAPPED_FORMAT = 1  # bump this when the columns change, so old files get ignored
+MAGIC = b'AKYUMAP\0'
+_PREAMBLE = struct.Struct('<8sQ')
+ALIGNMENT = 8
+
+Column = Union[array, memoryview]
+STAT_FIELDS = ('hp', 'attack', 'defense', 'sp_atk', 'sp_def', 'speed')
+ENCOUNTER_KINDS = ('grass', 'surf', 'tree', 'fish')
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class _Columns:
+    """
+    The columns of a file that's being written, in the order they're written in
+    """
+
+    def __init__(self):
+        self.columns: dict[str, array] = {}
+        self.strings: dict[str, int] = {}
+        self.blobs: dict[bytes, int] = {}
+
+    def add(self, name: str, typecode: str, values: Iterable = ()) -> array:
+        column = self.columns[name] = array(typecode, values)
+        return column
+
+    def string(self, value: Optional[str]) -> int:
+        return -1 if value is None else self.strings.setdefault(value, len(self.strings))
+
+    def blob(self, value: Optional[bytes]) -> int:
+        return -1 if value is None else self.blobs.setdefault(bytes(value), len(self.blobs))
+
+    def table(self, name: str, values: Iterable[bytes]):
+        """
+        Variable length values stored back to back, with where each one starts (plus where the last one ends)
+        """
+        data, offsets = self.add(name, 'B'), self.add(f'{name}_offsets', 'I', (0,))
+        for value in values:
+            data.frombytes(value)
+            offsets.append(len(data))
+
+
+def _columns(dataset: Dataset) -> _Columns:
+    cols = _Columns()
+    results = dataset.results
+    move_names = results['move_names']
+    cols.add('move_names', 'i', map(cols.string, move_names))
+    cols.add('type_names', 'i', map(cols.string, results['type_names']))
+
+    boneka = dataset.boneka_data
+    name, stats, types, abilities = (cols.add('boneka_name', 'i'), cols.add('boneka_stats', 'H'),
+                                     cols.add('boneka_types', 'i'), cols.add('boneka_abilities', 'i'))
+    sprite, dex_number, dex = (cols.add('boneka_sprite', 'i'), cols.add('boneka_dex_number', 'I'),
+                               cols.add('boneka_dex', 'i'))
+    for b in boneka:
+        name.append(cols.string(b.name))
+        stats.extend(getattr(b.stats, stat) for stat in STAT_FIELDS)
+        types.extend((cols.string(b.stats.type_1), cols.string(b.stats.type_2)))
+        abilities.extend((cols.string(b.stats.ability_1), cols.string(b.stats.ability_2)))
+        sprite.append(cols.blob(b.sprite))
+        dex_number.append(b.dex_number)
+        dex.extend((-1, -1) if b.dex_data is None else
+                   (cols.string(b.dex_data.species), cols.string(b.dex_data.dex_entry)))
+    # the boneka are what a snapshot has, so their learnsets are packed again in case they came from elsewhere
+    learnsets = Learnsets.pack((b.level_up_moves for b in boneka), move_names)
+    cols.add('learnset_data', 'H', learnsets.data)
+    cols.add('learnset_starts', 'I', learnsets.starts)
+    cols.add('learnset_lengths', 'H', learnsets.lengths)
+
+    cols.add('palettes', 'i', map(cols.blob, results['palettes']))
+    cols.add('shiny_palettes', 'i', map(cols.blob, results['shiny_palettes']))
+    cols.add('sprite_indices', 'i', map(cols.blob, dataset.sprite_sheets.indices))  # so no shard rebuilds them
+
+    chart = results['type_effectiveness']
+    cols.add('type_effectiveness', 'd', (multiplier for row in chart for multiplier in row))
+    cols.add('type_effectiveness_rows', 'H', map(len, chart))
+
+    # encounter tables are stored once each, however many locations have them
+    tables: dict[tuple[WildEncounterData, ...], int] = {}
+    wild_name, wild_tables = cols.add('wild_name', 'i'), cols.add('wild_tables', 'i')
+    table_starts, table_lengths = cols.add('table_starts', 'I'), cols.add('table_lengths', 'H')
+    encounter_boneka, encounter_levels = cols.add('encounter_boneka', 'i'), cols.add('encounter_levels', 'H')
+    for location in dataset.wild_data:
+        wild_name.append(cols.string(location.name))
+        for kind in ENCOUNTER_KINDS:
+            if (table := getattr(location, kind)) is None:
+                wild_tables.append(-1)
+                continue
+            if (table_id := tables.get(table)) is None:
+                table_id = tables[table] = len(table_starts)
+                table_starts.append(len(encounter_boneka))
+                table_lengths.append(len(table))
+                for encounter in table:
+                    encounter_boneka.append(cols.string(encounter.boneka))
+                    encounter_levels.extend((encounter.low, encounter.high))
+            wild_tables.append(table_id)
+
+    index = dataset.dex_index
+    cols.add('dex_terms', 'i', map(cols.string, index.terms))
+    cols.add('dex_term_offsets', 'I', index.term_offsets)
+    cols.add('dex_postings', 'H', index.postings)
+    cols.add('dex_position_offsets', 'I', index.position_offsets)
+    cols.add('dex_positions', 'H', index.positions)
+    cols.add('dex_doc_lengths', 'H', index.doc_lengths)
+
+    cols.table('strings', (s.encode() for s in cols.strings))
+    cols.table('blobs', cols.blobs)
+    return cols
+
+
+def save_mapped(dataset: Dataset, path: str):
+    cols = _columns(dataset)
+    sections: dict[str, list] = {}
+    end = 0
+    for name, column in cols.columns.items():
+        sections[name] = [end, column.typecode, column.itemsize, len(column)]
+        end = _aligned(end + column.itemsize * len(column))
+    conf = evolve(dataset.config, bot_data=evolve(dataset.config.bot_data, TOKEN=''))
+    header = dumps({'format': MAPPED_FORMAT, 'rom_hash': dataset.rom_hash, 'patch_hash': dataset.patch_hash,
+                    'version': dataset.version, 'config': Config.converter.unstructure(conf),
+                    'sections': sections}).encode()
+    start = _aligned(_PREAMBLE.size + len(header))
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with open(fd, 'wb') as f:
+            f.write(_PREAMBLE.pack(MAGIC, len(header)))
+            f.write(header)
+            for name, column in cols.columns.items():
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                f.seek(start + sections[name][0])
+                column.tofile(f)
+            f.truncate(start + end)
+        os.replace(tmp_path, path)  # never leave a half written file behind
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _attach(mapped: mmap.mmap, header: dict[str, Any], start: int, conf: Config) -> Dataset:
+    view = memoryview(mapped)
+
+    def column(name: str) -> Column:
+        offset, typecode, itemsize, count = header['sections'][name]
+        if array(typecode).itemsize != itemsize:
+            raise ValueError(f"Column {name!r} was saved with {itemsize} byte {typecode!r}s")
+        data = view[start + offset:start + offset + itemsize * count]
+        if len(data) != itemsize * count:
+            raise ValueError(f"Column {name!r} is cut off")
+        if sys.byteorder == 'big' and itemsize > 1:  # can't be viewed, so it's copied and swapped instead
+            values = array(typecode, data.tobytes())
+            values.byteswap()
+            return values
+        return data.cast(typecode)
+
+    def table(name: str) -> list[memoryview]:
+        data, offsets = column(name), column(f'{name}_offsets')
+        return [data[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    strings = [str(s, 'utf-8') for s in table('strings')]
+    blobs = table('blobs')
+
+    def blob(i: int) -> Optional[memoryview]:
+        return None if i < 0 else blobs[i]
+
+    move_names = tuple(strings[i] for i in column('move_names'))
+    type_names = tuple(strings[i] for i in column('type_names'))
+    learnsets = Learnsets(column('learnset_data'), column('learnset_starts'), column('learnset_lengths'), move_names)
+
+    name, stats, types, abilities = (column('boneka_name'), column('boneka_stats'), column('boneka_types'),
+                                     column('boneka_abilities'))
+    sprite, dex_number, dex = column('boneka_sprite'), column('boneka_dex_number'), column('boneka_dex')
+    stat_count = len(STAT_FIELDS)
+    boneka = tuple(
+        Boneka(strings[name[i]],
+               BonekaStatData(*stats[i * stat_count:(i + 1) * stat_count].tolist(),
+                              strings[types[2 * i]], strings[types[2 * i + 1]],
+                              strings[abilities[2 * i]], strings[abilities[2 * i + 1]]),
+               learnsets[i], blob(sprite[i]), dex_number[i],
+               None if dex[2 * i] < 0 else BonekaDexData(strings[dex[2 * i]], strings[dex[2 * i + 1]]))
+        for i in range(len(name)))
+
+    chart_data, rows = column('type_effectiveness'), column('type_effectiveness_rows')
+    chart, pos = [], 0
+    for length in rows:
+        chart.append(tuple(chart_data[pos:pos + length].tolist()))
+        pos += length
+
+    table_starts, table_lengths = column('table_starts'), column('table_lengths')
+    encounter_boneka, encounter_levels = column('encounter_boneka'), column('encounter_levels')
+    tables = [tuple(WildEncounterData(strings[encounter_boneka[e]], *encounter_levels[2 * e:2 * e + 2].tolist())
+                    for e in range(first, first + length))
+              for first, length in zip(table_starts, table_lengths)]
+    wild_name, wild_tables = column('wild_name'), column('wild_tables')
+    kinds = len(ENCOUNTER_KINDS)
+    wild = tuple(
+        WildLocation(None if wild_name[i] < 0 else strings[wild_name[i]],
+                     *(None if t < 0 else tables[t] for t in wild_tables[i * kinds:(i + 1) * kinds]))
+        for i in range(len(wild_name)))
+
+    dex_index = DexIndex.from_arrays(tuple(strings[i] for i in column('dex_terms')), column('dex_term_offsets'),
+                                     column('dex_postings'), column('dex_position_offsets'), column('dex_positions'),
+                                     column('dex_doc_lengths'))
+
+    results = {'boneka': boneka, 'wild': wild, 'move_names': move_names, 'level_up_moves': learnsets,
+               'palettes': tuple(map(blob, column('palettes'))),
+               'shiny_palettes': tuple(map(blob, column('shiny_palettes'))),
+               'sprite_indices': tuple(map(blob, column('sprite_indices'))),
+               'type_names': type_names, 'type_effectiveness': tuple(chart), 'dex_index': dex_index}
+    saved_conf = Config.converter.structure(header['config'], Config)
+    return Dataset(None, evolve(saved_conf, bot_data=deepcopy(conf.bot_data)), results,
+                   header['rom_hash'], header['patch_hash'], header['version'])
+
+
+def attach_mapped(path: str, conf: Config) -> Optional[Dataset]:
+    """
+    Maps a file saved by save_mapped read only. Returns None if there is none, or it can't be read
+    (like if it was saved by an older version of the bot).
+    Like load_snapshot, the dataset keeps the config it was extracted with, with the bot settings from `conf`.
+    The mapping stays open for as long as anything still views into it
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, length = _PREAMBLE.unpack_from(mapped)
+        if magic != MAGIC:
+            raise ValueError("Not a mapped snapshot")
+        header = loads(mapped[_PREAMBLE.size:_PREAMBLE.size + length])
+        if header.get('format') != MAPPED_FORMAT:
+            logger.warning(f"Ignoring mapped dataset {path!r} saved by a different version of the bot")
+            return None
+        return _attach(mapped, header, _aligned(_PREAMBLE.size + length), conf)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable mapped dataset {path!r}: {e!r}")
+        return None
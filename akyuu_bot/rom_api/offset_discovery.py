@@ -0,0 +1,589 @@
+"""
+Finds the tables of a new release again when it moved them, so the offsets don't have to be looked up in HMA
+and typed into the config by hand after every update.
+
+The data extracted from the last release is the reference. Every table is looked for by what it should contain:
+known strings run through the charset, stat rows and learnsets as their raw bytes, pointer tables through the
+pointers to that data, and the sprite and palette tables by their structure (a pointer to LZSS data, then a tag
+that counts up by one each row). Every candidate is checked by decoding a few rows of it and comparing them to
+the reference, and the offsets in the config are checked the same way first, so nothing is scanned for unless a
+table actually moved.
+"""
+import asyncio
+import struct
+from collections import Counter
+from itertools import product
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from attr import define, evolve
+
+from .dataset import Dataset
+from .rom import ROM_START, Rom, RomAddressError
+from .sprite_png import decode_palette, decode_sprite
+from .stats import RawBonekaStatData, DexRaw, TypeEffectiveness, get_type_effectiveness, TYPE_FORESIGHT, \
+    TYPE_ENDTABLE
+from .text_decode import text_decode, text_encode
+from .wild_data import RawWildLocation, WildLocation, get_all_map_names, get_all_wild_data
+from ..config import Config, Offsets
+
+CHECK_ROWS = 24  # rows decoded to check a candidate, spread over the table
+SEED_ROWS = 6  # most rows searched for to find a table. Searching stops at the first candidate that checks out
+MAX_HITS = 16  # a needle found more often than this says nothing about where the table is
+MAX_CANDIDATES = 4  # per table, for the tables that are only checked together
+MIN_NEEDLE = 3  # bytes, not counting padding
+SURE_SCORE = 0.9  # a candidate this good is taken without looking at the others
+MIN_SCORE = 0.5  # less than this isn't the table. A release can change data, but not most of it
+
+SPRITE_BYTES = 0x800  # decompressed 64x64 4bpp sprite
+PALETTE_BYTES = 0x20
+LZSS_HEADER = 0x10
+BANK_END = b'\xf7\xf7\xf7\xf7'
+MAX_BANK_MAPS = 256
+MAX_LEARNSET = 64  # moves
+ROM_POINTER = ROM_START >> 25  # the top 7 bits of a pointer into the 32MiB of rom
+
+
+class OffsetsMovedError(Exception):
+    pass
+
+
+@define
+class Discovery:
+    """
+    Where one of the tables in Offsets turned out to be
+    """
+    name: str  # the Offsets field
+    old: int
+    new: Optional[int]  # None if neither the old offset nor anything found looks like the table
+    score: float  # the fraction of the checked rows that matched the reference
+
+    @property
+    def moved(self) -> bool:
+        return self.new is not None and self.new != self.old
+
+
+def corrected_offsets(offsets: Offsets, discoveries: Iterable[Discovery]) -> Offsets:
+    return evolve(offsets, **{d.name: d.new for d in discoveries if d.moved})
+
+
+def describe(discoveries: Iterable[Discovery]) -> str:
+    """
+    A line for every table that moved or couldn't be found. Empty if there are none
+    """
+    lines = []
+    for d in discoveries:
+        if d.moved:
+            lines.append(f"`{d.name}`: {d.old:#010x} -> {d.new:#010x} ({d.score:.0%} of the rows checked match)")
+        elif d.new is None:
+            lines.append(f"`{d.name}`: not found. {d.old:#010x} only matches {d.score:.0%}")
+    return '\n'.join(lines)
+
+
+def _sample(rows: Iterable[int]) -> list[int]:
+    rows = sorted(rows)
+    step = max(len(rows) // CHECK_ROWS, 1)
+    return rows[::step][:CHECK_ROWS]
+
+
+def _seeds(values: dict[int, Any], needle: Callable[[int], bytes]) -> Iterator[tuple[int, bytes]]:
+    """
+    The rows worth searching for, with what to search for: ones whose value is in no other row,
+    and whose needle isn't just padding. Needles are only made for the rows that get searched for
+    """
+    counts = Counter(values.values())
+    rows = [row for row in sorted(values) if counts[values[row]] == 1]
+    seeds = 0
+    for row in rows[::max(len(rows) // SEED_ROWS, 1)]:
+        if len((row_needle := needle(row)).strip(b'\x00\xff')) >= MIN_NEEDLE:
+            yield row, row_needle
+            if (seeds := seeds + 1) == SEED_ROWS:
+                return
+
+
+def _string_needle(text: str, width: int) -> bytes:
+    try:
+        return (text_encode(text) + b'\xff')[:width]
+    except ValueError:
+        return b''  # can't be searched for, so it won't be a seed
+
+
+def _u16s(values: Iterable[int]) -> bytes:
+    values = list(values)
+    return struct.pack(f'<{len(values)}H', *values)
+
+
+class _Scan:
+    """
+    One discovery run over a rom. Keeps what more than one table uses
+    """
+
+    def __init__(self, rom: Rom, conf: Config, reference: Dataset):
+        self.rom = rom
+        self.conf = conf
+        self.reference = reference
+        self.stream = rom.create_stream()
+        self._words = None
+        self._pointers = None
+        self._tag_tables: Optional[list[int]] = None
+
+    def find_all(self, needle: bytes) -> list[int]:
+        """
+        Every file offset of `needle`, or nothing if it's too common to mean anything
+        """
+        hits = []
+        pos = self.rom.find(needle)
+        while pos != -1:
+            if len(hits) == MAX_HITS:
+                return []
+            hits.append(pos)
+            pos = self.rom.find(needle, pos + 1)
+        return hits
+
+    def word(self, address: int) -> int:
+        offset = self.rom.translate(address, 4)
+        return int.from_bytes(self.rom[offset:offset + 4], 'little')
+
+    # the rom as aligned words. numpy is only imported once something has moved
+
+    def words(self):
+        """
+        (every aligned u32, which of them are rom pointers)
+        """
+        if self._words is None:
+            import numpy as np
+
+            words = np.frombuffer(self.rom.data, dtype='<u4', count=len(self.rom) // 4)
+            self._words = words, (words >> 25) == ROM_POINTER
+        return self._words
+
+    def pointers_to(self, offset: int) -> list[int]:
+        """
+        The file offsets of the aligned pointers to file offset `offset`. Every pointer in the rom is sorted
+        once, so each lookup after that is a binary search instead of a pass over the rom
+        """
+        import numpy as np
+
+        if self._pointers is None:
+            words, is_ptr = self.words()
+            positions = np.flatnonzero(is_ptr)
+            values = words[positions]
+            order = np.argsort(values, kind='stable')
+            self._pointers = values[order], positions[order] * 4
+        values, positions = self._pointers
+        first, last = np.searchsorted(values, (offset + ROM_START, offset + ROM_START + 1))
+        return positions[first:last].tolist() if last - first <= MAX_HITS else []
+
+    def tag_tables(self) -> list[int]:
+        """
+        Addresses of tables of (pointer, u16, u16) rows where one of the u16s is the row number and the other
+        stays the same, like the sprite and palette tables. Found from a few rows in a row that count up
+        """
+        if self._tag_tables is not None:
+            return self._tag_tables
+        import numpy as np
+
+        words, is_ptr = self.words()
+        starts: set[int] = set()
+        for phase in (0, 1):  # rows are 8 bytes, but only 4 byte aligned
+            count = (len(words) - phase) // 2
+            tags = words[phase + 1::2][:count]
+            row_is_ptr = is_ptr[phase::2][:count]
+            low, high = tags & 0xFFFF, tags >> 16
+            both = row_is_ptr[:-1] & row_is_ptr[1:]
+            counts_low = both & (low[1:] == low[:-1] + 1) & (high[1:] == high[:-1])
+            counts_high = both & (high[1:] == high[:-1] + 1) & (low[1:] == low[:-1])
+            for counting, row in ((counts_low, low), (counts_high, high)):
+                rows = np.flatnonzero(counting[:-3] & counting[1:-2] & counting[2:-1] & counting[3:])  # 5 rows
+                table = (phase + 2 * rows) * 4 - row[rows].astype(np.int64) * 8
+                starts.update(int(start) + ROM_START for start in np.unique(table) if start >= 0)
+        self._tag_tables = sorted(starts)
+        return self._tag_tables
+
+    def pointer_runs(self, length: int) -> list[int]:
+        """
+        Addresses of aligned runs of at least `length` rom pointers. Both ends of a longer run are given
+        """
+        import numpy as np
+
+        _, is_ptr = self.words()
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], is_ptr, [False])).view(np.int8)))
+        starts, ends = edges[::2], edges[1::2]
+        long = ends - starts >= length
+        found = []
+        for start, end in zip(starts[long].tolist(), ends[long].tolist()):
+            found.append(start * 4 + ROM_START)
+            if end - start > length:
+                found.append((end - length) * 4 + ROM_START)
+        return found
+
+    # finding and checking tables
+
+    def search(self, values: dict[int, Any], needle: Callable[[int], bytes], stride: int,
+               locate: Callable[[int], Iterable[int]] = lambda pos: (pos,)) -> Iterator[int]:
+        """
+        Candidate table addresses from where the needles of rows are, as they're found. `locate` turns where
+        a needle is into where the row is in the table, for tables of pointers to what's searched for
+        """
+        seen = set()
+        for row, row_needle in _seeds(values, needle):
+            for pos in self.find_all(row_needle):
+                for entry in locate(pos):
+                    if (start := entry - row * stride) >= 0 and start not in seen:
+                        seen.add(start)
+                        yield start + ROM_START
+
+    def score(self, expected: dict[int, Any], read: Callable[[int], Any], address: int, stride: int) -> float:
+        """
+        The fraction of the sampled rows of the table at `address` that `read` gets the expected value from
+        """
+        rows = _sample(expected)
+        matched = 0
+        for row in rows:
+            try:
+                matched += read(address + row * stride) == expected[row]
+            except Exception:  # junk can fail to decode in all kinds of ways
+                pass
+        return matched / len(rows)
+
+    def table(self, name: str, expected: dict[int, Any], stride: int, read: Callable[[int], Any],
+              candidates: Callable[[], Iterable[int]]) -> Optional[Discovery]:
+        """
+        The old offset if it still checks out, otherwise the best of `candidates`
+        """
+        if not expected:
+            return None  # the reference doesn't know what's in it
+        old = getattr(self.conf.offsets, name)
+        best, best_score = old, self.score(expected, read, old, stride)
+        if best_score < SURE_SCORE:
+            for candidate in candidates():
+                if candidate != best and (candidate_score := self.score(expected, read, candidate, stride)) > best_score:
+                    best, best_score = candidate, candidate_score
+                    if best_score >= SURE_SCORE:
+                        break
+        return Discovery(name, old, best if best_score >= MIN_SCORE else None, best_score)
+
+    def strings(self, name: str, values: dict[int, str], width: int) -> Optional[Discovery]:
+        """
+        A table of fixed width strings
+        """
+        return self.table(name, values, width, self.read_string(width),
+                          lambda: self.search(values, lambda row: _string_needle(values[row], width), width))
+
+    # readers. They take the address of a row
+
+    def read_string(self, width: int) -> Callable[[int], str]:
+        def read(address: int) -> str:
+            offset = self.rom.translate(address, width)
+            return text_decode(self.rom[offset:offset + width])
+        return read
+
+    def read_bytes(self, size: int) -> Callable[[int], bytes]:
+        def read(address: int) -> bytes:
+            offset = self.rom.translate(address, size)
+            return self.rom[offset:offset + size]
+        return read
+
+    def read_u16(self, address: int) -> int:
+        return int.from_bytes(self.read_bytes(2)(address), 'little')
+
+    def read_learnset(self, address: int) -> bytes:
+        start = self.rom.translate(self.word(address))
+        pos, limit = start, start + MAX_LEARNSET * 2 + 2
+        while (pos := self.rom.find(b'\xff\xff', pos, limit)) != -1:
+            if (pos - start) % 2 == 0:
+                return self.rom[start:pos]
+            pos += 1
+        raise ValueError("Not a learnset")
+
+    def read_dex(self, address: int) -> tuple[str, str]:
+        raw = DexRaw(self.read_bytes(DexRaw.size)(address))
+        text = self.rom.translate(raw.description)
+        return text_decode(raw.species), text_decode(self.rom[text:text + 128])
+
+    def lzss_data(self, address: int, size: int) -> int:
+        """
+        The pointer in the row at `address`, if it points to LZSS data that decompresses to `size` bytes
+        """
+        ptr = self.word(address)
+        offset = self.rom.translate(ptr, 4)
+        if self.rom[offset] != LZSS_HEADER or int.from_bytes(self.rom[offset + 1:offset + 4], 'little') != size:
+            raise ValueError("Not LZSS data of the right size")
+        return ptr
+
+    def read_sprite(self, address: int) -> bytes:
+        return decode_sprite(self.stream, self.lzss_data(address, SPRITE_BYTES))
+
+    def read_palette(self, address: int) -> bytes:
+        return decode_palette(self.stream, self.lzss_data(address, PALETTE_BYTES))
+
+    def lzss_tables(self, size: int, old: int) -> list[int]:
+        """
+        The tag tables whose second row points to LZSS data of `size` bytes, closest to `old` first
+        """
+        found = []
+        for start in self.tag_tables():
+            try:
+                self.lzss_data(start + 8, size)
+            except (RomAddressError, ValueError):
+                continue
+            found.append(start)
+        return sorted(found, key=lambda start: abs(start - old))
+
+    def is_bank(self, address: int) -> bool:
+        """
+        Whether `address` is an array of map header pointers ending at 0xF7F7F7F7
+        """
+        try:
+            start = self.rom.translate(address, 4)
+        except RomAddressError:
+            return False
+        end = self.rom.find(BANK_END, start, start + MAX_BANK_MAPS * 4)
+        if end == -1 or (end - start) % 4:
+            return False
+        return all(self.rom[pos + 3] >> 1 == ROM_POINTER for pos in range(start, end, 4))
+
+    def banks_ok(self, address: int) -> bool:
+        try:
+            return all(self.is_bank(self.word(address + i * 4)) for i in range(self.conf.MAP_BANK_COUNT))
+        except RomAddressError:
+            return False
+
+
+def _stat_bytes(boneka) -> bytes:
+    s = boneka.stats
+    return bytes((s.hp, s.attack, s.defense, s.speed, s.sp_atk, s.sp_def))  # in RawBonekaStatData's order
+
+
+def _ability_names(scan: _Scan, stats_address: int) -> dict[int, str]:
+    """
+    Ability id -> name, from the ids in the new stat table and the names the reference has for them
+    """
+    names: dict[int, Counter] = {}
+    read = scan.read_bytes(RawBonekaStatData.size)
+    for i, boneka in enumerate(scan.reference.boneka_data[:scan.conf.BONEKA_COUNT]):
+        try:
+            raw = RawBonekaStatData(read(stats_address + i * RawBonekaStatData.size))
+        except RomAddressError:
+            return {}
+        for ability, name in ((raw.ability_1, boneka.stats.ability_1), (raw.ability_2, boneka.stats.ability_2)):
+            if ability < scan.conf.ABILITY_TABLE_LEN:
+                names.setdefault(ability, Counter())[name] += 1
+    return {ability: counts.most_common(1)[0][0] for ability, counts in names.items()}
+
+
+async def _type_chart(scan: _Scan) -> Optional[Discovery]:
+    reference = scan.reference.results.get('type_effectiveness')
+    if reference is None:
+        return None
+    count = scan.conf.TYPE_TABLE_LEN
+    size = TypeEffectiveness.size
+
+    async def score(address: int) -> float:
+        offsets = evolve(scan.conf.offsets, TYPE_EFFECTIVENESS_OFFSET=address)
+        try:
+            chart = await get_type_effectiveness(scan.rom, evolve(scan.conf, offsets=offsets))
+        except Exception:
+            return 0.0
+        return sum(a == b for row, ref_row in zip(chart, reference) for a, b in zip(row, ref_row)) / count ** 2
+
+    def valid(entry: bytes) -> bool:
+        matchup = TypeEffectiveness(entry)
+        return (matchup.attacker < count and matchup.defender < count and matchup.multiplier in (0, 5, 20)
+                and entry != b'\x00\x00\x00')  # padding, not normal being immune to normal
+
+    def candidates() -> Iterator[int]:
+        """
+        Walks back from the foresight separator (or the end, if there isn't one) to the first matchup
+        """
+        for marker in (bytes((TYPE_FORESIGHT, TYPE_FORESIGHT, 0)), bytes((TYPE_ENDTABLE, TYPE_ENDTABLE, 0))):
+            for pos in scan.find_all(marker):
+                start = pos
+                while start >= size and valid(scan.rom[start - size:start]):
+                    start -= size
+                if pos - start >= 8 * size:
+                    yield start + ROM_START
+
+    old = scan.conf.offsets.TYPE_EFFECTIVENESS_OFFSET
+    best, best_score = old, await score(old)
+    if best_score < SURE_SCORE:
+        for candidate in candidates():
+            if (candidate_score := await score(candidate)) > best_score:
+                best, best_score = candidate, candidate_score
+                if best_score >= SURE_SCORE:
+                    break
+    return Discovery('TYPE_EFFECTIVENESS_OFFSET', old, best if best_score >= MIN_SCORE else None, best_score)
+
+
+def _encounter_tables(locations: Iterable[WildLocation]) -> Counter:
+    """
+    (location, kind, table) of every encounter table. A release changing one table only makes that one not match
+    """
+    return Counter((loc.name, kind, table) for loc in locations
+                   for kind, table in (('grass', loc.grass), ('surf', loc.surf), ('tree', loc.tree), ('fish', loc.fish))
+                   if table is not None)
+
+
+async def _wild(scan: _Scan) -> list[Discovery]:
+    """
+    The map bank, map name and wild data tables only mean something together, so they're checked together
+    """
+    conf, rom = scan.conf, scan.rom
+    reference = _encounter_tables(scan.reference.wild_data)
+    boneka = scan.reference.boneka_data
+    if not reference:
+        return []
+    ids: dict[str, int] = {}
+    for i, b in enumerate(boneka):
+        ids.setdefault(b.name, i)
+    reference_names = sorted({loc.name for loc in scan.reference.wild_data})
+    row_size = RawWildLocation.size
+
+    async def score(banks: int, names: int, wild: int) -> float:
+        if not scan.banks_ok(banks):
+            return 0.0  # a bank that never ends is read all the way to the end of the rom
+        offsets = evolve(conf.offsets, MAP_BANKS_OFFSET=banks, MAP_NAMES_OFFSET=names, WILD_DATA_OFFSET=wild)
+        try:
+            found = _encounter_tables(await get_all_wild_data(rom, evolve(conf, offsets=offsets), boneka))
+        except Exception:
+            return 0.0
+        return sum((found & reference).values()) / sum(reference.values())
+
+    async def names_score(address: int) -> float:
+        offsets = evolve(conf.offsets, MAP_NAMES_OFFSET=address)
+        try:
+            names = set(await get_all_map_names(rom, evolve(conf, offsets=offsets)))
+        except Exception:
+            return 0.0
+        return len(names.intersection(reference_names)) / len(reference_names)
+
+    def valid_row(pos: int) -> bool:
+        if pos < 0 or pos + row_size > len(rom):
+            return False
+        loc = RawWildLocation(rom[pos:pos + row_size])
+        ptrs = (loc.grass, loc.surf, loc.tree, loc.fish)
+        return loc.bank < conf.MAP_BANK_COUNT and any(ptrs) and all(not p or p >> 25 == ROM_POINTER for p in ptrs)
+
+    def wild_candidates() -> list[int]:
+        """
+        From known grass tables to the pointers to them, to the rows pointing to those, then to both ends of the
+        run of rows around them
+        """
+        grass = [loc.grass for loc in scan.reference.wild_data
+                 if loc.grass is not None and all(e.boneka in ids for e in loc.grass)]
+        tables = list({b''.join(struct.pack('<BBH', e.low, e.high, ids[e.boneka]) for e in table): None
+                       for table in grass})
+        found = []
+        for _, table in _seeds(dict(enumerate(tables)), tables.__getitem__):
+            for pos in scan.find_all(table):
+                for header in scan.pointers_to(pos):
+                    for row_field in scan.pointers_to(header - 4):  # the rate comes before the pointer
+                        start = end = row = row_field - 4  # grass is the first pointer in a row
+                        while valid_row(start - row_size):
+                            start -= row_size
+                        while valid_row(end):
+                            end += row_size
+                        found.append(start + ROM_START)
+                        if (end - row) // row_size > conf.WILD_DATA_LEN:
+                            found.append(end - conf.WILD_DATA_LEN * row_size + ROM_START)
+            if found:
+                break
+        return list(dict.fromkeys(found))[:MAX_CANDIDATES]
+
+    def name_candidates() -> list[int]:
+        """
+        From known map names to the pointers to them, then to both ends of the run of pointers around them
+        """
+        found = []
+        for _, needle in _seeds(dict(enumerate(reference_names)),
+                                lambda row: _string_needle(reference_names[row], 128)):
+            for pos in scan.find_all(needle):
+                for ptr in scan.pointers_to(pos):
+                    start = end = ptr
+                    while start >= 4 and rom[start - 1] >> 1 == ROM_POINTER:
+                        start -= 4
+                    while end + 4 <= len(rom) and rom[end + 3] >> 1 == ROM_POINTER:
+                        end += 4
+                    found.append(start + ROM_START)
+                    if (end - ptr) // 4 > conf.NUM_MAP_NAMES:
+                        found.append(end - conf.NUM_MAP_NAMES * 4 + ROM_START)
+            if found:
+                break
+        return list(dict.fromkeys(found))[:MAX_CANDIDATES]
+
+    old = (conf.offsets.MAP_BANKS_OFFSET, conf.offsets.MAP_NAMES_OFFSET, conf.offsets.WILD_DATA_OFFSET)
+    best, best_score = old, await score(*old)
+    if best_score < SURE_SCORE:
+        banks = [c for c in (old[0], *scan.pointer_runs(conf.MAP_BANK_COUNT)) if scan.banks_ok(c)]
+        # a name table that doesn't even have the names isn't worth decoding all the wild data for
+        names = [c for c in dict.fromkeys((old[1], *name_candidates())) if await names_score(c) >= MIN_SCORE]
+        wild = [old[2], *wild_candidates()]
+        for candidate in product(banks[:MAX_CANDIDATES], names, wild):
+            if candidate != best and (candidate_score := await score(*candidate)) > best_score:
+                best, best_score = candidate, candidate_score
+                if best_score >= SURE_SCORE:
+                    break
+    return [Discovery(name, o, b if best_score >= MIN_SCORE else None, best_score)
+            for name, o, b in zip(('MAP_BANKS_OFFSET', 'MAP_NAMES_OFFSET', 'WILD_DATA_OFFSET'), old, best)]
+
+
+def discover_offsets_blocking(rom: Rom, conf: Config, reference: Dataset) -> list[Discovery]:
+    """
+    discover_offsets on an event loop of its own, for running it in an executor. Nothing in it waits on io
+    """
+    return asyncio.run(discover_offsets(rom, conf, reference))
+
+
+async def discover_offsets(rom: Rom, conf: Config, reference: Dataset) -> list[Discovery]:
+    """
+    Where every table in `rom` is, judging by the data in `reference`, which is usually from the release before.
+    Tables the reference can't say anything about are left out
+    """
+    scan = _Scan(rom, conf, reference)
+    results = reference.results
+    boneka = reference.boneka_data[:conf.BONEKA_COUNT]
+    found: list[Optional[Discovery]] = [
+        scan.strings('BONEKA_NAME_OFFSET', dict(enumerate(b.name for b in boneka)), 11),
+        scan.strings('MOVE_NAME_OFFSET', dict(enumerate(results['move_names'][:conf.MOVE_COUNT])), 13),
+        scan.strings('TYPE_NAMES_OFFSET', dict(enumerate(results['type_names'][:conf.TYPE_TABLE_LEN])), 7),
+    ]
+
+    stats = {i: _stat_bytes(b) for i, b in enumerate(boneka)}
+    stats_found = scan.table('BONEKA_STAT_OFFSET', stats, RawBonekaStatData.size, scan.read_bytes(len(stats[0])),
+                             lambda: scan.search(stats, stats.__getitem__, RawBonekaStatData.size))
+    found.append(stats_found)
+    if stats_found is not None and stats_found.new is not None:  # the ability names are only known by their ids
+        found.append(scan.strings('ABILITY_NAME_OFFSET', _ability_names(scan, stats_found.new), 13))
+
+    dex_numbers = {i - 1: b.dex_number for i, b in enumerate(boneka) if i}  # the table starts at boneka 1
+    run = 8  # one dex number is too common to search for on its own
+    found.append(scan.table('DEX_NUMBERS_OFFSET', dex_numbers, 2, scan.read_u16, lambda: scan.search(
+        dex_numbers, lambda row: _u16s(dex_numbers.get(i, 0) for i in range(row, row + run)), 2)))
+
+    dex = {}
+    for b in boneka:
+        if b.dex_data is not None and b.dex_number < conf.DEX_LENGTH:
+            dex.setdefault(b.dex_number, (b.dex_data.species, b.dex_data.dex_entry))
+    found.append(scan.table('DEX_DATA_OFFSET', dex, DexRaw.size, scan.read_dex, lambda: scan.search(
+        dex, lambda row: _string_needle(dex[row][0], 12), DexRaw.size)))
+
+    level_up = results['level_up_moves']
+    learnsets = {i: _u16s(level_up.data[level_up.starts[i]:level_up.starts[i] + level_up.lengths[i]])
+                 for i in range(len(boneka))}
+    found.append(scan.table('LEVEL_UP_MOVE_OFFSET', learnsets, 4, scan.read_learnset, lambda: scan.search(
+        learnsets, lambda row: learnsets[row] + b'\xff\xff' if len(learnsets[row]) >= 8 else b'', 4,
+        locate=scan.pointers_to)))
+
+    found.append(await _type_chart(scan))
+
+    indices = results.get('sprite_indices') or reference.sprite_sheets.indices
+    for name, expected, read, size in (
+            ('SPRITE_OFFSET', indices, scan.read_sprite, SPRITE_BYTES),
+            ('PALETTE_OFFSET', results['palettes'], scan.read_palette, PALETTE_BYTES),
+            ('SHINY_PALETTE_OFFSET', results['shiny_palettes'], scan.read_palette, PALETTE_BYTES)):
+        old = getattr(conf.offsets, name)
+        # row 0 is left out, like the extractors do
+        expected = {i: v for i, v in enumerate(expected[:conf.BONEKA_COUNT]) if i and v is not None}
+        found.append(scan.table(name, expected, 8, read, lambda size=size, old=old: scan.lzss_tables(size, old)))
+
+    found.extend(await _wild(scan))
+    return [d for d in found if d is not None]
@@ -1,58 +1,144 @@
 import io
-from typing import Type, ClassVar, Union, TypeVar
+import mmap
+import os
+import re
+import weakref
+from functools import lru_cache
+from typing import BinaryIO, Type, ClassVar, TypeVar, Optional, Union
 
 from .structs import Struct
 
 
 T = TypeVar('T', bound=Struct)
 
+ROM_START = 0x08000000  # where the cartridge is mapped in the GBA's address space
+ROM_MAX_SIZE = 0x02000000  # 32MiB. 0x09000000-0x09ffffff is the second half, not a mirror of the first
+
+
+class RomAddressError(Exception):
+    pass
+
 
 class Pointer(int):
     """
     Pointer[T]: A generic class for representing pointers to ROM data.
     """
+    __slots__ = ()
+
     type: Type[Struct]
     size: int
     string: ClassVar[str] = 'I'
-
-    def __new__(cls, address: int):
-        obj = super().__new__(cls, address)
-        obj.size = cls.type.size
-        return obj
+    _types: ClassVar[dict[Type[Struct], Type['Pointer']]] = {}
 
     def __add__(self: 'Pointer[T]', other: int) -> 'Pointer[T]':
-        return self.__class__(super().__add__(other * self.size))
+        return self.__class__(int(self) + other * self.size)
 
     def __sub__(self: 'Pointer[T]', other: int) -> 'Pointer[T]':
-        return self.__class__(super().__sub__(other * self.size))
+        return self.__class__(int(self) - other * self.size)
 
     def __repr__(self) -> str:
         return hex(self)
 
     def __class_getitem__(cls, item: Type[Struct]) -> Type:
+        # one class per struct, so Pointer[X] is Pointer[X] and subscripting in a loop doesn't build a class every time
+        try:
+            return cls._types[item]
+        except KeyError:
+            pass
+
         class _Ptr(cls):
+            __slots__ = ()
             type = item
+            size = getattr(item, 'size', 0)  # Pointer[T] in annotations
 
             __class_getitem__ = None
 
         _Ptr.__name__ = f'{cls.__name__}[{item.__name__}]'
         _Ptr.__qualname__ = f'{cls.__qualname__}[{item.__name__}]'
         _Ptr.__doc__ = cls.__doc__
+        cls._types[item] = _Ptr
         return _Ptr
 
 
-class Rom(bytes):
-    def __new__(cls, dat: bytes):
-        return super().__new__(cls, dat)
-
-    def create_stream(self):
-        return io.BytesIO(self)
-
-    def deref(self, ptr: Pointer[T]) -> T:
-        addr = ptr & 0x00ffffff
-        return ptr.type(super().__getitem__(slice(addr, addr + ptr.size)))
-
+@lru_cache
+def _literal(sub: bytes) -> re.Pattern:
+    return re.compile(re.escape(sub))
 
 
+class Rom:
+    """
+    A read only view of a rom. It wraps bytes, an mmap or any other buffer (like a patch's output) without copying
+    it. Indexing and slicing work like they do on bytes
+    """
+    __slots__ = ('data', '_fd', '__weakref__')
+
+    def __init__(self, dat: Union[bytes, memoryview, mmap.mmap], *, fd: Optional[int] = None):
+        self.data = memoryview(dat).toreadonly()
+        self._fd = fd  # the file `dat` is mapped from, if it is
+
+    @classmethod
+    def from_file(cls, path: Union[str, os.PathLike]) -> 'Rom':
+        """
+        Maps a rom file instead of reading it. The pages are shared with the OS file cache and every other process
+        mapping it, and only the ones that get used are ever read
+        """
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            rom = cls(mmap.mmap(fd, 0, access=mmap.ACCESS_READ), fd=fd)
+        except BaseException:
+            os.close(fd)
+            raise
+        weakref.finalize(rom, os.close, fd)
+        return rom
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[int, bytes]:
+        if isinstance(key, slice):
+            return self.data[key].tobytes()
+        return self.data[key]
+
+    def find(self, sub: bytes, start: int = 0, end: Optional[int] = None) -> int:
+        """
+        Like bytes.find. The search runs over the buffer, so nothing is copied
+        """
+        match = _literal(sub).search(self.data, start, len(self.data) if end is None else end)
+        return -1 if match is None else match.start()
+
+    def create_stream(self) -> BinaryIO:
+        """
+        A file object reading the rom, with its own position. A mapped file is mapped again, and bytes are shared
+        with the stream. Anything else is copied into it, since the sprite decoder reads a byte at a time and
+        needs a stream implemented in C
+        """
+        if self._fd is not None:
+            return mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+        return io.BytesIO(self.data.obj if type(self.data.obj) is bytes else self.data)
+
+    def translate(self, address: int, size: int = 1) -> int:
+        """
+        The file offset of a GBA address, checking that `size` bytes from there are in the rom
+        """
+        if not address:
+            raise RomAddressError("Tried to read from a null pointer")
+        offset = int(address) - ROM_START  # Pointer's - counts in structs
+        if not 0 <= offset < ROM_MAX_SIZE:
+            raise RomAddressError(f"{address:#010x} is not a rom address")
+        if offset + size > len(self):
+            raise RomAddressError(f"{address:#010x} (+{size:#x}) is past the end of the rom ({len(self):#x} bytes)")
+        return offset
 
+    def deref(self, ptr: Pointer[T]) -> T:
+        addr = self.translate(ptr, ptr.size)
+        return ptr.type(self[addr:addr + ptr.size])
+
+    def deref_array(self, ptr: Pointer[T], count: int) -> list[T]:
+        """
+        The `count` structs starting at `ptr`. The whole array is checked once instead of per element
+        """
+        size, cls = ptr.size, ptr.type
+        start = self.translate(ptr, size * count)
+        data = self[start:start + size * count]
+        return [cls(data[i:i + size]) for i in range(0, size * count, size)]
 
@@ -0,0 +1,160 @@
+"""
+Base stats, types and abilities of every boneka stored by column, so that queries over all of them are
+vectorized scans instead of Python loops over every Boneka.
+"""
+import operator
+import re
+from typing import Callable, Iterable, Sequence
+
+import numpy as np
+from attr import define
+
+from .stats import Boneka
+
+STAT_COLUMNS = ('hp', 'attack', 'defense', 'sp_atk', 'sp_def', 'speed')
+SORTABLE_COLUMNS = (*STAT_COLUMNS, 'bst')
+
+# what people actually type -> column name
+STAT_ALIASES = {
+    'hp': 'hp',
+    'atk': 'attack', 'attack': 'attack',
+    'def': 'defense', 'defense': 'defense',
+    'spa': 'sp_atk', 'spatk': 'sp_atk', 'sp_atk': 'sp_atk',
+    'spd': 'sp_def', 'spdef': 'sp_def', 'sp_def': 'sp_def',
+    'spe': 'speed', 'speed': 'speed',
+    'bst': 'bst', 'total': 'bst',
+}
+
+OPERATORS: dict[str, Callable[[np.ndarray, int], np.ndarray]] = {
+    '>=': operator.ge, '<=': operator.le, '!=': operator.ne,
+    '>': operator.gt, '<': operator.lt, '=': operator.eq,
+}
+
+_CONDITION = re.compile(r'\s*([a-z_0-9]+)\s*(>=|<=|!=|>|<|=)\s*("[^"]*"|\'[^\']*\'|[^\s"\']+)', re.IGNORECASE)
+
+
+class QueryError(Exception):
+    pass
+
+
+@define
+class StatTable:
+    """
+    Row i is boneka_data[i]. Types and abilities are stored as ids into `type_names` and `ability_names`
+    """
+    names: tuple[str, ...]
+    stats: dict[str, np.ndarray]  # column name -> int32 array, including 'bst'
+    types: np.ndarray  # (2, rows) ids. Each slot is its own contiguous column
+    abilities: np.ndarray  # (2, rows) ids
+    type_names: tuple[str, ...]
+    ability_names: tuple[str, ...]
+    type_ids: dict[str, int]  # lowercase name -> id
+    ability_ids: dict[str, int]
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_columns(cls, names: Sequence[str], stats: dict[str, np.ndarray], types: Sequence[tuple[str, str]],
+                     abilities: Sequence[tuple[str, str]]) -> 'StatTable':
+        type_names, type_array = _encode(types)
+        ability_names, ability_array = _encode(abilities)
+        stats = {column: np.asarray(stats[column], dtype=np.int32) for column in STAT_COLUMNS}
+        stats['bst'] = sum(stats[column] for column in STAT_COLUMNS)
+        return cls(tuple(names), stats, type_array, ability_array, type_names, ability_names,
+                   {name.lower(): i for i, name in enumerate(type_names)},
+                   {name.lower(): i for i, name in enumerate(ability_names)})
+
+    @classmethod
+    def from_boneka(cls, boneka: Iterable[Boneka]) -> 'StatTable':
+        boneka = tuple(boneka)
+        stats = {column: np.fromiter((getattr(b.stats, column) for b in boneka), dtype=np.int32, count=len(boneka))
+                 for column in STAT_COLUMNS}
+        return cls.from_columns([b.name for b in boneka], stats,
+                                [(b.stats.type_1, b.stats.type_2) for b in boneka],
+                                [(b.stats.ability_1, b.stats.ability_2) for b in boneka])
+
+    def mask(self, query: str) -> np.ndarray:
+        """
+        Parses a query like 'speed>100 type=Fire' into a mask of the rows that match all of its conditions
+        """
+        mask = np.ones(len(self), dtype=bool)
+        pos = 0
+        query = query.strip()
+        while pos < len(query):
+            match = _CONDITION.match(query, pos)
+            if match is None:
+                raise QueryError(f"Could not understand {query[pos:].split()[0]!r}")
+            field, op, value = match.groups()
+            mask &= self.condition(field.lower(), op, value.strip('"\''))
+            pos = match.end()
+            while pos < len(query) and query[pos] in ' ,':
+                pos += 1
+        return mask
+
+    def condition(self, field: str, op: str, value: str) -> np.ndarray:
+        if field in ('type', 'ability'):
+            if op not in ('=', '!='):
+                raise QueryError(f"{field} can only be compared with '=' or '!='")
+            ids, columns = (self.type_ids, self.types) if field == 'type' else (self.ability_ids, self.abilities)
+            try:
+                id_ = ids[value.lower()]
+            except KeyError:
+                raise QueryError(f"There is no {field} called {value!r}") from None
+            has = (columns[0] == id_) | (columns[1] == id_)
+            return has if op == '=' else ~has
+
+        try:
+            column = self.stats[STAT_ALIASES[field]]
+        except KeyError:
+            raise QueryError(f"Unknown stat {field!r}") from None
+        try:
+            number = int(value)
+        except ValueError:
+            raise QueryError(f"{value!r} is not a number") from None
+        return OPERATORS[op](column, number)
+
+    def filter(self, query: str, start: int = 0, count: int = None) -> tuple[np.ndarray, int]:
+        """
+        Indices of the rows matching `query` in table order, sliced to [start:start + count],
+        and how many rows matched in total
+        """
+        rows = np.flatnonzero(self.mask(query))
+        end = None if count is None else start + count
+        return rows[start:end], len(rows)
+
+    def top(self, stat: str, start: int = 0, count: int = 10) -> np.ndarray:
+        """
+        Indices of the rows with the highest `stat`, ranked [start:start + count]. Ties keep table order
+        """
+        try:
+            column = self.stats[STAT_ALIASES[stat.lower()]]
+        except KeyError:
+            raise QueryError(f"Unknown stat {stat!r}") from None
+        end = min(start + count, len(column))
+        if start >= end:
+            return np.empty(0, dtype=np.intp)
+        keys = -column.astype(np.int64)
+        if end < len(column) // 8:  # only the top few are needed, so don't sort the whole column
+            kth = np.partition(keys, end - 1)[end - 1]
+            candidates = np.flatnonzero(keys <= kth)  # everything that can make the cut, ties included
+            ranked = candidates[np.argsort(keys[candidates], kind='stable')][:end]
+        else:
+            ranked = np.argsort(keys, kind='stable')[:end]
+        return ranked[start:end]
+
+    def row_types(self, row: int) -> tuple[str, ...]:
+        return tuple(dict.fromkeys(self.type_names[i] for i in self.types[:, row]))
+
+    def row_stats(self, row: int) -> dict[str, int]:
+        return {column: int(values[row]) for column, values in self.stats.items()}
+
+
+def _encode(pairs: Sequence[tuple[str, str]]) -> tuple[tuple[str, ...], np.ndarray]:
+    """
+    Turns (name, name) pairs into a tuple of the distinct names and an array of ids into it
+    """
+    ids: dict[str, int] = {}
+    array = np.fromiter((ids.setdefault(name, len(ids)) for pair in pairs for name in pair), dtype=np.uint16,
+                        count=2 * len(pairs)).reshape(-1, 2).T.copy()
+    return tuple(ids), array
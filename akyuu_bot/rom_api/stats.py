@@ -1,13 +1,17 @@
-import asyncio
-from typing import Generator, Optional
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import Iterable, Iterator, Optional, Union
+
+from attr import evolve
 
 from .text_decode import text_decode
 
 from .rom import Pointer, Rom
-from .sprite_png import get_sprite_data
+from .sprite_png import decode_palette, decode_sprite, encode_sprite, SpriteSheets
 from .struct_annotations import *
 from .structs import Struct, StructMeta
-from ..config import config, data_json
+from ..config import Config, Jsonable, data_json
 
 
 class SpriteData(Struct, metaclass=StructMeta):
@@ -19,19 +23,49 @@ class SpriteData(Struct, metaclass=StructMeta):
 SpriteDataPtr = Pointer[SpriteData]
 
 
-async def get_all_sprite_data(rom: Rom) -> tuple[Optional[bytes]]:
+async def get_all_sprite_indices(rom: Rom, conf: Config) -> tuple[Optional[bytes], ...]:
+    """
+    Every sprite decompressed into palette indices, one byte per pixel. Sprites that share data are decoded once
+    """
+    stream = rom.create_stream()
+    indices = [None]  # exclude decamark because it causes palette issues
+    decoded: dict[int, bytes] = {}
+
+    for sprite_dat in rom.deref_array(SpriteDataPtr(conf.offsets.SPRITE_OFFSET), conf.BONEKA_COUNT)[1:]:
+        if sprite_dat.ptr not in decoded:
+            rom.translate(sprite_dat.ptr)  # the size isn't known until it's decompressed, but catch junk pointers
+            decoded[sprite_dat.ptr] = decode_sprite(stream, sprite_dat.ptr)
+        indices.append(decoded[sprite_dat.ptr])
+    return tuple(indices)
+
+
+def read_palettes(rom: Rom, offset: int, count: int) -> tuple[Optional[bytes], ...]:
     stream = rom.create_stream()
-    sprites = [None]
+    palettes = [None]
+    for pal_dat in rom.deref_array(SpriteDataPtr(offset), count)[1:]:
+        rom.translate(pal_dat.ptr)
+        palettes.append(decode_palette(stream, pal_dat.ptr))
+    return tuple(palettes)
+
+
+async def get_all_palettes(rom: Rom, conf: Config) -> tuple[Optional[bytes], ...]:
+    return read_palettes(rom, conf.offsets.PALETTE_OFFSET, conf.BONEKA_COUNT)
+
+
+async def get_all_shiny_palettes(rom: Rom, conf: Config) -> tuple[Optional[bytes], ...]:
+    return read_palettes(rom, conf.offsets.SHINY_PALETTE_OFFSET, conf.BONEKA_COUNT)
 
-    for i in range(1, config.BONEKA_COUNT):  # exclude decamark because it causes palette issues
 
-        sprite_ptr = SpriteDataPtr(config.offsets.SPRITE_OFFSET) + i
-        sprite_dat = rom.deref(sprite_ptr)
-        pal_ptr = SpriteDataPtr(config.offsets.PALETTE_OFFSET) + i
-        pal_dat = rom.deref(pal_ptr)
-        sprites.append(get_sprite_data(stream, sprite_dat.ptr, pal_dat.ptr))
+async def get_all_sprite_data(rom: Rom, conf: Config, indices: tuple[Optional[bytes], ...],
+                              palettes: tuple[Optional[bytes], ...]) -> tuple[Optional[bytes], ...]:
+    return tuple(None if sprite is None else encode_sprite(sprite, palette, conf.SPRITE_SCALE, conf.SPRITE_FORMAT)
+                 for sprite, palette in zip(indices, palettes))
 
-    return tuple(sprites)
+
+async def get_sprite_sheets(rom: Rom, conf: Config, indices: tuple[Optional[bytes], ...],
+                            palettes: tuple[Optional[bytes], ...],
+                            shiny_palettes: tuple[Optional[bytes], ...]) -> SpriteSheets:
+    return SpriteSheets(indices, palettes, shiny_palettes)
 
 
 class RawBonekaStatData(Struct, metaclass=StructMeta):
@@ -61,28 +95,27 @@ class RawBonekaStatData(Struct, metaclass=StructMeta):
     padding: u16
 
 
-async def get_all_boneka_stats(rom: Rom) -> tuple[RawBonekaStatData, ...]:
-    ptr = Pointer[RawBonekaStatData](config.offsets.BONEKA_STAT_OFFSET)
-    return tuple(rom.deref(ptr + i) for i in range(config.BONEKA_COUNT))
+async def get_all_boneka_stats(rom: Rom, conf: Config) -> tuple[RawBonekaStatData, ...]:
+    ptr = Pointer[RawBonekaStatData](conf.offsets.BONEKA_STAT_OFFSET)
+    return tuple(rom.deref_array(ptr, conf.BONEKA_COUNT))
 
 
 class RawBonekaName(Struct, metaclass=StructMeta):
     name: byte[11]
 
 
-async def get_all_boneka_names(rom: Rom) -> tuple[str, ...]:
-    ptr = Pointer[RawBonekaName](config.offsets.BONEKA_NAME_OFFSET)
-    raw_dat_iter = (rom.deref(ptr + i) for i in range(config.BONEKA_COUNT))
-    return tuple(text_decode(i.name) for i in raw_dat_iter)
+async def get_all_boneka_names(rom: Rom, conf: Config) -> tuple[str, ...]:
+    ptr = Pointer[RawBonekaName](conf.offsets.BONEKA_NAME_OFFSET)
+    return tuple(text_decode(i.name) for i in rom.deref_array(ptr, conf.BONEKA_COUNT))
 
 
 class RawLevelUpMoveName(Struct, metaclass=StructMeta):
     name: byte[13]
 
 
-async def get_all_move_names(rom: Rom) -> tuple[str, ...]:
-    ptr = Pointer[RawLevelUpMoveName](config.offsets.MOVE_NAME_OFFSET)
-    return tuple(text_decode(rom.deref(ptr + i).name) for i in range(config.MOVE_COUNT))
+async def get_all_move_names(rom: Rom, conf: Config) -> tuple[str, ...]:
+    ptr = Pointer[RawLevelUpMoveName](conf.offsets.MOVE_NAME_OFFSET)
+    return tuple(text_decode(i.name) for i in rom.deref_array(ptr, conf.MOVE_COUNT))
 
 
 class RawLevelUpMove(Struct, metaclass=StructMeta):
@@ -93,7 +126,7 @@ class LevelUpMovePtrStruct(Struct, metaclass=StructMeta):
     ptr: Pointer[RawLevelUpMove]
 
 
-@data_json
+@data_json(frozen=True)
 class LevelUpMove:
     move: str
     level: int
@@ -105,22 +138,139 @@ def unpack_level_up_move(move_data: int) -> tuple[int, int]:
     return move, level
 
 
-RawMovePtr = Pointer[RawLevelUpMove]
+def pack_level_up_move(move: int, level: int) -> int:
+    return move | level << 9
 
 
-def process_move_array(rom, ptr: RawMovePtr, names: tuple[str]) -> Generator[LevelUpMove, None, None]:
-    while (move_data := rom.deref(ptr).data) != 0xFFFF:
-        move, level = unpack_level_up_move(move_data)
-        ptr += 1
-        yield LevelUpMove(move=names[move], level=level)
+class LevelUpMoves(Sequence):
+    """
+    A read only view of one boneka's learnset. The moves are packed u16s (like in the rom) indexing into
+    a shared move name table, and only become LevelUpMove objects when they're accessed
+    """
+    __slots__ = ('_entries', '_names')
 
+    def __init__(self, entries: Union[memoryview, array], names: tuple[str, ...]):
+        self._entries = entries
+        self._names = names
 
-async def get_all_level_up_moves(rom: Rom, names: tuple[str]) -> tuple[tuple[LevelUpMove], ...]:
-    ptr = Pointer[LevelUpMovePtrStruct](config.offsets.LEVEL_UP_MOVE_OFFSET)
-    move_array_ptrs = (RawMovePtr(rom.deref(ptr + i).ptr) for i in
-                       range(0, config.BONEKA_COUNT))
+    @classmethod
+    def from_moves(cls, moves: Iterable[LevelUpMove]) -> 'LevelUpMoves':
+        """
+        A learnset with its own name table. Used when there's no packed table to view into, like when loading json
+        """
+        ids: dict[str, int] = {}
+        entries = array('H', (pack_level_up_move(ids.setdefault(sys.intern(m.move), len(ids)), m.level)
+                              for m in moves))
+        return cls(entries, tuple(ids))
+
+    @property
+    def move_ids(self) -> Iterator[int]:
+        """
+        The ids of the moves into the name table
+        """
+        return (entry & 0b00000001_11111111 for entry in self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return tuple(self)[item]
+        move, level = unpack_level_up_move(self._entries[item])
+        return LevelUpMove(self._names[move], level)
+
+    def __iter__(self) -> Iterator[LevelUpMove]:
+        names = self._names
+        for entry in self._entries:
+            move, level = unpack_level_up_move(entry)
+            yield LevelUpMove(names[move], level)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return f'LevelUpMoves({list(self)!r})'
+
+
+# json only knows about the moves, not the packing
+Jsonable.converter.register_unstructure_hook(
+    LevelUpMoves, lambda moves: [{'move': m.move, 'level': m.level} for m in moves])
+Jsonable.converter.register_structure_hook(
+    LevelUpMoves, lambda data, _: LevelUpMoves.from_moves(LevelUpMove(**m) for m in data))
+
+
+class Learnsets:
+    """
+    Every boneka's learnset packed into a single u16 array, with each one's (start, length) in it.
+    Indexing gives LevelUpMoves views into it
+    """
+    __slots__ = ('data', 'starts', 'lengths', 'move_names')
+
+    def __init__(self, data: array, starts: array, lengths: array, move_names: tuple[str, ...]):
+        self.data = data
+        self.starts = starts
+        self.lengths = lengths
+        self.move_names = move_names
 
-    return tuple(tuple(process_move_array(rom, ptr, names)) for ptr in move_array_ptrs)
+    @classmethod
+    def pack(cls, learnsets: Iterable[Iterable[LevelUpMove]], move_names: tuple[str, ...]) -> 'Learnsets':
+        """
+        Packs learnsets that only know move names. Moves that share a name get the first id with that name
+        """
+        ids: dict[str, int] = {}
+        for i, name in enumerate(move_names):
+            ids.setdefault(name, i)
+        data, starts, lengths = array('H'), array('I'), array('H')
+        for learnset in learnsets:
+            starts.append(len(data))
+            data.extend(pack_level_up_move(ids[m.move], m.level) for m in learnset)
+            lengths.append(len(data) - starts[-1])
+        return cls(data, starts, lengths, move_names)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> LevelUpMoves:
+        start = self.starts[i]
+        return LevelUpMoves(memoryview(self.data)[start:start + self.lengths[i]], self.move_names)
+
+    def __iter__(self) -> Iterator[LevelUpMoves]:
+        return (self[i] for i in range(len(self)))
+
+
+def find_u16_terminator(rom: Rom, start: int, terminator: bytes = b'\xff\xff') -> int:
+    """
+    The offset of the first u16 equal to `terminator` in the array at `start`
+    """
+    pos = start
+    while (pos := rom.find(terminator, pos)) != -1:
+        if (pos - start) % 2 == 0:
+            return pos
+        pos += 1  # straddles two entries
+    raise ValueError(f"u16 array at {start:#x} is never terminated")
+
+
+async def get_all_level_up_moves(rom: Rom, conf: Config, names: tuple[str]) -> Learnsets:
+    ptr = Pointer[LevelUpMovePtrStruct](conf.offsets.LEVEL_UP_MOVE_OFFSET)
+    data, starts, lengths = array('H'), array('I'), array('H')
+    for learnset_ptr in rom.deref_array(ptr, conf.BONEKA_COUNT):
+        start = rom.translate(learnset_ptr.ptr)
+        end = find_u16_terminator(rom, start)
+        starts.append(len(data))
+        data.frombytes(rom[start:end])
+        lengths.append(len(data) - starts[-1])
+    if sys.byteorder == 'big':  # the rom is little endian
+        data.byteswap()
+
+    # fail here instead of on the first command that views a bad move
+    if data and (bad := max(entry & 0b00000001_11111111 for entry in data)) >= len(names):
+        raise IndexError(f"Learnsets use move {bad}, but there are only {len(names)} move names")
+    return Learnsets(data, starts, lengths, names)
 
 
 class RawDexText(Struct, metaclass=StructMeta):
@@ -145,15 +295,15 @@ class DexRaw(Struct, metaclass=StructMeta):
     unused_: u16
 
 
-@data_json
+@data_json(frozen=True)
 class BonekaDexData:
     species: str
     dex_entry: str
 
 
-async def get_all_dex_entries(rom: Rom) -> tuple[BonekaDexData, ...]:
-    ptr = Pointer[DexRaw](config.offsets.DEX_DATA_OFFSET)
-    raw_iter = (rom.deref(ptr + i) for i in range(config.DEX_LENGTH))
+async def get_all_dex_entries(rom: Rom, conf: Config) -> tuple[BonekaDexData, ...]:
+    ptr = Pointer[DexRaw](conf.offsets.DEX_DATA_OFFSET)
+    raw_iter = rom.deref_array(ptr, conf.DEX_LENGTH)
 
     return tuple(
         BonekaDexData(
@@ -162,21 +312,55 @@ async def get_all_dex_entries(rom: Rom) -> tuple[BonekaDexData, ...]:
         for raw in raw_iter)
 
 
-async def get_all_ability_names(rom: Rom) -> tuple[str, ...]:
-    ptr = Pointer[RawLevelUpMoveName](config.offsets.ABILITY_NAME_OFFSET)
-    return tuple(text_decode(rom.deref(ptr + i).name) for i in range(config.ABILITY_TABLE_LEN))
+async def get_all_ability_names(rom: Rom, conf: Config) -> tuple[str, ...]:
+    ptr = Pointer[RawLevelUpMoveName](conf.offsets.ABILITY_NAME_OFFSET)
+    return tuple(text_decode(i.name) for i in rom.deref_array(ptr, conf.ABILITY_TABLE_LEN))
 
 
 class TypeName(Struct, metaclass=StructMeta):
     name: byte[7]
 
 
-async def get_all_type_names(rom: Rom) -> tuple[str, ...]:
-    ptr = Pointer[TypeName](config.offsets.TYPE_NAMES_OFFSET)
-    return tuple(text_decode(rom.deref(ptr + i).name) for i in range(config.TYPE_TABLE_LEN))
+async def get_all_type_names(rom: Rom, conf: Config) -> tuple[str, ...]:
+    ptr = Pointer[TypeName](conf.offsets.TYPE_NAMES_OFFSET)
+    return tuple(text_decode(i.name) for i in rom.deref_array(ptr, conf.TYPE_TABLE_LEN))
+
+
+class TypeEffectiveness(Struct, metaclass=StructMeta):
+    attacker: u8
+    defender: u8
+    multiplier: u8  # x10. 0, 5 or 20
+
+
+TYPE_FORESIGHT = 0xFE  # the matchups after this one are the ones Foresight ignores. They still count
+TYPE_ENDTABLE = 0xFF
+
+
+async def get_type_effectiveness(rom: Rom, conf: Config) -> tuple[tuple[float, ...], ...]:
+    """
+    The type chart as rows of multipliers, indexed [attacking type][defending type]. Matchups that aren't
+    in the rom's table are neutral
+    """
+    count = conf.TYPE_TABLE_LEN
+    chart = [[1.0] * count for _ in range(count)]
+    size = TypeEffectiveness.size
+    start = rom.translate(conf.offsets.TYPE_EFFECTIVENESS_OFFSET, size)
+    # the length isn't known until the terminator, so read the most it could be at once (+1 for the foresight
+    # separator), or up to the end of the rom
+    length = min(size * (count * count + 1), (len(rom) - start) // size * size)
+    for attacker, defender, multiplier in TypeEffectiveness._struct.iter_unpack(rom[start:start + length]):
+        if attacker == TYPE_ENDTABLE:
+            return tuple(map(tuple, chart))
+        if attacker == TYPE_FORESIGHT:
+            continue
+        if attacker >= count or defender >= count:
+            raise IndexError(f"Type chart has a matchup of types {attacker} and {defender}, "
+                             f"but there are only {count} types")
+        chart[attacker][defender] = multiplier / 10
+    raise ValueError(f"Type chart at {conf.offsets.TYPE_EFFECTIVENESS_OFFSET:#x} is never terminated")
 
 
-@data_json
+@data_json(frozen=True)
 class BonekaStatData:
     hp: int
     attack: int
@@ -203,23 +387,23 @@ class DexNumber(Struct, metaclass=StructMeta):
     number: u16
 
 
-async def get_all_dex_numbers(rom: Rom) -> tuple[int, ...]:
-    ptr = Pointer[DexNumber](config.offsets.DEX_NUMBERS_OFFSET)
-    return tuple(rom.deref(ptr + i).number for i in range(config.BONEKA_COUNT))
+async def get_all_dex_numbers(rom: Rom, conf: Config) -> tuple[int, ...]:
+    ptr = Pointer[DexNumber](conf.offsets.DEX_NUMBERS_OFFSET)
+    return tuple(i.number for i in rom.deref_array(ptr, conf.BONEKA_COUNT))
 
 
-@data_json
+@data_json(frozen=True)
 class Boneka:
     name: str
     stats: BonekaStatData
-    level_up_moves: tuple[LevelUpMove, ...]  # [LevelUpMove]
+    level_up_moves: LevelUpMoves
     sprite: Optional[bytes]
     dex_number: int
     dex_data: Optional[BonekaDexData] = None
 
 
 def convert_boneka_data(names: tuple[str, ...], stats: tuple[RawBonekaStatData, ...],
-                        level_up: tuple[tuple[LevelUpMove], ...],
+                        level_up: Learnsets,
                         sprites: tuple[bytes, ...], dex_numbers: tuple[int, ...],
                         ability_names: tuple[str, ...], type_names: tuple[str, ...]) -> tuple[Boneka]:
     data = zip(names, (BonekaStatData.from_raw(raw, type_names, ability_names) for raw in stats), level_up,
@@ -228,24 +412,11 @@ def convert_boneka_data(names: tuple[str, ...], stats: tuple[RawBonekaStatData,
     return tuple(Boneka(*dat) for dat in data)
 
 
-async def get_all_boneka_data(rom: Rom) -> tuple[Boneka, ...]:
-    move_names, ability_names, type_names, dex_data = await asyncio.gather(get_all_move_names(rom),
-                                                                           get_all_ability_names(rom),
-                                                                           get_all_type_names(rom),
-                                                                           get_all_dex_entries(rom))
-    results = await asyncio.gather(
-        get_all_boneka_names(rom),
-        get_all_boneka_stats(rom),
-        get_all_level_up_moves(rom, move_names),
-
-        # get_all_dex_entries(rom),
-        get_all_sprite_data(rom),
-        get_all_dex_numbers(rom)
-    )
-    dat = convert_boneka_data(*results, ability_names, type_names)
-    for boneka in dat:
-        try:
-            boneka.dex_data = dex_data[boneka.dex_number]
-        except IndexError:
-            pass
-    return dat
+async def assemble_boneka_data(rom: Rom, conf: Config, names: tuple[str, ...],
+                               stats: tuple[RawBonekaStatData, ...], level_up: Learnsets,
+                               sprites: tuple[bytes, ...], dex_numbers: tuple[int, ...],
+                               ability_names: tuple[str, ...], type_names: tuple[str, ...],
+                               dex_data: tuple[BonekaDexData, ...]) -> tuple[Boneka, ...]:
+    dat = convert_boneka_data(names, stats, level_up, sprites, dex_numbers, ability_names, type_names)
+    return tuple(evolve(boneka, dex_data=dex_data[boneka.dex_number]) if boneka.dex_number < len(dex_data)
+                 else boneka for boneka in dat)
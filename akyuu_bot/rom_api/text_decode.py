@@ -31,4 +31,28 @@ text_decode_table = [b' ', b'\xc3\x80', b'\xc3\x81', b'\xc3\x82', b'\xc3\x87', b
 
 
 def text_decode(text: bytes) -> str:
-    return ''.join([text_decode_table[i].decode() for i in text.split(b'\xFF')[0]])
\ No newline at end of file
+    return ''.join([text_decode_table[i].decode() for i in text.split(b'\xFF')[0]])
+
+
+_text_encode_table: dict[str, int] = {}
+for _code, _char in enumerate(text_decode_table):
+    if _char != b'\x00':
+        _text_encode_table.setdefault(_char.decode(), _code)  # the first code wins when two look the same
+_LONGEST_CHAR = max(map(len, _text_encode_table))  # escapes like \\btn are more than one character
+
+
+def text_encode(text: str) -> bytes:
+    """
+    The reverse of text_decode, without the 0xFF terminator. Raises ValueError if the charset can't show `text`
+    """
+    out = bytearray()
+    i = 0
+    while i < len(text):
+        for size in range(min(_LONGEST_CHAR, len(text) - i), 0, -1):
+            if (code := _text_encode_table.get(text[i:i + size])) is not None:
+                out.append(code)
+                i += size
+                break
+        else:
+            raise ValueError(f"{text[i]!r} is not in the charset")
+    return bytes(out)
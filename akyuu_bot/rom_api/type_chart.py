@@ -0,0 +1,73 @@
+"""
+The type chart as a matrix, and what every boneka takes from each attacking type as rows of a second matrix,
+so weaknesses and team coverage are array operations instead of loops over types.
+"""
+from typing import Iterable, Sequence
+
+import numpy as np
+from attr import define
+
+from .stats import Boneka
+
+
+@define
+class TeamCoverage:
+    """
+    Column i is type_names[i]
+    """
+    weak: np.ndarray  # how many of the team take more than x1 from the type
+    resist: np.ndarray  # how many take less than x1, immunities included
+    immune: np.ndarray
+    best_attack: np.ndarray  # the best multiplier the team's own types get against the type
+
+
+@define
+class TypeChart:
+    """
+    Row i of `defense` is boneka_data[i]
+    """
+    type_names: tuple[str, ...]
+    multipliers: np.ndarray  # (attacking type, defending type) float32
+    types: np.ndarray  # (boneka, 2) type ids. Both slots are the same type for single typed boneka
+    defense: np.ndarray  # (boneka, attacking type) the multiplier each boneka takes from each type
+    type_ids: dict[str, int]  # lowercase name -> id
+
+    @classmethod
+    def from_boneka(cls, chart: Sequence[Sequence[float]], type_names: Sequence[str],
+                    boneka: Iterable[Boneka]) -> 'TypeChart':
+        multipliers = np.asarray(chart, dtype=np.float32)
+        type_ids: dict[str, int] = {}
+        for i, name in enumerate(type_names):
+            type_ids.setdefault(name.lower(), i)
+        types = np.array([(type_ids[b.stats.type_1.lower()], type_ids[b.stats.type_2.lower()]) for b in boneka],
+                         dtype=np.intp).reshape(-1, 2)
+        second = np.where((types[:, 0] == types[:, 1])[:, None], np.float32(1), multipliers[:, types[:, 1]].T)
+        return cls(tuple(type_names), multipliers, types, multipliers[:, types[:, 0]].T * second, type_ids)
+
+    @property
+    def shown_types(self) -> np.ndarray:
+        """
+        The ids of the types that matter. Types like ??? that are neutral to everything are left out
+        """
+        return np.flatnonzero((self.multipliers != 1).any(axis=0) | (self.multipliers != 1).any(axis=1))
+
+    def weaknesses(self, row: int) -> dict[float, list[str]]:
+        """
+        The attacking types that aren't neutral against boneka `row`, by multiplier from highest to lowest
+        """
+        taken = self.defense[row]
+        groups: dict[float, list[str]] = {}
+        for multiplier in np.unique(taken)[::-1]:
+            if multiplier != 1:
+                groups[float(multiplier)] = [self.type_names[i] for i in np.flatnonzero(taken == multiplier)]
+        return groups
+
+    def coverage(self, rows: Sequence[int]) -> TeamCoverage:
+        """
+        How the boneka in `rows` hold up against each attacking type, and how hard their own types hit each type
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        taken = self.defense[rows]
+        attack_types = np.unique(self.types[rows])
+        return TeamCoverage((taken > 1).sum(axis=0), (taken < 1).sum(axis=0), (taken == 0).sum(axis=0),
+                            self.multipliers[attack_types].max(axis=0))
@@ -1,12 +1,12 @@
 import asyncio
 from typing import Optional
 
-from .rom import Pointer, Rom
+from .rom import Pointer, Rom, RomAddressError
 from .stats import Boneka
 from .struct_annotations import *
 from .structs import Struct, StructMeta
 from .text_decode import text_decode
-from ..config import config, data_json
+from ..config import Config, data_json
 
 
 class MapHeader(Struct, metaclass=StructMeta):
@@ -38,16 +38,30 @@ class Bank(Struct, metaclass=StructMeta):  # map bank is an array of pointers to
 BankPtr = Pointer[Bank]
 
 
-async def get_bank_data(rom: Rom, bank: BankPtr) -> list[MapHeader]:
-    ptr = Pointer[MapHeaderPtr](rom.deref(bank).ptr)
+MapHeaderPtrPtr = Pointer[MapHeaderPtr]
+
+
+async def get_bank_data(rom: Rom, maps: MapHeaderPtrPtr) -> list[MapHeader]:
+    """
+    `maps` is the bank's array of map header pointers, which ends at 0xF7F7F7F7
+    """
+    start = rom.translate(maps)
     headers: list[MapHeader] = []
-    while (header_ptr := rom.deref(ptr).ptr) != 0xF7F7F7F7:
-        headers.append(
-            rom.deref(header_ptr_t(header_ptr))
-        )
-        ptr += 1
+    for offset in range(start, len(rom) - 3, MapHeaderPtr.size):
+        header_ptr = int.from_bytes(rom[offset:offset + 4], 'little')
+        if header_ptr == 0xF7F7F7F7:
+            return headers
+        headers.append(rom.deref(header_ptr_t(header_ptr)))
+    raise RomAddressError(f"Map bank at {int(maps):#010x} runs off the end of the rom")
+
 
-    return headers
+async def get_all_map_headers(rom: Rom, conf: Config) -> tuple[tuple[MapHeader, ...], ...]:
+    """
+    Every map header, indexed by [bank][map]
+    """
+    ptr = BankPtr(conf.offsets.MAP_BANKS_OFFSET)
+    return tuple([tuple(await get_bank_data(rom, MapHeaderPtrPtr(bank.ptr)))
+                  for bank in rom.deref_array(ptr, conf.MAP_BANK_COUNT)])
 
 
 class RawMapName(Struct, metaclass=StructMeta):
@@ -61,9 +75,9 @@ class MapNamePtr(Struct, metaclass=StructMeta):
 RawMapNameP = Pointer[RawMapName]
 
 
-async def get_all_map_names(rom: Rom) -> tuple[str, ...]:
-    ptr = Pointer[MapNamePtr](config.offsets.MAP_NAMES_OFFSET)
-    name_ptrs = (RawMapNameP(rom.deref(ptr + i).ptr) for i in range(config.NUM_MAP_NAMES))
+async def get_all_map_names(rom: Rom, conf: Config) -> tuple[str, ...]:
+    ptr = Pointer[MapNamePtr](conf.offsets.MAP_NAMES_OFFSET)
+    name_ptrs = (RawMapNameP(i.ptr) for i in rom.deref_array(ptr, conf.NUM_MAP_NAMES))
     return tuple(
         text_decode(rom.deref(p).name) for p in name_ptrs
     )
@@ -85,7 +99,7 @@ class RawWildEncounterDataPtrData(Struct, metaclass=StructMeta):
 RawWildPtr = Pointer[RawWildEncounterData]
 
 
-@data_json
+@data_json(frozen=True)
 class WildEncounterData:
     boneka: str
     low: int
@@ -105,41 +119,65 @@ class RawWildLocation(Struct, metaclass=StructMeta):
 RawWildEncounterDataPtrDataPtr = Pointer[RawWildEncounterDataPtrData]
 
 
-@data_json
+@data_json(frozen=True)
 class WildLocation:
     name: Optional[str]
-    grass: Optional[tuple[WildEncounterData]]
-    surf: Optional[tuple[WildEncounterData]]
-    tree: Optional[tuple[WildEncounterData]]
-    fish: Optional[tuple[WildEncounterData]]
+    grass: Optional[tuple[WildEncounterData, ...]]
+    surf: Optional[tuple[WildEncounterData, ...]]
+    tree: Optional[tuple[WildEncounterData, ...]]
+    fish: Optional[tuple[WildEncounterData, ...]]
 
 
-async def get_header_from_bank_and_id(rom: Rom, bank: int, map_: int) -> MapHeader:
-    ptr = Pointer[Bank](config.offsets.MAP_BANKS_OFFSET) + bank
-    header_ptr_ptr = Pointer[MapHeaderPtr](rom.deref(ptr).ptr) + map_
+async def get_header_from_bank_and_id(rom: Rom, conf: Config, bank: int, map_: int) -> MapHeader:
+    ptr = BankPtr(conf.offsets.MAP_BANKS_OFFSET) + bank
+    header_ptr_ptr = MapHeaderPtrPtr(rom.deref(ptr).ptr) + map_
     header_ptr = header_ptr_t(rom.deref(header_ptr_ptr).ptr)
     header = rom.deref(header_ptr)
     return header
 
 
-async def parse_raw_wild_location(rom: Rom, loc: RawWildLocation, loc_names: tuple[str],
-                                  boneka: tuple[Boneka]) -> WildLocation:
-    header = await get_header_from_bank_and_id(rom, loc.bank, loc.map)
-    name_index = header.region_map_section_id - config.MAPSECS_KANTO
+EncounterTables = dict[tuple[int, int], tuple[WildEncounterData, ...]]  # (table address, slots) -> decoded table
+
+
+async def parse_raw_wild_location(rom: Rom, conf: Config, loc: RawWildLocation, loc_names: tuple[str],
+                                  boneka: tuple[Boneka], headers: Optional[tuple[tuple[MapHeader, ...], ...]] = None,
+                                  tables: Optional[EncounterTables] = None) -> WildLocation:
+    """
+    `headers` is the table from get_all_map_headers and `tables` is shared between calls,
+    so tables that multiple locations use are only decoded once. Both are optional
+    """
+    try:
+        header = headers[loc.bank][loc.map]
+    except (TypeError, IndexError):  # no table, or the map is past the end of its bank
+        header = await get_header_from_bank_and_id(rom, conf, loc.bank, loc.map)
+    name_index = header.region_map_section_id - conf.MAPSECS_KANTO
     try:
         name = loc_names[name_index]
     except IndexError:
         name = None
     # parse grass, surf, tree, fish data
-    grass = await parse_grass_encounter_ptr(rom, RawWildEncounterDataPtrDataPtr(loc.grass), boneka)
-    surf = await parse_surf_encounter_ptr(rom, RawWildEncounterDataPtrDataPtr(loc.surf), boneka)
-    tree = await parse_tree_encounter_ptr(rom, RawWildEncounterDataPtrDataPtr(loc.tree), boneka)
-    fish = await parse_fish_encounter_ptr(rom, RawWildEncounterDataPtrDataPtr(loc.fish), boneka)
+    grass = await parse_grass_encounter_ptr(rom, conf, RawWildEncounterDataPtrDataPtr(loc.grass), boneka, tables)
+    surf = await parse_surf_encounter_ptr(rom, conf, RawWildEncounterDataPtrDataPtr(loc.surf), boneka, tables)
+    tree = await parse_tree_encounter_ptr(rom, conf, RawWildEncounterDataPtrDataPtr(loc.tree), boneka, tables)
+    fish = await parse_fish_encounter_ptr(rom, conf, RawWildEncounterDataPtrDataPtr(loc.fish), boneka, tables)
     return WildLocation(name, grass, surf, tree, fish)
 
 
-async def parse_grass_encounter_ptr(rom: Rom, wild_data_ptr_ptr: Pointer[RawWildEncounterDataPtrData],
-                                    boneka: tuple[Boneka, ...]) -> Optional[tuple[WildEncounterData, ...]]:
+def parse_encounter_table(rom: Rom, wild_data_ptr: RawWildPtr, slots: int, boneka: tuple[Boneka, ...],
+                          tables: Optional[EncounterTables] = None) -> tuple[WildEncounterData, ...]:
+    key = (int(wild_data_ptr), slots)
+    if tables is not None and key in tables:
+        return tables[key]
+    table = tuple(WildEncounterData(boneka[raw.boneka].name, raw.low, raw.high)
+                  for raw in rom.deref_array(wild_data_ptr, slots))
+    if tables is not None:
+        tables[key] = table
+    return table
+
+
+async def parse_grass_encounter_ptr(rom: Rom, conf: Config, wild_data_ptr_ptr: Pointer[RawWildEncounterDataPtrData],
+                                    boneka: tuple[Boneka, ...], tables: Optional[EncounterTables] = None
+                                    ) -> Optional[tuple[WildEncounterData, ...]]:
     if not wild_data_ptr_ptr:  # null check
         return None
     ptr = rom.deref(wild_data_ptr_ptr)
@@ -147,47 +185,46 @@ async def parse_grass_encounter_ptr(rom: Rom, wild_data_ptr_ptr: Pointer[RawWild
     if not ptr.encounter_rate:
         return None
 
-    wild_data_ptr = RawWildPtr(ptr.ptr)
-    raw_data_iter = (rom.deref(wild_data_ptr + i) for i in range(config.NUM_GRASS_ENCOUNTER_SLOTS))
-
-    return tuple(WildEncounterData(boneka[raw.boneka].name, raw.low, raw.high) for raw in raw_data_iter)
+    return parse_encounter_table(rom, RawWildPtr(ptr.ptr), conf.NUM_GRASS_ENCOUNTER_SLOTS, boneka, tables)
 
 
-async def parse_surf_encounter_ptr(rom: Rom, wild_data_ptr_ptr: Pointer[RawWildEncounterDataPtrData],
-                                   boneka: tuple[Boneka, ...]) -> Optional[tuple[WildEncounterData, ...]]:
+async def parse_surf_encounter_ptr(rom: Rom, conf: Config, wild_data_ptr_ptr: Pointer[RawWildEncounterDataPtrData],
+                                   boneka: tuple[Boneka, ...], tables: Optional[EncounterTables] = None
+                                   ) -> Optional[tuple[WildEncounterData, ...]]:
     if not wild_data_ptr_ptr:  # null check
         return None
     wild_data_ptr = RawWildPtr(rom.deref(wild_data_ptr_ptr).ptr)
-    raw_data_iter = (rom.deref(wild_data_ptr + i) for i in range(config.NUM_SURF_ENCOUNTER_SLOTS))
+    return parse_encounter_table(rom, wild_data_ptr, conf.NUM_SURF_ENCOUNTER_SLOTS, boneka, tables)
 
-    return tuple(WildEncounterData(boneka[raw.boneka].name, raw.low, raw.high) for raw in raw_data_iter)
 
-
-async def parse_tree_encounter_ptr(rom: Rom, wild_data_ptr_ptr: Pointer[RawWildEncounterDataPtrData],
-                                   boneka: tuple[Boneka, ...]) -> Optional[tuple[WildEncounterData, ...]]:
+async def parse_tree_encounter_ptr(rom: Rom, conf: Config, wild_data_ptr_ptr: Pointer[RawWildEncounterDataPtrData],
+                                   boneka: tuple[Boneka, ...], tables: Optional[EncounterTables] = None
+                                   ) -> Optional[tuple[WildEncounterData, ...]]:
     if not wild_data_ptr_ptr:  # null check
         return None
     wild_data_ptr = RawWildPtr(rom.deref(wild_data_ptr_ptr).ptr)
-    raw_data_iter = (rom.deref(wild_data_ptr + i) for i in range(config.NUM_TREE_ENCOUNTER_SLOTS))
-
-    return tuple(WildEncounterData(boneka[raw.boneka].name, raw.low, raw.high) for raw in raw_data_iter)
+    return parse_encounter_table(rom, wild_data_ptr, conf.NUM_TREE_ENCOUNTER_SLOTS, boneka, tables)
 
 
-async def parse_fish_encounter_ptr(rom: Rom, wild_data_ptr_ptr: Pointer[RawWildEncounterDataPtrData],
-                                   boneka: tuple[Boneka, ...]) -> Optional[tuple[WildEncounterData, ...]]:
+async def parse_fish_encounter_ptr(rom: Rom, conf: Config, wild_data_ptr_ptr: Pointer[RawWildEncounterDataPtrData],
+                                   boneka: tuple[Boneka, ...], tables: Optional[EncounterTables] = None
+                                   ) -> Optional[tuple[WildEncounterData, ...]]:
     if not wild_data_ptr_ptr:  # null check
         return None
     wild_data_ptr = RawWildPtr(rom.deref(wild_data_ptr_ptr).ptr)
-    raw_data_iter = (rom.deref(wild_data_ptr + i) for i in range(config.NUM_FISH_ENCOUNTER_SLOTS))
+    return parse_encounter_table(rom, wild_data_ptr, conf.NUM_FISH_ENCOUNTER_SLOTS, boneka, tables)
+
 
-    return tuple(WildEncounterData(boneka[raw.boneka].name, raw.low, raw.high) for raw in raw_data_iter)
+RawWildLocationPtr = Pointer[RawWildLocation]
 
 
-async def get_all_wild_data(rom: Rom, boneka: tuple[Boneka]) -> tuple[WildLocation, ...]:
+async def get_all_wild_data(rom: Rom, conf: Config, boneka: tuple[Boneka]) -> tuple[WildLocation, ...]:
 
-    map_names = await get_all_map_names(rom)
-    ptr = Pointer[RawWildLocation](config.offsets.WILD_DATA_OFFSET)
+    map_names, headers = await asyncio.gather(get_all_map_names(rom, conf), get_all_map_headers(rom, conf))
+    ptr = RawWildLocationPtr(conf.offsets.WILD_DATA_OFFSET)
+    tables: EncounterTables = {}
 
-    tasks = (parse_raw_wild_location(rom, rom.deref(ptr + i), map_names, boneka) for i in range(config.WILD_DATA_LEN))
-    data = await asyncio.gather(*tasks)
+    # nothing in here actually waits, so a plain loop beats scheduling a task per location
+    data = [await parse_raw_wild_location(rom, conf, loc, map_names, boneka, headers, tables)
+            for loc in rom.deref_array(ptr, conf.WILD_DATA_LEN)]
     return tuple(i for i in data if i.name is not None and i.name != "Special Area")
@@ -1,6 +1,12 @@
+use std::os::raw::c_int;
+
 use pyo3::prelude::*;
 use pyo3::types::PyBytes;
-use flips::UpsPatch;
+use pyo3::buffer::PyBuffer;
+use pyo3::class::PyBufferProtocol;
+use pyo3::exceptions::PyBufferError;
+use pyo3::{ffi, AsPyPointer};
+use flips::{UpsOutput, UpsPatch};
 use flips::Error as FlipsError;
 use pyo3::create_exception;
 
@@ -16,22 +22,56 @@ struct PyUpsPatch {
     _patch: UpsPatch<Box<[u8]>>
 }
 
+/// The output of applying a patch. It exposes its memory through the buffer protocol,
+/// so `memoryview(data)` wraps it without copying.
+#[pyclass(name="PatchedData")]
+struct PyPatchedData {
+    data: Output
+}
+
+/// The output as flips returned it. It's moved in here instead of copied, and freed however flips allocated it.
+struct Output(UpsOutput);
 
+// the output owns its memory, and nothing else points into it
+unsafe impl Send for Output {}
+
+#[pyproto]
+impl PyBufferProtocol for PyPatchedData {
+    fn bf_getbuffer(slf: PyRefMut<Self>, view: *mut ffi::Py_buffer, flags: c_int) -> PyResult<()> {
+        if view.is_null() {
+            return Err(PyBufferError::new_err("View is null"));
+        }
+        // read only, so this fails if a writable buffer is requested
+        let ret = unsafe {
+            let data = slf.data.0.as_bytes();
+            ffi::PyBuffer_FillInfo(view, slf.as_ptr(), data.as_ptr() as *mut _,
+                                   data.len() as ffi::Py_ssize_t, 1, flags)
+        };
+        if ret == -1 {
+            return Err(PyErr::fetch(slf.py()));
+        }
+        Ok(())
+    }
+
+    fn bf_releasebuffer(_slf: PyRefMut<Self>, _view: *mut ffi::Py_buffer) {}
+}
 
 #[pymethods]
 impl PyUpsPatch {
     #[new]
-    fn new<'a>(patch: &'a PyBytes) -> Self {
-        // Were only allowing bytes to prevent copying
-        PyUpsPatch {
-            _patch: UpsPatch::new(patch.as_bytes().into())
-        }
+    fn new(py: Python, patch: PyBuffer<u8>) -> PyResult<Self> {
+        // anything with the buffer protocol (bytes, memoryview, mmap), copied once into the patch
+        Ok(PyUpsPatch {
+            _patch: UpsPatch::new(patch.to_vec(py)?.into_boxed_slice())
+        })
     }
 
-    pub fn apply<'py>(&'py self, py: Python<'py>, source: &'py PyBytes) -> PyResult<&'py PyBytes> {
-        let patched = convert_err(self._patch.apply(source.as_bytes()))?;
-        let out = patched.as_bytes();
-        Ok(PyBytes::new(py, out))
+    pub fn apply(&self, py: Python, source: &PyBytes) -> PyResult<PyPatchedData> {
+        // bytes are immutable, so the source can be read without holding the GIL
+        let source = source.as_bytes();
+        let patch = &self._patch;
+        let patched = py.allow_threads(|| patch.apply(source).map(Output));
+        Ok(PyPatchedData { data: convert_err(patched)? })
     }
 }
 
@@ -43,6 +83,7 @@ impl PyUpsPatch {
 #[pymodule]
 fn ups_wrapper(py: Python, m: &PyModule) -> PyResult<()> {
     m.add_class::<PyUpsPatch>()?;
+    m.add_class::<PyPatchedData>()?;
     m.add("PatchError", py.get_type::<PatchError>())?;
     Ok(())
-}
\ No newline at end of file
+}
@@ -5,9 +5,10 @@ import asyncio
 import json
 import random
 import re
+import time
 from copy import copy
-from functools import wraps, partial
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
 from typing import NamedTuple, Optional, BinaryIO, Tuple
 
 import aiohttp
@@ -16,14 +17,17 @@ from Crypto.Util import Counter
 from aiofiles.base import AsyncBase
 from aiofiles.threadpool import AsyncBufferedIOBase, wrap as _aiofiles_wrap
 from mega import Mega
-from mega.crypto import base64_to_a32, base64_url_decode, decrypt_attr, decrypt_key, a32_to_str, a32_to_base64, \
-    base64_url_encode, encrypt_key
+from mega.crypto import base64_to_a32, decrypt_key, a32_to_str, a32_to_base64, base64_url_encode, encrypt_key, \
+    str_to_a32
 from tenacity import retry, wait_exponential, retry_if_exception_type
 
+from .aio import unblock
+
 aiofiles_wrap = copy(_aiofiles_wrap)  # don't register it for all future aiofiles wrapping
 
 
 @aiofiles_wrap.register(BytesIO)
+@aiofiles_wrap.register(SpooledTemporaryFile)
 def _(file, *, loop=None, executor=None):
     return AsyncBufferedIOBase(file, loop=loop, executor=executor)
 
@@ -45,15 +49,84 @@ async def get_chunks(size):
     yield p, size - p
 
 
-def unblock(func):
-    @wraps(func)
-    async def run(*args, loop=None, executor=None, **kwargs):
-        if loop is None:
-            loop = asyncio.get_event_loop()
-        pfunc = partial(func, *args, **kwargs)
-        return await loop.run_in_executor(executor, pfunc)
+async def get_ranges(size, connections):
+    """
+    Splits a file into at most `connections` byte ranges that start and end on chunk boundaries
+    """
+    chunks = [chunk async for chunk in get_chunks(size)]
+    per_range = -(-len(chunks) // connections)  # ceil div
+    for i in range(0, len(chunks), per_range):
+        group = chunks[i:i + per_range]
+        yield group[0][0], group[-1][0] + group[-1][1]
+
+
+def new_ctr_cipher(k_str: bytes, iv: Tuple[int, ...], offset: int = 0):
+    """
+    Creates the AES-CTR cipher used to decrypt a file starting from `offset`,
+    which must be a multiple of the block size
+    """
+    counter = Counter.new(
+        128, initial_value=(((iv[0] << 32) + iv[1]) << 64) + offset // 16)
+    return AES.new(k_str, AES.MODE_CTR, counter=counter)
+
+
+class IntegrityError(Exception):
+    pass
+
 
-    return run
+class RangesNotSupportedError(Exception):
+    pass
+
+
+def chunk_mac(k_str: bytes, iv_str: bytes, chunk: bytes) -> bytes:
+    """
+    The CBC-MAC of a single chunk. Encrypting the whole padded chunk in one go and keeping the last block
+    gives the same result as mega.py's block-by-block loop, but stays in C the entire time
+    """
+    if len(chunk) % 16 or not chunk:
+        chunk += b'\0' * (16 - len(chunk) % 16)
+    return AES.new(k_str, AES.MODE_CBC, iv_str).encrypt(chunk)[-16:]
+
+
+class MacVerifier:
+    """
+    Verifies the chunk MACs and meta-MAC of a download as a pipeline stage.
+    Chunk MACs are computed in worker threads while the download and decryption keep going,
+    so the only work left when the download finishes is condensing the chunk MACs.
+    """
+
+    def __init__(self, k_str: bytes, iv: Tuple[int, ...], meta_mac: Tuple[int, ...], *, executor=None):
+        self.k_str = k_str
+        self.iv_str = a32_to_str([iv[0], iv[1], iv[0], iv[1]])
+        self.meta_mac = tuple(meta_mac)
+        self.executor = executor
+        self._pending: list[asyncio.Future] = []
+
+    def _mac_chunks(self, chunks: list[tuple[int, bytes]]) -> list[tuple[int, bytes]]:
+        return [(start, chunk_mac(self.k_str, self.iv_str, chunk)) for start, chunk in chunks]
+
+    async def feed(self, start: int, data: bytes):
+        """
+        Queues decrypted data that starts at `start` to be verified. `data` must be made of whole chunks
+        """
+        chunks = []
+        async for chunk_start, chunk_size in get_chunks(start + len(data)):
+            if chunk_start >= start:
+                offset = chunk_start - start
+                chunks.append((chunk_start, data[offset:offset + chunk_size]))
+        loop = asyncio.get_event_loop()
+        self._pending.append(loop.run_in_executor(self.executor, self._mac_chunks, chunks))
+
+    async def verify(self):
+        """
+        Waits for all queued chunks and raises IntegrityError if the meta-MAC does not match
+        """
+        results = await asyncio.gather(*self._pending)
+        macs = sorted(mac for macs in results for mac in macs)
+        mac_str = AES.new(self.k_str, AES.MODE_CBC, b'\0' * 16).encrypt(b''.join(mac for _, mac in macs))[-16:]
+        file_mac = str_to_a32(mac_str)
+        if (file_mac[0] ^ file_mac[1], file_mac[2] ^ file_mac[3]) != self.meta_mac:
+            raise IntegrityError("Mismatched MAC. The file is corrupted or incomplete")
 
 
 class UrlData(NamedTuple):
@@ -70,9 +143,21 @@ class AsyncMega(Mega):
     NEW_STYLE_FILE_IN_FOLDER_REGEX = re.compile(
         r'mega.[^/]+/folder/([0-z-_]+)#([0-z-_]+)/file/([0-z-_]+)')
 
-    def __init__(self, options=None):
+    SESSION_TTL = 60 * 60  # seconds before the anonymous session is refreshed
+    FOLDER_CACHE_TTL = 10 * 60  # seconds to keep decrypted folder node keys around
+
+    def __init__(self, options=None, *, session: Optional[aiohttp.ClientSession] = None):
+        """
+        If `session` is given, it is shared and won't be closed by `close()`.
+        Otherwise, the client creates and owns its own session.
+        """
         super().__init__(options)
-        self.async_session = aiohttp.ClientSession()
+        self._owns_session = session is None
+        self.async_session = aiohttp.ClientSession() if session is None else session
+        self._login_time: Optional[float] = None
+        self._login_lock = asyncio.Lock()
+        # (folder id, shared key) -> (expiry time, {node handle: decrypted node key})
+        self._folder_cache: dict[tuple[str, str], tuple[float, dict[str, Tuple[int, ...]]]] = {}
 
     @property
     def url(self) -> str:
@@ -107,6 +192,10 @@ class AsyncMega(Mega):
         if int_resp is not None:
             if int_resp == 0:
                 return int_resp
+            if int_resp == -15 and self.sid is not None:  # ESID: the cached session expired
+                self.sid = None
+                await self.ensure_logged_in()
+                return await self.async_api_request(data)
             if int_resp == -3:
                 msg = 'Request failed, retrying'
                 raise RuntimeError(msg)
@@ -114,7 +203,8 @@ class AsyncMega(Mega):
         return json_resp[0]
 
     async def close(self):
-        await self.async_session.close()
+        if self._owns_session:
+            await self.async_session.close()
 
     async def __aenter__(self):
         return self
@@ -158,16 +248,32 @@ class AsyncMega(Mega):
         if isinstance(resp, int):
             raise Exception(resp)
         await self._login_process(resp, password_key)
+        self._login_time = time.monotonic()
 
-    async def async_download_public_url(self, url: str, *, outfile: Optional[BinaryIO] = None) -> AsyncBase:
+    async def ensure_logged_in(self):
+        """
+        Logs in anonymously unless there is a cached session that hasn't expired yet
+        """
+        async with self._login_lock:
+            if self.sid is not None and time.monotonic() - self._login_time < self.SESSION_TTL:
+                return
+            self.sid = None
+            await self.async_login_anonymous()
+
+    async def async_download_public_url(self, url: str, *, outfile: Optional[BinaryIO] = None,
+                                        connections: int = 1, verify: bool = True) -> AsyncBase:
         """
         Asynchronously downloads a file to `outfile` if provided, otherwise creates a new in-memory file.
-        This does not check the integrity of a file because that is really stupidly slow. It takes
+        If `connections` is more than 1, the file is fetched with that many concurrent range requests.
+        If the server ignores them and sends the whole file, it's downloaded again as one stream.
+        If `verify` is true, the MAC of the file is checked in worker threads while it downloads,
+        and IntegrityError is raised if it doesn't match.
         """
         url_data = await self.parse_url2(url)
 
         if url_data.root_folder:
-            return await self._download_file_in_folder(url_data, out=outfile)
+            return await self._download_file_in_folder(url_data, out=outfile, connections=connections,
+                                                       verify=verify)
         else:
             file_key = base64_to_a32(url_data.shared_enc_key)
 
@@ -176,7 +282,8 @@ class AsyncMega(Mega):
                 'g': 1,
                 'p': url_data.file_id
             })
-            return await self._async_download_file(file_data, file_key, out=outfile)
+            return await self._async_download_file(file_data, file_key, out=outfile, connections=connections,
+                                                   verify=verify)
 
     async def get_nodes_in_shared_folder(self, root_folder: str) -> dict:
         data = [{"a": "f", "c": 1, "ca": 1, "r": 1}]
@@ -191,28 +298,39 @@ class AsyncMega(Mega):
         encrypted_key = base64_to_a32(key_str.split(":")[1])
         return decrypt_key(encrypted_key, shared_key)
 
-    async def _download_file_in_folder(self, url_data: UrlData, out: Optional[BinaryIO] = None) -> AsyncBase:
+    async def get_folder_keys(self, url_data: UrlData) -> dict[str, Tuple[int, ...]]:
+        """
+        Gets the decrypted keys of every node in a shared folder.
+        The listing is cached for FOLDER_CACHE_TTL seconds so repeated downloads from one folder skip it.
+        """
+        cache_key = (url_data.root_folder, url_data.shared_enc_key)
+        now = time.monotonic()
+        try:
+            expiry, keys = self._folder_cache[cache_key]
+            if now < expiry:
+                return keys
+        except KeyError:
+            pass
+
         shared_key = base64_to_a32(url_data.shared_enc_key)
         nodes = await self.get_nodes_in_shared_folder(url_data.root_folder)
-        file_key = None
-        for node in nodes:
-            key = self.decrypt_node_key(node['k'], shared_key)
-            if node["t"] == 0:  # Is a file
-                k = (
-                    key[0] ^ key[4],
-                    key[1] ^ key[5],
-                    key[2] ^ key[6],
-                    key[3] ^ key[7])
-            elif node["t"] == 1:  # Is a folder
-                k = key
-            attrs = decrypt_attr(base64_url_decode(node["a"]), k)
-            file_id = node["h"]
-            if file_id == url_data.file_id:
-                file_key = key
-                break
-        else:
-            raise Exception(
-                "File doesn't exist in folder??? This shouldn't happen???!!!")
+        keys = {node["h"]: self.decrypt_node_key(node['k'], shared_key) for node in nodes}
+        self._folder_cache[cache_key] = (now + self.FOLDER_CACHE_TTL, keys)
+        return keys
+
+    async def _download_file_in_folder(self, url_data: UrlData, out: Optional[BinaryIO] = None,
+                                       connections: int = 1, verify: bool = True) -> AsyncBase:
+        keys = await self.get_folder_keys(url_data)
+        try:
+            file_key = keys[url_data.file_id]
+        except KeyError:
+            # the listing might be stale, so look again before giving up
+            self._folder_cache.pop((url_data.root_folder, url_data.shared_enc_key), None)
+            try:
+                file_key = (await self.get_folder_keys(url_data))[url_data.file_id]
+            except KeyError:
+                raise Exception(
+                    "File doesn't exist in folder??? This shouldn't happen???!!!") from None
         data = [{'a': 'g', 'g': 1, 'n': url_data.file_id}]
 
         async with self.async_session.post(
@@ -222,10 +340,84 @@ class AsyncMega(Mega):
                 data=json.dumps(data)
         ) as resp:
             file_data = (await resp.json())[0]
-        return await self._async_download_file(file_data, file_key, out)
+        return await self._async_download_file(file_data, file_key, out, connections=connections, verify=verify)
+
+    @staticmethod
+    async def _stream_chunks(resp: aiohttp.ClientResponse, start: int, end: int, k_str: bytes, iv: Tuple[int, ...],
+                             write, verifier: Optional[MacVerifier] = None):
+        """
+        Reads the bytes in [start, end) of a file from `resp` one chunk at a time, and hands each decrypted chunk
+        to `write(offset, chunk)`. At most one chunk of the response is held in memory at a time.
+        CTR mode lets any chunk boundary be decrypted on its own given the counter offset
+        """
+        aes = new_ctr_cipher(k_str, iv, start)
+        async for chunk_start, chunk_size in get_chunks(end):
+            if chunk_start < start:
+                continue
+            # readexactly, because read(n) may return less than n bytes when streaming
+            try:
+                chunk = await resp.content.readexactly(chunk_size)
+            except asyncio.IncompleteReadError:
+                raise IntegrityError(f"The download was cut off before byte {end}") from None
+            chunk = aes.decrypt(chunk)
+            if verifier is not None:
+                await verifier.feed(chunk_start, chunk)
+            await write(chunk_start, chunk)
+
+    async def _download_range(self, file_url: str, start: int, end: int, k_str: bytes, iv: Tuple[int, ...],
+                              write, verifier: Optional[MacVerifier] = None):
+        """
+        Downloads and decrypts the bytes in [start, end) of a file, streaming them to `write(offset, chunk)`
+        """
+        headers = {'Range': f'bytes={start}-{end - 1}'}
+        async with self.async_session.get(file_url, headers=headers) as resp:
+            resp.raise_for_status()
+            if resp.status != 206:
+                # the whole file is coming. Drop the connection instead of reading it. What's already buffered
+                # is read first, since aiohttp pools a connection whose small body all arrived, but keeps it
+                # paused until that body is read, and the next request on it never gets an answer
+                resp.content.read_nowait()
+                resp.close()
+                raise RangesNotSupportedError(f"The server ignored the range {start}-{end - 1}")
+            if resp.content_length is not None and resp.content_length != end - start:
+                raise IntegrityError(f"Expected {end - start} bytes in range {start}-{end - 1}, "
+                                     f"got {resp.content_length}")
+            await self._stream_chunks(resp, start, end, k_str, iv, write, verifier)
+
+    async def _download_ranges(self, file_url: str, file_size: int, k_str: bytes, iv: Tuple[int, ...],
+                               out: AsyncBase, connections: int, verifier: Optional[MacVerifier] = None):
+        """
+        Downloads a file with `connections` workers, each streaming one range at a time straight to its place in
+        `out`, so no more than a chunk per connection is in memory. If one range fails, the others are cancelled
+        and waited for before the error is raised
+        """
+        start_pos = await out.tell()
+        write_lock = asyncio.Lock()
+
+        async def write(offset: int, chunk: bytes):
+            async with write_lock:  # the seek and the write have to happen together
+                await out.seek(start_pos + offset)
+                await out.write(chunk)
+
+        ranges = [r async for r in get_ranges(file_size, connections)]
+        ranges.reverse()
+
+        async def worker():
+            while ranges:
+                await self._download_range(file_url, *ranges.pop(), k_str, iv, write, verifier)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(connections, len(ranges)))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        await out.seek(start_pos + file_size)
 
     async def _async_download_file(self, file_data: dict, file_key: Tuple[int, ...],
-                                   out: Optional[BinaryIO] = None) -> AsyncBase:
+                                   out: Optional[BinaryIO] = None, *, connections: int = 1,
+                                   verify: bool = True) -> AsyncBase:
 
         k = (file_key[0] ^ file_key[4], file_key[1] ^ file_key[5],
              file_key[2] ^ file_key[6], file_key[3] ^ file_key[7])
@@ -238,27 +430,29 @@ class AsyncMega(Mega):
 
         out = out if out is not None else BytesIO()
         out = await file_wrap(out)
+        k_str = a32_to_str(k)
+        verifier = MacVerifier(k_str, iv, meta_mac) if verify else None
+
+        if connections > 1 and file_size:
+            start_pos = await out.tell()
+            try:
+                await self._download_ranges(file_url, file_size, k_str, iv, out, connections, verifier)
+            except RangesNotSupportedError:
+                # start over with one plain download. Whatever was written or fed to the verifier is thrown away
+                await out.seek(start_pos)
+                await out.truncate()
+                verifier = MacVerifier(k_str, iv, meta_mac) if verify else None
+            else:
+                if verifier is not None:
+                    await verifier.verify()
+                return out
+
+        async def write(_offset: int, chunk: bytes):
+            await out.write(chunk)
 
-        # input_file = BytesIO()
         async with self.async_session.get(file_url) as resp:
-            # that it doesn't work when just streaming the
-            # content directly
-            input_file = await file_wrap(BytesIO(await resp.content.read()))
-
-            ##########
-            # Decrypt
-            ##########
-
-            k_str = a32_to_str(k)
-            counter = Counter.new(
-                128, initial_value=(
-                                           (iv[0] << 32) + iv[1]) << 64)
-            aes = AES.new(k_str, AES.MODE_CTR, counter=counter)
-            iv_str = a32_to_str([iv[0], iv[1], iv[0], iv[1]])
-
-            async for chunk_start, chunk_size in get_chunks(file_size):
-                chunk = await input_file.read(chunk_size)
-                chunk = aes.decrypt(chunk)
-                await out.write(chunk)
+            await self._stream_chunks(resp, 0, file_size, k_str, iv, write, verifier)
 
-            return out
+        if verifier is not None:
+            await verifier.verify()
+        return out
@@ -0,0 +1,147 @@
+"""
+Uploads each sprite to Discord once and remembers the CDN url it got, so embeds can link to it instead of attaching
+the same png to every message.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+import aiohttp
+
+from ..config import config, data_json, dumps, loads, logger, Jsonable
+from ..rom_api.sprite_png import SPRITE_MIME_TYPES, sprite_format
+
+
+class SpriteUploadError(Exception):
+    pass
+
+
+@data_json(frozen=True)
+class CachedSpriteUrl:
+    url: str
+    expires: Optional[int] = None  # unix time. Discord's attachment links stop working after a while
+
+
+def url_expiry(url: str) -> Optional[int]:
+    """
+    When a signed Discord CDN url expires. The `ex` query parameter is a hex unix timestamp
+    """
+    ex = parse_qs(urlsplit(url).query).get('ex')
+    try:
+        return int(ex[0], 16) if ex else None
+    except ValueError:
+        return None
+
+
+class SpriteCdn:
+    """
+    sha256 of the sprite file -> the url it was uploaded to, saved to `path` after every upload.
+    Other shards save to the same file, so it's read again on a cache miss, but only if it changed since
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.urls: dict[str, CachedSpriteUrl] = {}
+        self._uploads: dict[str, asyncio.Task] = {}  # so the same sprite isn't uploaded twice at the same time
+        self._signature: Optional[tuple[int, int, int]] = None  # of the file when it was last read or written
+        self._save_lock = asyncio.Lock()  # so saves land in the order they were made
+
+    def file_signature(self) -> Optional[tuple[int, int, int]]:
+        """
+        Changes whenever the file does. Every save replaces the file, so the inode changes even if the mtime doesn't
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def read(self) -> Optional[dict[str, CachedSpriteUrl]]:
+        """
+        The urls saved in the file, or None if it hasn't changed since it was last read. This blocks
+        """
+        signature = self.file_signature()
+        if signature is None or signature == self._signature:
+            return None
+        self._signature = signature  # an unreadable file isn't tried again until it changes
+        try:
+            with open(self.path, 'rb') as f:
+                return Jsonable.converter.structure(loads(f.read()), dict[str, CachedSpriteUrl])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable sprite url cache {self.path!r}: {e!r}")
+            return None
+
+    async def load(self):
+        urls = await asyncio.get_running_loop().run_in_executor(None, self.read)
+        if urls is not None:
+            self.urls.update(urls)
+
+    def write(self, data: str):
+        """
+        Replaces the file with `data`. This blocks
+        """
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        self._signature = self.file_signature()  # there's nothing new in it to read back
+
+    async def save(self):
+        data = dumps(Jsonable.converter.unstructure(self.urls))  # here, so the urls don't change while it's dumped
+        async with self._save_lock:
+            await asyncio.get_running_loop().run_in_executor(None, self.write, data)
+
+    def cached(self, key: str) -> Optional[str]:
+        entry = self.urls.get(key)
+        if entry is None:
+            return None
+        if entry.expires is not None and entry.expires - time.time() < config.bot_data.SPRITE_URL_MIN_TTL:
+            return None
+        return entry.url
+
+    async def url(self, session: aiohttp.ClientSession, sprite: bytes, filename: str) -> str:
+        """
+        A url that shows `sprite`, uploading it if it hasn't been yet (or its last url is about to expire)
+        """
+        key = hashlib.sha256(sprite).hexdigest()
+        if (url := self.cached(key)) is not None:
+            return url
+        await self.load()  # other shards could have uploaded it already
+        if (url := self.cached(key)) is not None:
+            return url
+
+        task = self._uploads.get(key)
+        if task is None:
+            task = self._uploads[key] = asyncio.create_task(self._upload(session, key, sprite, filename))
+            task.add_done_callback(lambda _: self._uploads.pop(key, None))
+        return await asyncio.shield(task)  # one cancelled command shouldn't cancel the upload for the others
+
+    async def _upload(self, session: aiohttp.ClientSession, key: str, sprite: bytes, filename: str) -> str:
+        channel = config.bot_data.SPRITE_CHANNEL
+        endpoint = f'{config.bot_data.DISCORD_API_BASE}/channels/{channel}/messages'
+        headers = {'Authorization': f'Bot {config.bot_data.TOKEN}'}
+        for _ in range(3):
+            form = aiohttp.FormData()
+            form.add_field('payload_json', dumps({'attachments': [{'id': 0, 'filename': filename}]}),
+                           content_type='application/json')
+            form.add_field('files[0]', sprite, filename=filename, content_type=SPRITE_MIME_TYPES[sprite_format(sprite)])
+            async with session.post(endpoint, data=form, headers=headers) as resp:
+                if resp.status == 429:  # rate limited
+                    await asyncio.sleep(float((await resp.json()).get('retry_after', 1)))
+                    continue
+                if resp.status >= 400:
+                    raise SpriteUploadError(f"Uploading {filename!r} failed with {resp.status}: {await resp.text()}")
+                url = (await resp.json())['attachments'][0]['url']
+            break
+        else:
+            raise SpriteUploadError(f"Uploading {filename!r} kept getting rate limited")
+
+        logger.debug(f"Uploaded sprite {filename!r}")
+        self.urls[key] = CachedSpriteUrl(url, url_expiry(url))
+        await self.save()
+        return url
@@ -0,0 +1,97 @@
+"""
+Checks what /dexsearch matches, and measures how long searches take.
+
+It runs fully offline, from any directory:
+
+    python benchmarks/dex_search.py [--boneka 412] [--number 1000]
+
+The queries are checked on a few boneka with hand written entries, and timed on the synthetic dataset
+from load_test.py. It works in a temporary directory with its own akyuu.json.
+Exits with an error on the first query that matches the wrong documents.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+ENTRIES = (
+    ('Alpha', 'Shrine Maiden', 'It lives in the shrine and eats sake under the moon.'),
+    ('Beta', 'Gap Youkai', 'It sleeps in the gap. The shrine maiden fears it.'),
+    ('Gamma', 'Tengu', 'It flies over the mountain and never sleeps.'),
+    ('Delta', 'Bamboo Rabbit', 'It lives in the bamboo forest.'),
+)
+# query -> the documents it finds, in any order
+QUERIES = {
+    '"shrine"': {0, 1},
+    '"Shrine"': {0, 1},
+    '"shrine maiden"': {0, 1},
+    '"sleeps" gap': {1, 2},
+    '"lives" "forest"': {3},
+    '"moon" "forest"': set(),
+    '"zzz"': set(),
+}
+# query -> the documents that rank first. Documents without the words can come back after them
+RANKED = {
+    'shrine': [0, 1],
+    'forest sake': [0, 3],
+}
+
+
+def sample_boneka():
+    from attr import evolve
+
+    from akyuu_bot.rom_api.stats import BonekaDexData
+    from load_test import synthetic_dataset
+
+    boneka = synthetic_dataset(random.Random(0), len(ENTRIES), 0).boneka_data
+    return tuple(evolve(b, name=name, dex_data=BonekaDexData(species, entry))
+                 for b, (name, species, entry) in zip(boneka, ENTRIES))
+
+
+def check():
+    from akyuu_bot.rom_api.dex_search import DexIndex
+
+    index = DexIndex.from_boneka(sample_boneka())
+    for query, expected in QUERIES.items():
+        found = {doc for doc, _ in index.search(query)}
+        if found != expected:
+            sys.exit(f'{query!r} found {sorted(found)}, but should find {sorted(expected)}')
+    for query, expected in RANKED.items():
+        found = [doc for doc, _ in index.search(query)]
+        if sorted(found[:len(expected)]) != sorted(expected):
+            sys.exit(f'{query!r} ranked {found} first, but should rank {expected} first')
+    print(f'{len(QUERIES) + len(RANKED)} queries matched the right entries')
+
+
+def bench(args: argparse.Namespace):
+    from load_test import WORDS, synthetic_dataset
+
+    index = synthetic_dataset(random.Random(args.seed), args.boneka, 0).dex_index
+    rng = random.Random(args.seed)
+    for name, query in (('word', rng.choice(WORDS)), ('quoted word', f'"{rng.choice(WORDS)}"'),
+                        ('words', ' '.join(rng.sample(WORDS, 3))),
+                        ('phrase', f'"{rng.choice(WORDS)} {rng.choice(WORDS)}"')):
+        seconds = timeit.timeit(lambda: index.search(query), number=args.number) / args.number
+        print(f'{name:>12} {query!r:>28}: {seconds * 1e6:7.1f}us, {len(index.search(query))} results')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--boneka', type=int, default=412, help='boneka in the synthetic dataset')
+    parser.add_argument('--number', type=int, default=1000, help='times each query is timed')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # the bot reads akyuu.json from here
+        with open('akyuu.json', 'w') as f:
+            json.dump({'bot_data': {'TOKEN': ''}}, f)
+        check()
+        bench(args)
+
+
+if __name__ == '__main__':
+    main()
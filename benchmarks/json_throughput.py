@@ -0,0 +1,62 @@
+"""
+Measures how fast the boneka and wild data are dumped to and loaded from json.
+
+Run it from a directory with an akyuu.json and the rom and patch that it points to, after the bot has written
+its data files at least once:
+
+    python benchmarks/json_throughput.py
+
+"json module" dumps with indent=4, which orjson can't do, so it shows what the json module costs on its own.
+The rest is what the bot uses: the precompiled hooks with orjson (when it's installed) and indent=2.
+"""
+import json
+import os
+import tempfile
+import time
+
+from akyuu_bot.config import Jsonable, get_config, orjson
+from akyuu_bot.rom_api.stats import Boneka
+from akyuu_bot.rom_api.wild_data import WildLocation
+
+
+def best_of(func, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def report(name: str, seconds: float, size: int, records: int):
+    print(f'{name:<32} {seconds * 1000:8.1f}ms {size / seconds / 2 ** 20:8.1f}MiB/s {records / seconds:10.0f} records/s')
+
+
+def bench(name: str, cls: type, path: str):
+    with open(path) as f:
+        text = f.read()
+    objs = cls.from_json_list(text, tuple[cls, ...])
+    converter = Jsonable.converter
+    size = len(text.encode())
+    tp = tuple[cls, ...]
+
+    print(f'{name}: {len(objs)} records, {size / 2 ** 20:.2f}MiB')
+    report('  to_json_list (json module)', best_of(lambda: cls.to_json_list(objs, indent=4)), size, len(objs))
+    report('  to_json_list', best_of(lambda: cls.to_json_list(objs, indent=2)), size, len(objs))
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'out.json')
+        report('  dump_to_file', best_of(lambda: cls.dump_to_file(objs, out, indent=2)), size, len(objs))
+    report('  from_json_list (json module)', best_of(lambda: converter.structure(json.loads(text), tp)), size,
+           len(objs))
+    report('  from_json_list', best_of(lambda: cls.from_json_list(text, tp)), size, len(objs))
+
+
+def main():
+    conf = get_config()
+    print(f"orjson {'is' if orjson is not None else 'is not'} installed\n")
+    bench('boneka data', Boneka, conf.bot_data.BONEKA_DATA_PATH)
+    bench('wild data', WildLocation, 'wild.json')
+
+
+if __name__ == '__main__':
+    main()
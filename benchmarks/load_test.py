@@ -0,0 +1,401 @@
+"""
+Load tests the command handlers: many simulated users running commands at once, like right after a release.
+
+It runs fully offline, from any directory:
+
+    python benchmarks/load_test.py [--requests 2000] [--concurrency 200] [--rate 0] [--mix locate=1,stats=1]
+
+The bot runs on a synthetic dataset instead of a rom. It works in a temporary directory with its own akyuu.json.
+Handlers get fake command and component contexts. Their responses (and sprite uploads) go to a local aiohttp
+server that stands in for Discord's http api and answers after --http-latency ms.
+
+With --rate 0 (the default), --concurrency users each run commands back to back. Otherwise commands arrive
+at --rate per second (poisson), and at most --concurrency run at once. The others wait for a slot.
+Handler latency is measured from when the handler starts, so it leaves out that wait. Response time includes it.
+Event loop lag is how late a task that sleeps every few ms wakes up. It shows how long handlers block the loop.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+
+DEFAULT_MIX = 'locate=40,stats=20,levelup=10,dexsearch=10,sprite=5,get_info=5,ping=5,config=5'
+DEV_ID = 1  # the fake developer. Everyone else gets a random id
+WORDS = ('the', 'a', 'small', 'shrine', 'maiden', 'gap', 'youkai', 'lives', 'in', 'forest', 'bamboo', 'eats',
+         'sake', 'sleeps', 'under', 'moon', 'fire', 'water', 'spring', 'mountain', 'it', 'and', 'tengu', 'flies')
+
+
+# the stand-in for Discord's http api
+
+
+class DiscordStandIn:
+    """
+    Runs on its own thread and event loop, so serving requests doesn't count as event loop lag for the bot
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.requests: dict[str, int] = defaultdict(int)
+        self.uploads = 0
+        self.port: Optional[int] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='discord-stand-in', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _serve(self):
+        app = web.Application()
+        app.router.add_post('/interactions/{id}/{token}/callback', self.respond)
+        app.router.add_post('/webhooks/{app}/{token}', self.respond)
+        app.router.add_patch('/webhooks/{app}/{token}/messages/{message}', self.respond)
+        app.router.add_delete('/webhooks/{app}/{token}/messages/{message}', self.respond)
+        app.router.add_post('/channels/{channel}/messages', self.upload)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+        self.port = self._runner.addresses[0][1]
+
+    async def respond(self, request: web.Request) -> web.Response:
+        await request.read()
+        self.requests[request.method] += 1
+        await asyncio.sleep(self.latency)
+        return web.Response(status=204)
+
+    async def upload(self, request: web.Request) -> web.Response:
+        filename = 'sprite.png'
+        async for part in await request.multipart():
+            if part.name == 'files[0]':
+                filename = part.filename
+            await part.read()
+        self.uploads += 1
+        await asyncio.sleep(self.latency)
+        expires = format(int(time.time()) + 24 * 60 * 60, 'x')
+        url = f'http://127.0.0.1:{self.port}/attachments/{self.uploads}/{filename}?ex={expires}'
+        return web.json_response({'attachments': [{'id': '0', 'filename': filename, 'url': url}]})
+
+
+# fake contexts
+
+
+def to_json(obj):
+    if isinstance(obj, (list, tuple)):
+        return [to_json(o) for o in obj]
+    return getattr(obj, '_json', obj)
+
+
+class FakeMessage:
+    def __init__(self, ctx: 'FakeContext'):
+        self.ctx = ctx
+
+    async def delete(self):
+        await self.ctx.request('DELETE', 'messages/@original')
+
+
+class FakeContext:
+    """
+    Just enough of a CommandContext/ComponentContext for the handlers. Every response is an http request
+    to the stand-in, like interactions would make
+    """
+
+    def __init__(self, harness: 'LoadTest', user_id: int, target: Optional[str] = None,
+                 values: Optional[list[str]] = None):
+        self.harness = harness
+        self.id = next(harness.interaction_ids)
+        self.guild_id = None
+        self.author = SimpleNamespace(id=user_id, user=SimpleNamespace(id=user_id))
+        self.target = SimpleNamespace(content=target)
+        self.data = SimpleNamespace(values=values)
+        self.responded = False
+
+    async def request(self, method: str, path: Optional[str] = None, payload: Optional[dict] = None):
+        url = f'{self.harness.api}/webhooks/0/token{self.id}' + (f'/{path}' if path else '')
+        async with self.harness.session.request(method, url, json=payload) as r:
+            r.raise_for_status()
+
+    async def send(self, content: Optional[str] = None, *, embeds=None, components=None, ephemeral: bool = False):
+        payload = {'content': content, 'embeds': to_json(embeds or []), 'components': to_json(components or []),
+                   'flags': 64 if ephemeral else 0}
+        if self.responded:
+            await self.request('POST', payload=payload)  # a followup
+        else:
+            self.responded = True
+            async with self.harness.session.post(f'{self.harness.api}/interactions/{self.id}/token{self.id}/callback',
+                                    json={'type': 4, 'data': payload}) as r:
+                r.raise_for_status()
+        return FakeMessage(self)
+
+    async def edit(self, content: Optional[str] = None, *, embeds=None, components=None):
+        await self.request('PATCH', 'messages/@original', {'content': content, 'embeds': to_json(embeds or []),
+                                                           'components': to_json(components or [])})
+
+    async def defer(self, ephemeral: bool = False):
+        self.responded = True
+        await self.request('PATCH', 'messages/@original', {'flags': 64 if ephemeral else 0})
+
+    async def popup(self, modal):
+        self.responded = True
+        await self.request('PATCH', 'messages/@original', {'type': 9, 'data': to_json(modal)})
+
+
+# the synthetic dataset
+
+
+def synthetic_dataset(rng: random.Random, count: int, locations: int):
+    from copy import deepcopy
+
+    from akyuu_bot.config import config
+    from akyuu_bot.rom_api.dataset import Dataset
+    from akyuu_bot.rom_api.dex_search import DexIndex
+    from akyuu_bot.rom_api.sprite_png import SPRITE_SIZE, encode_sprite
+    from akyuu_bot.rom_api.stats import Boneka, BonekaDexData, BonekaStatData, Learnsets, LevelUpMove
+    from akyuu_bot.rom_api.wild_data import WildEncounterData, WildLocation
+
+    type_names = ('NORMAL', 'FIGHT', 'FLYING', 'POISON', 'GROUND', 'ROCK', 'BUG', 'GHOST', 'STEEL', '???',
+                  'FIRE', 'WATER', 'GRASS', 'ELECTR', 'PSYCHC', 'ICE', 'DRAGON', 'DARK')
+    ability_names = tuple(f'Ability {i}' for i in range(78))
+    move_names = tuple(f'Move {i}' for i in range(355))
+    names = tuple(f'Boneka{i}' for i in range(count))
+
+    learnsets = Learnsets.pack(
+        (sorted((LevelUpMove(rng.choice(move_names), rng.randrange(1, 100)) for _ in range(rng.randrange(4, 20))),
+                key=lambda m: m.level) for _ in names), move_names)
+    indices = tuple(bytes(rng.choices(range(16), k=SPRITE_SIZE * SPRITE_SIZE)) for _ in names)
+    palettes = tuple(bytes(rng.randrange(32) << 3 for _ in range(48)) for _ in names)
+    shiny_palettes = tuple(bytes(rng.randrange(32) << 3 for _ in range(48)) for _ in names)
+
+    boneka = []
+    for i, name in enumerate(names):
+        stats = BonekaStatData(*(rng.randrange(5, 256) for _ in range(6)), *rng.choices(type_names, k=2),
+                               *rng.choices(ability_names, k=2))
+        dex_data = BonekaDexData(f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}',
+                                 ' '.join(rng.choices(WORDS, k=rng.randrange(15, 30))))
+        boneka.append(Boneka(name, stats, learnsets[i], encode_sprite(indices[i], palettes[i]), i, dex_data))
+    boneka = tuple(boneka)
+
+    def table(slots: int) -> Optional[tuple[WildEncounterData, ...]]:
+        if rng.random() < 0.5:
+            return None
+        return tuple(WildEncounterData(rng.choice(names), level := rng.randrange(2, 70), level + rng.randrange(3))
+                     for _ in range(slots))
+
+    wild = tuple(WildLocation(f'Route {i}', table(12), table(5), table(5), table(10)) for i in range(locations))
+    chart = tuple(tuple(rng.choice((1.0, 1.0, 1.0, 1.0, 2.0, 0.5, 0.0)) for _ in type_names) for _ in type_names)
+
+    results = {'boneka': boneka, 'wild': wild, 'move_names': move_names, 'level_up_moves': learnsets,
+               'palettes': (None, *palettes[1:]), 'shiny_palettes': (None, *shiny_palettes[1:]),
+               'sprite_indices': indices, 'type_names': type_names, 'type_effectiveness': chart,
+               'dex_index': DexIndex.from_boneka(boneka)}
+    return Dataset(None, deepcopy(config), results, 'synthetic', 'synthetic', 'synthetic')
+
+
+# the load test
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.interaction_ids = iter(range(1, sys.maxsize))
+        self.stand_in = DiscordStandIn(args.http_latency / 1000)
+        self.api = ''
+        self.session: Optional[aiohttp.ClientSession] = None  # what interactions would answer with
+        self.bot = None
+        self.handlers = {}
+        self.latencies: dict[str, list[float]] = defaultdict(list)  # handler latency
+        self.response_times: list[float] = []  # including the wait for a slot
+        self.errors: dict[str, int] = defaultdict(int)
+        self.lags: list[float] = []
+
+    async def setup(self):
+        from akyuu_bot.bot.akyuu import AkyuuBot
+        from akyuu_bot.bot.extensions.boneka import BonekaExt
+        from akyuu_bot.bot.extensions.dev_commands import DevExt
+        from akyuu_bot.bot.extensions.sanity import SanityCheck
+        from akyuu_bot.config import config, logger
+
+        logger.setLevel(logging.WARNING)  # every sprite upload is logged otherwise
+        self.stand_in.start()
+        self.api = f'http://127.0.0.1:{self.stand_in.port}'
+        self.session = aiohttp.ClientSession()
+        config.bot_data.DISCORD_API_BASE = self.api
+
+        bot = self.bot = AkyuuBot.__new__(AkyuuBot)  # no gateway. Only what the handlers use
+        bot.init_state()
+        bot._websocket = SimpleNamespace(latency=0.042)
+        bot.wait_for_component = self.wait_for_component
+        start = time.perf_counter()
+        bot.dataset = synthetic_dataset(self.rng, self.args.boneka, self.args.locations)
+        print(f'synthetic dataset: {self.args.boneka} boneka, {self.args.locations} locations '
+              f'in {time.perf_counter() - start:.2f}s')
+
+        exts = {}
+        for cls in (BonekaExt, DevExt, SanityCheck):
+            ext = exts[cls] = object.__new__(cls)  # Extension.__new__ would register the commands with a client
+            ext.bot = ext.client = bot
+        boneka, dev, sanity = exts[BonekaExt], exts[DevExt], exts[SanityCheck]
+
+        names = [b.name for b in bot.dataset.boneka_data]
+        self.handlers = {
+            'locate': lambda ctx: boneka.locate(ctx, self.rng.choice(names)),
+            'stats': lambda ctx: boneka.stats(ctx, self.rng.choice(names)),
+            'levelup': lambda ctx: boneka.levelup(ctx, self.rng.choice(names)),
+            'sprite': lambda ctx: boneka.sprite(ctx, self.rng.choice(names), self.rng.random() < 0.5),
+            'dexsearch': lambda ctx: boneka.dexsearch(ctx, self.dex_query()),
+            'get_info': lambda ctx: boneka.get_info(ctx),
+            'ping': lambda ctx: sanity.ping(ctx),
+            'config': lambda ctx: dev.config(ctx, 'show'),
+        }
+        self.names = names
+
+    def dex_query(self) -> str:
+        if self.rng.random() < 0.3:
+            return f'"{self.rng.choice(WORDS)} {self.rng.choice(WORDS)}"'
+        return ' '.join(self.rng.choices(WORDS, k=self.rng.randrange(1, 4)))
+
+    def context(self, command: str) -> FakeContext:
+        user_id = DEV_ID if command == 'config' and self.rng.random() < 0.5 else self.rng.randrange(2, 1 << 60)
+        target = None
+        if command == 'get_info':
+            target = ' '.join(self.rng.choices(WORDS, k=8) + self.rng.choices(self.names, k=2))
+        return FakeContext(self, user_id, target)
+
+    async def wait_for_component(self, components=None, timeout: Optional[float] = None):
+        """
+        A user looking at the menu for a bit and picking something
+        """
+        await asyncio.sleep(self.args.think_time / 1000)
+        return FakeContext(self, DEV_ID + 1, values=[self.rng.choice(components).value])
+
+    async def run_one(self, command: str, arrived: float):
+        ctx = self.context(command)
+        start = time.perf_counter()
+        try:
+            await self.handlers[command](ctx)
+        except Exception as e:
+            self.errors[command] += 1
+            if self.errors[command] == 1:
+                print(f'{command} failed: {e!r}')
+        end = time.perf_counter()
+        self.latencies[command].append(end - start)
+        self.response_times.append(end - arrived)
+
+    async def watch_loop_lag(self, interval: float = 0.005):
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(interval)
+            self.lags.append(loop.time() - before - interval)
+
+    def commands(self):
+        mix = {}
+        for part in self.args.mix.split(','):
+            name, _, weight = part.partition('=')
+            if name not in self.handlers:
+                raise SystemExit(f'Unknown command {name!r}. Pick from {sorted(self.handlers)}')
+            mix[name] = float(weight or 1)
+        return self.rng.choices(list(mix), weights=list(mix.values()), k=self.args.requests)
+
+    async def run(self):
+        await self.setup()
+        commands = self.commands()
+        lag_task = asyncio.create_task(self.watch_loop_lag())
+        start = time.perf_counter()
+        if self.args.rate:
+            slots = asyncio.Semaphore(self.args.concurrency)
+
+            async def arrive(command: str):
+                arrived = time.perf_counter()
+                async with slots:
+                    await self.run_one(command, arrived)
+
+            tasks = []
+            for command in commands:
+                tasks.append(asyncio.create_task(arrive(command)))
+                await asyncio.sleep(self.rng.expovariate(self.args.rate))
+            await asyncio.gather(*tasks)
+        else:
+            queue = iter(commands)
+
+            async def user():
+                for command in queue:
+                    await self.run_one(command, time.perf_counter())
+
+            await asyncio.gather(*(user() for _ in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - start
+        lag_task.cancel()
+        await (await self.bot.get_http_session()).close()
+        await self.session.close()
+        self.stand_in.stop()
+        self.report(elapsed)
+
+    def report(self, elapsed: float):
+        completed = len(self.response_times)
+        mode = f'{self.args.rate}/s arrivals' if self.args.rate else 'closed loop'
+        print(f'\n{completed} commands in {elapsed:.2f}s ({mode}, concurrency {self.args.concurrency}): '
+              f'{completed / elapsed:.1f}/s')
+        print(f"{'command':<10} {'count':>6} {'errors':>6} {'p50':>9} {'p99':>9} {'max':>9}")
+        for command, latencies in sorted(self.latencies.items()):
+            print(f'{command:<10} {len(latencies):>6} {self.errors[command]:>6} '
+                  + ' '.join(f'{value * 1000:>7.1f}ms' for value in
+                             (statistics.median(latencies), percentile(latencies, 99), max(latencies))))
+        every = [latency for latencies in self.latencies.values() for latency in latencies]
+        print(f"{'all':<10} {len(every):>6} {sum(self.errors.values()):>6} "
+              + ' '.join(f'{value * 1000:>7.1f}ms' for value in
+                         (statistics.median(every), percentile(every, 99), max(every))))
+        print(f'response time (with waiting for a slot): p50 {statistics.median(self.response_times) * 1000:.1f}ms '
+              f'p99 {percentile(self.response_times, 99) * 1000:.1f}ms')
+        print(f'event loop lag: p50 {statistics.median(self.lags) * 1000:.2f}ms '
+              f'p99 {percentile(self.lags, 99) * 1000:.2f}ms max {max(self.lags) * 1000:.2f}ms')
+        print(f'stand-in: {dict(self.stand_in.requests)} requests, {self.stand_in.uploads} sprite uploads')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='how many commands to run')
+    parser.add_argument('--concurrency', type=int, default=200, help='users, or the most commands running at once')
+    parser.add_argument('--rate', type=float, default=0, help='commands arriving per second. 0 for a closed loop')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='command=weight,... to pick commands from')
+    parser.add_argument('--http-latency', type=float, default=30, help="the stand-in's response time (ms)")
+    parser.add_argument('--think-time', type=float, default=200, help='how long users take to pick from menus (ms)')
+    parser.add_argument('--boneka', type=int, default=412, help='boneka in the synthetic dataset')
+    parser.add_argument('--locations', type=int, default=172, help='wild locations in the synthetic dataset')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # the bot reads akyuu.json from here and writes its sprite url cache here
+        with open('akyuu.json', 'w') as f:
+            json.dump({'bot_data': {'TOKEN': 'load-test', 'DEVELOPERS': [DEV_ID], 'SPRITE_CHANNEL': 1}}, f)
+        asyncio.run(LoadTest(args).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""
+Checks the Mega downloads against a local stand-in for Mega, and measures how much the range requests help.
+
+It runs fully offline, from any directory. It works in a temporary directory with its own akyuu.json:
+
+    python benchmarks/mega_download.py [--size-mib 8] [--latency 50] [--bandwidth 4]
+
+The stand-in answers the one api call a public file link needs, and serves the file encrypted like Mega does,
+with Range support that can be turned off. Every download goes through AsyncMega.async_download_public_url.
+Only the api url is pointed at the stand-in. Files of several sizes are checked with several connection counts,
+including uneven last ranges and more connections than the file has chunks. So is a server that ignores Range
+and sends the whole file with a 200.
+
+The links carry a meta-MAC worked out by a reference implementation in this file, block by block like mega.py,
+and not by the code under test. It also has to agree with what the code under test works out.
+The MAC checks download a zipped patch through /update's Mega path (DevExt._mega_download) with a fake bot.
+The intact file has to update the patch. A file with one byte changed, or cut off, has to fail with
+IntegrityError before the bot's update_patch is ever called, and with none of its range downloads left running.
+
+Exits with an error if any download comes back different, or any check fails.
+The timed downloads are limited to --bandwidth per connection, which is what the range requests get around.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from io import BytesIO
+from typing import Optional
+
+from aiohttp import web
+
+FILE_ID = 'TestFile'  # mega.py only takes 8 character ids
+
+
+# the stand-in for Mega
+
+
+class MegaStandIn:
+    """
+    Runs on its own thread and event loop, like the Discord stand-in in load_test.py
+    """
+
+    def __init__(self):
+        self.blob = b''  # the encrypted file
+        self.size: Optional[int] = None  # what the api says the size is, if not the blob's. To serve a cut off file
+        self.ranges = True  # whether Range headers are honoured
+        self.latency = 0.0  # seconds before every file response
+        self.bandwidth = 0.0  # bytes per second per connection, like Mega's own limit. 0 for no limit
+        self.requests: Counter = Counter()  # status -> count, for the file
+        self.port: Optional[int] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='mega-stand-in', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    async def _serve(self):
+        app = web.Application()
+        app.router.add_post('/cs', self.api)
+        app.router.add_get('/file', self.file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+        self.port = self._runner.addresses[0][1]
+
+    async def api(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if data != [{'a': 'g', 'g': 1, 'p': FILE_ID}]:
+            return web.json_response(-2)  # EARGS
+        size = len(self.blob) if self.size is None else self.size
+        return web.json_response([{'g': f'{self.url}/file', 's': size}])
+
+    async def file(self, request: web.Request) -> web.StreamResponse:
+        await asyncio.sleep(self.latency)
+        if self.ranges and 'Range' in request.headers:
+            requested = request.http_range
+            start, stop = requested.start, min(requested.stop, len(self.blob))
+            self.requests[206] += 1
+            return await self.send(request, self.blob[start:stop], 206,
+                                   {'Content-Range': f'bytes {start}-{stop - 1}/{len(self.blob)}'})
+        self.requests[200] += 1
+        return await self.send(request, self.blob, 200, {})
+
+    async def send(self, request: web.Request, body: bytes, status: int, headers: dict) -> web.StreamResponse:
+        if not self.bandwidth:
+            return web.Response(status=status, body=body, headers=headers)
+        resp = web.StreamResponse(status=status, headers=headers)
+        resp.content_length = len(body)
+        await resp.prepare(request)
+        piece = 64 * 1024
+        for start in range(0, len(body), piece):
+            await asyncio.sleep(min(piece, len(body) - start) / self.bandwidth)
+            await resp.write(body[start:start + piece])
+        await resp.write_eof()
+        return resp
+
+
+# files encrypted like Mega does it
+
+
+def reference_meta_mac(k_str: bytes, iv: tuple[int, int], data: bytes) -> tuple[int, int]:
+    """
+    The meta-MAC of `data`, worked out independently of the code under test. It follows mega.py's download loop:
+    mega.py's own chunks, then a CBC-MAC of every chunk one block at a time, then a CBC-MAC of those.
+    CBC is done by hand here, one AES-ECB block at a time.
+    Two edge cases differ from mega.py. For a last chunk of 16 bytes or less, mega.py reuses the previous chunk's
+    loop index and MACs an empty block; here the chunk's own bytes are padded. An empty file gets one zero block
+    """
+    from Crypto.Cipher import AES
+    from mega.crypto import a32_to_str, get_chunks, str_to_a32
+
+    ecb = AES.new(k_str, AES.MODE_ECB)
+
+    def cbc_step(mac: bytes, block: bytes) -> bytes:
+        return ecb.encrypt((int.from_bytes(mac, 'big') ^ int.from_bytes(block, 'big')).to_bytes(16, 'big'))
+
+    iv_block = a32_to_str([iv[0], iv[1], iv[0], iv[1]])
+    file_mac = b'\0' * 16
+    for chunk_start, chunk_size in get_chunks(len(data)):
+        chunk = data[chunk_start:chunk_start + chunk_size]
+        mac = iv_block
+        for i in range(0, max(len(chunk), 1), 16):
+            mac = cbc_step(mac, chunk[i:i + 16].ljust(16, b'\0'))
+        file_mac = cbc_step(file_mac, mac)
+    file_mac = str_to_a32(file_mac)
+    return file_mac[0] ^ file_mac[1], file_mac[2] ^ file_mac[3]
+
+
+async def encrypt_file(data: bytes, seed: int) -> tuple[bytes, str]:
+    """
+    `data` encrypted with a made up key, and a public link to it. The link's key includes the meta-MAC of `data`,
+    from the reference. Exits with an error if the code under test works out a different one
+    """
+    import random
+
+    from Crypto.Cipher import AES
+    from mega.crypto import a32_to_base64, a32_to_str, str_to_a32
+
+    from akyuu_bot.util.async_mega import chunk_mac, get_chunks, new_ctr_cipher
+
+    rng = random.Random(seed)
+    k = tuple(rng.getrandbits(32) for _ in range(4))
+    iv = tuple(rng.getrandbits(32) for _ in range(2))
+    k_str = a32_to_str(k)
+    iv_str = a32_to_str([iv[0], iv[1], iv[0], iv[1]])
+
+    meta_mac = reference_meta_mac(k_str, iv, data)
+    macs = b''.join([chunk_mac(k_str, iv_str, data[start:start + size])
+                     async for start, size in get_chunks(len(data))])
+    file_mac = str_to_a32(AES.new(k_str, AES.MODE_CBC, b'\0' * 16).encrypt(macs)[-16:])
+    if (file_mac[0] ^ file_mac[1], file_mac[2] ^ file_mac[3]) != meta_mac:
+        sys.exit(f'the meta-MAC of a {len(data)} byte file differs from the reference')
+
+    file_key = (k[0] ^ iv[0], k[1] ^ iv[1], k[2] ^ meta_mac[0], k[3] ^ meta_mac[1], *iv, *meta_mac)
+    encrypted = new_ctr_cipher(k_str, iv + (0, 0)).encrypt(data)
+    return encrypted, f'https://mega.nz/file/{FILE_ID}#{a32_to_base64(file_key)}'
+
+
+def new_mega(stand_in: MegaStandIn):
+    from akyuu_bot.util.async_mega import AsyncMega
+
+    class StandInMega(AsyncMega):
+        @property
+        def url(self) -> str:
+            return f'{stand_in.url}/cs'
+
+    return StandInMega()
+
+
+async def download(mega, link: str, connections: int) -> bytes:
+    out = BytesIO()
+    await mega.async_download_public_url(link, outfile=out, connections=connections)
+    return out.getvalue()
+
+
+# the checks
+
+
+async def check_ranges(size: int, connections: int) -> Optional[str]:
+    """
+    What's wrong with the ranges a file of `size` bytes is split into, if anything
+    """
+    from akyuu_bot.util.async_mega import get_chunks, get_ranges
+
+    ranges = [r async for r in get_ranges(size, connections)]
+    boundaries = {start for start, _ in [c async for c in get_chunks(size)]} | {size}
+    if len(ranges) > connections:
+        return f'{len(ranges)} ranges for {connections} connections'
+    if ranges[0][0] != 0 or ranges[-1][1] != size or any(a[1] != b[0] for a, b in zip(ranges, ranges[1:])):
+        return f"ranges {ranges} don't cover the file"
+    if any(start not in boundaries or end not in boundaries for start, end in ranges):
+        return f"ranges {ranges} don't start and end on chunks"
+    return None
+
+
+async def run_checks(stand_in: MegaStandIn, sizes: list[int], connection_counts: list[int]) -> list[str]:
+    failures = []
+    mega = new_mega(stand_in)
+    try:
+        for size in sizes:
+            data = os.urandom(size)
+            stand_in.blob, link = await encrypt_file(data, size)
+            for connections in connection_counts:
+                if size and (problem := await check_ranges(size, connections)):
+                    failures.append(f'{size} bytes, {connections} connections: {problem}')
+                for ranges in (True, False):
+                    stand_in.ranges = ranges
+                    stand_in.requests.clear()
+                    case = f'{size} bytes, {connections} connections, {"with" if ranges else "without"} ranges'
+                    try:
+                        if await download(mega, link, connections) != data:
+                            failures.append(f'{case}: the download came back different')
+                    except Exception as e:
+                        failures.append(f'{case}: {e!r}')
+                        continue
+                    if ranges and connections > 1 and size and stand_in.requests[200]:
+                        failures.append(f'{case}: {stand_in.requests[200]} requests for the whole file')
+                    if not ranges and stand_in.requests[200] > 1 + (connections if connections > 1 else 0):
+                        failures.append(f'{case}: the whole file was requested {stand_in.requests[200]} times')
+    finally:
+        stand_in.ranges = True
+        await mega.close()
+    return failures
+
+
+class FakeContext:
+    def __init__(self):
+        self.sent: list[str] = []
+
+    async def defer(self, ephemeral: bool = False):
+        pass
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        self.sent.append(content)
+
+
+def zipped_patch(patch: bytes) -> bytes:
+    from zipfile import ZIP_DEFLATED, ZipFile
+
+    out = BytesIO()
+    with ZipFile(out, 'w', ZIP_DEFLATED) as f:
+        f.writestr('release/patch.ups', patch)
+    return out.getvalue()
+
+
+async def check_integrity(stand_in: MegaStandIn, connection_counts: list[int]) -> list[str]:
+    """
+    Runs /update's Mega download on an intact, a corrupted and a cut off file, and checks that only the intact
+    one gets to update the patch
+    """
+    from types import SimpleNamespace
+
+    from akyuu_bot.bot.extensions.dev_commands import DevExt
+    from akyuu_bot.config import config
+    from akyuu_bot.util.async_mega import IntegrityError
+
+    patch = os.urandom(5 * 0x20000 + 4321)  # incompressible, so the zip has a few chunks too
+    encrypted, link = await encrypt_file(zipped_patch(patch), 1)
+    corrupted = bytearray(encrypted)
+    corrupted[len(corrupted) // 2] ^= 1
+    cases = {'intact': encrypted, 'corrupted': bytes(corrupted), 'cut off': encrypted[:-1000]}
+
+    failures = []
+    mega = new_mega(stand_in)
+    updates = []
+
+    async def update_patch(rom, new_patch, **kwargs):
+        updates.append(new_patch)
+        return True
+
+    async def get_mega():
+        return mega
+
+    ext = object.__new__(DevExt)  # Extension.__new__ would register the commands with a client
+    ext.bot = ext.client = SimpleNamespace(get_mega=get_mega, get_rom=lambda: b'rom', update_patch=update_patch,
+                                           offsets_report=lambda: '')
+    stand_in.size = len(encrypted)
+    try:
+        for connections in connection_counts:
+            config.bot_data.MEGA_DOWNLOAD_CONNECTIONS = connections
+            for case, blob in cases.items():
+                stand_in.blob = blob
+                updates.clear()
+                ctx = FakeContext()
+                name = f'{case} file, {connections} connections'
+                try:
+                    await ext._mega_download(ctx, link, 'patch.ups')
+                except IntegrityError:
+                    if leftover := asyncio.all_tasks() - {asyncio.current_task()}:
+                        failures.append(f'{name}: {len(leftover)} range downloads were still running after it failed')
+                    if case == 'intact':
+                        failures.append(f'{name}: raised IntegrityError')
+                    elif updates:
+                        failures.append(f'{name}: the patch was updated before IntegrityError was raised')
+                    elif not any('corrupted' in message for message in ctx.sent):
+                        failures.append(f"{name}: the developer wasn't told why nothing was updated")
+                    continue
+                except Exception as e:
+                    failures.append(f'{name}: {e!r}')
+                    continue
+                if case != 'intact':
+                    failures.append(f"{name}: didn't raise IntegrityError, and updated {len(updates)} times")
+                elif updates != [patch]:
+                    failures.append(f'{name}: updated the patch {len(updates)} times, '
+                                    f'{"not " if patch not in updates else ""}with the right patch')
+    finally:
+        stand_in.size = None
+        await mega.close()
+    return failures
+
+
+async def timed(stand_in: MegaStandIn, size: int, connection_counts: list[int]):
+    data = os.urandom(size)
+    stand_in.blob, link = await encrypt_file(data, 0)
+    mega = new_mega(stand_in)
+    try:
+        for connections in connection_counts:
+            start = time.perf_counter()
+            await download(mega, link, connections)
+            seconds = time.perf_counter() - start
+            print(f'{connections:3} connections: {seconds * 1000:7.1f}ms, {size / seconds / 2 ** 20:6.1f}MiB/s')
+    finally:
+        await mega.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mib', type=float, default=8, help='the size of the file that gets timed')
+    parser.add_argument('--latency', type=float, default=50, help="the stand-in's time to first byte (ms)")
+    parser.add_argument('--bandwidth', type=float, default=4, help="the stand-in's speed per connection (MiB/s)")
+    args = parser.parse_args()
+
+    chunk = 0x20000
+    sizes = [0, 1, 100, chunk, chunk + 1, 5 * chunk + 12345, 3 * 2 ** 20 + 7]  # the last ranges are uneven
+    connection_counts = [1, 2, 3, 4, 64]  # 64 is more than any of these files have chunks
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # the bot reads akyuu.json from here
+        with open('akyuu.json', 'w') as f:
+            json.dump({'bot_data': {'TOKEN': ''}}, f)
+        stand_in = MegaStandIn()
+        stand_in.start()
+        try:
+            failures = asyncio.run(run_checks(stand_in, sizes, connection_counts))
+            for failure in failures:
+                print(failure)
+            print(f'{len(sizes) * len(connection_counts) * 2 - len(failures)} downloads ok')
+            mac_failures = asyncio.run(check_integrity(stand_in, [1, 4]))
+            for failure in mac_failures:
+                print(failure)
+            print(f'{2 * 3 - len(mac_failures)} MAC checks ok')
+            failures += mac_failures
+            stand_in.latency = args.latency / 1000
+            stand_in.bandwidth = args.bandwidth * 2 ** 20
+            asyncio.run(timed(stand_in, int(args.size_mib * 2 ** 20), [1, 2, 4, 8]))
+        finally:
+            stand_in.stop()
+        if failures:
+            sys.exit(f'{len(failures)} checks failed')
+
+
+if __name__ == '__main__':
+    main()
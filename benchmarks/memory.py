@@ -0,0 +1,105 @@
+"""
+Measures how much memory the extracted data takes.
+
+Run it from a directory with an akyuu.json and the rom and patch that it points to:
+
+    python benchmarks/memory.py
+
+It extracts everything from the patched rom and reports the size of each extractor's result, counting every object
+reachable from it once. Objects shared between results (like interned strings) are counted for the first result
+that reaches them. It also reports what tracemalloc saw being kept, for extraction and for loading the saved snapshot.
+"""
+import asyncio
+import gc
+import hashlib
+import sys
+import tracemalloc
+from collections import Counter
+
+from akyuu_bot.config import get_config
+
+
+def deep_size(obj, seen: set[int], counts: Counter) -> int:
+    """
+    sys.getsizeof of everything reachable from obj that's not in `seen` yet
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, type):
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        counts[type(o).__name__] += 1
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif isinstance(o, (str, bytes, int, float, memoryview)) or o is None:
+            pass
+        else:
+            if hasattr(o, '__dict__'):
+                stack.append(o.__dict__)
+            for cls in type(o).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if name not in ('__dict__', '__weakref__') and hasattr(o, name):
+                        stack.append(getattr(o, name))
+    return size
+
+
+def kept(func):
+    """
+    Runs func, and returns its result with how much memory was still allocated after and at the peak
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+async def main():
+    from akyuu_bot.bot.akyuu import AkyuuBot
+    from akyuu_bot.rom_api.dataset import build_dataset, load_snapshot
+
+    conf = get_config()
+    with open(conf.bot_data.ROM_PATH, 'rb') as f:
+        rom = f.read()
+    with open(conf.bot_data.PATCH_PATH, 'rb') as f:
+        patch = f.read()
+    rom_hash, patch_hash = hashlib.sha256(rom).hexdigest(), hashlib.sha256(patch).hexdigest()
+    patched = AkyuuBot.patch_rom(rom, patch, rom_hash, patch_hash)
+
+    await build_dataset(patched, conf, rom_hash, patch_hash)  # so lazy imports don't count
+    gc.collect()
+    tracemalloc.start()
+    dataset = await build_dataset(patched, conf, rom_hash, patch_hash)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seen: set[int] = set()
+    print(f"{'result':<16} {'objects':>8} {'KiB':>10}  biggest object types")
+    total = 0
+    for name, result in dataset.results.items():
+        counts = Counter()
+        size = deep_size(result, seen, counts)
+        total += size
+        common = ', '.join(f'{tp} x{n}' for tp, n in counts.most_common(3))
+        print(f'{name:<16} {sum(counts.values()):>8} {size / 1024:10.1f}  {common}')
+    print(f"{'total':<16} {len(seen):>8} {total / 1024:10.1f}")
+    print(f'\nextraction: {current / 1024:.1f}KiB kept, {peak / 1024:.1f}KiB peak')
+
+    snapshot, current, peak = kept(lambda: load_snapshot(conf.bot_data.SNAPSHOT_PATH, conf))
+    if snapshot is None:
+        print(f'no snapshot at {conf.bot_data.SNAPSHOT_PATH!r}. Run the bot once to make one')
+    else:
+        print(f'loading the snapshot: {current / 1024:.1f}KiB kept, {peak / 1024:.1f}KiB peak')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
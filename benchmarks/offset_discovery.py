@@ -0,0 +1,144 @@
+"""
+Measures how long /update spends looking for moved tables, and checks that it finds them.
+
+Run it from a directory with an akyuu.json and the rom and patch that it points to:
+
+    python benchmarks/offset_discovery.py
+
+The data extracted with the configured offsets is the reference. "unmoved" is the usual update, where every
+table is still where the config says. "moved" copies every table past the end of the rom, like a patch that
+repoints them, fills where they were with junk, and checks that each one is found where it was moved to.
+Both are also run with the reference saved to disk and loaded back, like it is after a restart.
+Exits with an error if any table isn't found where it should be.
+"""
+import asyncio
+import hashlib
+import random
+import sys
+import tempfile
+import time
+
+from attr import fields
+
+from akyuu_bot.config import Offsets, get_config
+
+
+def table_sizes(rom, conf) -> dict[str, int]:
+    """
+    How many bytes every table in Offsets takes
+    """
+    from akyuu_bot.rom_api.stats import DexRaw, RawBonekaName, RawBonekaStatData, RawLevelUpMoveName, TypeName, \
+        TypeEffectiveness, TYPE_ENDTABLE
+    from akyuu_bot.rom_api.wild_data import RawWildLocation
+
+    chart = conf.offsets.TYPE_EFFECTIVENESS_OFFSET - 0x08000000
+    chart_size = TypeEffectiveness.size
+    while rom[chart + chart_size - TypeEffectiveness.size] != TYPE_ENDTABLE:
+        chart_size += TypeEffectiveness.size
+    return {
+        'SPRITE_OFFSET': 8 * conf.BONEKA_COUNT,
+        'PALETTE_OFFSET': 8 * conf.BONEKA_COUNT,
+        'SHINY_PALETTE_OFFSET': 8 * conf.BONEKA_COUNT,
+        'BONEKA_STAT_OFFSET': RawBonekaStatData.size * conf.BONEKA_COUNT,
+        'BONEKA_NAME_OFFSET': RawBonekaName.size * conf.BONEKA_COUNT,
+        'MOVE_NAME_OFFSET': RawLevelUpMoveName.size * conf.MOVE_COUNT,
+        'LEVEL_UP_MOVE_OFFSET': 4 * conf.BONEKA_COUNT,
+        'DEX_DATA_OFFSET': DexRaw.size * conf.DEX_LENGTH,
+        'ABILITY_NAME_OFFSET': RawLevelUpMoveName.size * conf.ABILITY_TABLE_LEN,
+        'TYPE_NAMES_OFFSET': TypeName.size * conf.TYPE_TABLE_LEN,
+        'TYPE_EFFECTIVENESS_OFFSET': chart_size,
+        'DEX_NUMBERS_OFFSET': 2 * conf.BONEKA_COUNT,
+        'MAP_BANKS_OFFSET': 4 * conf.MAP_BANK_COUNT,
+        'MAP_NAMES_OFFSET': 4 * conf.NUM_MAP_NAMES,
+        'WILD_DATA_OFFSET': RawWildLocation.size * conf.WILD_DATA_LEN,
+    }
+
+
+def move_tables(rom: bytes, conf, seed: int = 0) -> tuple[bytes, dict[str, int]]:
+    """
+    A copy of `rom` with every table moved past its end, and where they went
+    """
+    rng = random.Random(seed)
+    moved = bytearray(rom)
+    end = len(moved)
+    new = {}
+    sizes = table_sizes(rom, conf)
+    for name, size in sizes.items():
+        old = getattr(conf.offsets, name) - 0x08000000
+        end = (end + 3) // 4 * 4 + rng.randrange(1, 64) * 4  # aligned, with some junk between tables
+        moved.extend(rng.randbytes(end - len(moved)))
+        moved.extend(rom[old:old + size])
+        new[name] = end + 0x08000000
+        end += size
+    for name, size in sizes.items():
+        old = getattr(conf.offsets, name) - 0x08000000
+        moved[old:old + size] = rng.randbytes(size)
+    return bytes(moved), new
+
+
+async def timed(rom, conf, reference) -> tuple[float, list]:
+    from akyuu_bot.rom_api.offset_discovery import discover_offsets
+
+    best, discoveries = float('inf'), None
+    for _ in range(5):
+        start = time.perf_counter()
+        discoveries = await discover_offsets(rom, conf, reference)
+        best = min(best, time.perf_counter() - start)
+    return best, discoveries
+
+
+async def main():
+    from akyuu_bot.bot.akyuu import AkyuuBot
+    from akyuu_bot.rom_api.dataset import build_dataset, load_snapshot, save_snapshot
+    from akyuu_bot.rom_api.rom import Rom
+
+    conf = get_config()
+    with open(conf.bot_data.ROM_PATH, 'rb') as f:
+        rom = f.read()
+    with open(conf.bot_data.PATCH_PATH, 'rb') as f:
+        patch = f.read()
+    rom_hash, patch_hash = hashlib.sha256(rom).hexdigest(), hashlib.sha256(patch).hexdigest()
+    patched = AkyuuBot.patch_rom(rom, patch, rom_hash, patch_hash)
+    reference = await build_dataset(patched, conf, rom_hash, patch_hash)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f'{tmp}/snapshot.json'
+        save_snapshot(reference, path)
+        from_disk = load_snapshot(path, conf)
+
+    unmoved = {field.name: getattr(conf.offsets, field.name) for field in fields(Offsets)}
+    moved_rom, moved = move_tables(patched, conf)
+    wrong = 0
+    for case, rom_, expected, reference_ in (('unmoved', patched, unmoved, reference),
+                                            ('unmoved, reference from disk', patched, unmoved, from_disk),
+                                            ('moved', Rom(moved_rom), moved, reference),
+                                            ('moved, reference from disk', Rom(moved_rom), moved, from_disk)):
+        seconds, discoveries = await timed(rom_, conf, reference_)
+        print(f"{case}: {seconds * 1000:7.1f}ms, {sum(d.moved for d in discoveries)} tables moved, "
+              f"{sum(d.new is None for d in discoveries)} not found")
+        wrong += check(discoveries, expected)
+    if wrong:
+        sys.exit(f"{wrong} tables weren't found where they should be")
+
+
+def check(discoveries, expected: dict[str, int]) -> int:
+    """
+    Prints every table that wasn't found at its expected offset. Returns how many there were
+    """
+    found = {d.name: d for d in discoveries}
+    wrong = 0
+    for field in fields(Offsets):
+        d = found.get(field.name)
+        if d is None:
+            print(f"  {field.name:<26} not checked")
+            wrong += 1
+        elif d.new != expected[field.name]:
+            new = 'not found' if d.new is None else f'{d.new:#010x}'
+            print(f"  {field.name:<26} {d.old:#010x} -> {new} (expected {expected[field.name]:#010x}, "
+                  f"score {d.score:.2f}) WRONG")
+            wrong += 1
+    return wrong
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,179 @@
+"""
+Checks that a dataset saved to disk loads back as the same data, and measures how long saving and loading take.
+Also checks a second version saved next to it, which is loaded sharing the records the two have in common,
+and both of them published as a generation for the shards and mapped back from that.
+
+It runs fully offline, from any directory:
+
+    python benchmarks/snapshot_roundtrip.py [--boneka 412] [--locations 172]
+
+A snapshot loaded with a different config has to keep the one it was extracted with.
+The dataset is the synthetic one from load_test.py. It works in a temporary directory with its own akyuu.json.
+Exits with an error listing what came back different, if anything did.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def differences(built, loaded) -> list[str]:
+    """
+    What a loaded dataset has that's different from the one that was saved
+    """
+    checks = {
+        'version': (built.version, loaded.version),
+        'boneka': (built.boneka_data, loaded.boneka_data),
+        'wild': (built.wild_data, loaded.wild_data),
+        'move_names': (built.results['move_names'], loaded.results['move_names']),
+        'palettes': (built.results['palettes'], loaded.results['palettes']),
+        'shiny_palettes': (built.results['shiny_palettes'], loaded.results['shiny_palettes']),
+        'type_names': (built.results['type_names'], loaded.results['type_names']),
+        'type_effectiveness': (built.results['type_effectiveness'], loaded.results['type_effectiveness']),
+        'dex_index': (built.dex_index.to_data(), loaded.dex_index.to_data()),
+        # without a palette there's no sprite to read the indices back out of
+        'sprite_indices': tuple([i for i, palette in zip(dataset.sprite_sheets.indices, dataset.results['palettes'])
+                                 if palette is not None] for dataset in (built, loaded)),
+    }
+    found = [name for name, (a, b) in checks.items() if a != b]
+    slots = [sum(len(table or ()) for loc in dataset.wild_data for table in (loc.grass, loc.surf, loc.tree, loc.fish))
+             for dataset in (built, loaded)]
+    if slots[0] != slots[1]:
+        found.append(f'encounter slots: {slots[0]} saved, {slots[1]} loaded')
+    return found
+
+
+def check(args: argparse.Namespace):
+    from akyuu_bot.config import config
+    from akyuu_bot.rom_api.dataset import load_snapshot, save_snapshot
+    from load_test import synthetic_dataset
+
+    built = synthetic_dataset(random.Random(args.seed), args.boneka, args.locations)
+    start = time.perf_counter()
+    save_snapshot(built, 'snapshot.json')
+    saved = time.perf_counter()
+    loaded = load_snapshot('snapshot.json', config)
+    done = time.perf_counter()
+    print(f'snapshot: {os.path.getsize("snapshot.json") / 1024:.0f}KiB, saved in {(saved - start) * 1000:.0f}ms, '
+          f'loaded in {(done - saved) * 1000:.0f}ms')
+    if loaded is None:
+        sys.exit('the snapshot could not be loaded')
+    if found := differences(built, loaded):
+        sys.exit(f'the snapshot loaded back different: {", ".join(found)}')
+    print('snapshot loaded back equal')
+    check_config(built)
+    check_versions(built)
+
+
+def check_config(built):
+    """
+    A snapshot loaded with a different config keeps the config it was extracted with, and building the results
+    it doesn't have leaves its own results alone
+    """
+    from attr import evolve
+
+    from akyuu_bot.config import config
+    from akyuu_bot.rom_api.dataset import config_fingerprint, load_snapshot
+
+    other = evolve(config, SPRITE_FORMAT='webp' if built.config.SPRITE_FORMAT == 'png' else 'png')
+    loaded = load_snapshot('snapshot.json', other)
+    if config_fingerprint(loaded.config) != config_fingerprint(built.config):
+        sys.exit('the snapshot took on the config it was loaded with')
+    results = dict(loaded.results)
+    loaded.stat_table, loaded.learners, loaded.type_chart, loaded.sprite_sheets
+    if loaded.results.keys() != results.keys():
+        sys.exit(f'building the missing results added {sorted(loaded.results.keys() - results.keys())} to the snapshot')
+    print('snapshot kept its own config and results')
+
+
+def beta_version(main):
+    """
+    A version with a few boneka and wild locations changed, and everything else equal to `main`
+    """
+    from attr import evolve
+
+    boneka = tuple(evolve(b, name=f'{b.name} Beta') if i % 50 == 1 else b for i, b in enumerate(main.boneka_data))
+    wild = tuple(evolve(loc, grass=loc.fish, fish=loc.grass) if i % 20 == 1 else loc
+                 for i, loc in enumerate(main.wild_data))
+    return evolve(main, results={**main.results, 'boneka': boneka, 'wild': wild}, version='synthetic beta')
+
+
+def shared(a, b) -> int:
+    """
+    How many of the records in `a` are the same objects as in `b`
+    """
+    return sum(x is y for x, y in zip(a.boneka_data, b.boneka_data)) + sum(
+        x is y for x, y in zip(a.wild_data, b.wild_data))
+
+
+def check_versions(main):
+    """
+    The main version and a beta, saved and loaded back like the bot does between restarts
+    """
+    from akyuu_bot.bot.akyuu import AkyuuBot
+    from akyuu_bot.config import config
+    from akyuu_bot.rom_api.dataset import save_snapshot
+
+    config.bot_data.VERSION_PATCHES = {'beta': 'beta.ups'}
+    beta = beta_version(main)
+    save_snapshot(main, config.bot_data.SNAPSHOT_PATH)
+    save_snapshot(beta, AkyuuBot.version_snapshot_path('beta'))
+
+    bot = AkyuuBot.__new__(AkyuuBot)
+    bot.init_state()
+    if not bot.load_snapshot() or 'beta' not in bot.versions:
+        sys.exit('the version snapshots could not be loaded')
+    for name, built, loaded in (('main', main, bot.dataset), ('beta', beta, bot.versions['beta'])):
+        if found := differences(built, loaded):
+            sys.exit(f'the {name} version loaded back different: {", ".join(found)}')
+    if shared(bot.dataset, bot.versions['beta']) < shared(main, beta):
+        sys.exit('the loaded versions share fewer records than the ones that were saved')
+    print(f'versions loaded back equal, sharing {shared(bot.dataset, bot.versions["beta"])} records')
+    check_generation(bot)
+
+
+def check_generation(bot):
+    """
+    Publishes what `bot` has as a generation, and loads it back like a shard does
+    """
+    from akyuu_bot.bot.shards import load_generation, publish_generation
+    from akyuu_bot.config import config
+
+    name = publish_generation(bot)
+    start = time.perf_counter()
+    loaded = load_generation(name)
+    attached = time.perf_counter()
+    if loaded is None or loaded[1] is None or 'beta' not in loaded[2]:
+        sys.exit(f'generation {name!r} could not be loaded')
+    conf, main, versions = loaded
+    if conf.to_json() != config.to_json():
+        sys.exit(f'generation {name!r} has a different config')
+    for version, built, loaded in (('main', bot.dataset, main), ('beta', bot.versions['beta'], versions['beta'])):
+        if found := differences(built, loaded):
+            sys.exit(f'the {version} version of generation {name!r} loaded back different: {", ".join(found)}')
+        # the sprites have to stay in the mapped file, or every shard has its own copy of them again
+        if not all(isinstance(b.sprite, memoryview) for b in loaded.boneka_data if b.sprite is not None):
+            sys.exit(f'the {version} version of generation {name!r} copied its sprites out of the file')
+    print(f'generation {name!r} loaded back equal in {(attached - start) * 1000:.0f}ms, sharing '
+          f'{shared(main, versions["beta"])} records')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--boneka', type=int, default=412, help='boneka in the synthetic dataset')
+    parser.add_argument('--locations', type=int, default=172, help='wild locations in the synthetic dataset')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # the bot reads akyuu.json from here
+        with open('akyuu.json', 'w') as f:
+            json.dump({'bot_data': {'TOKEN': ''}}, f)
+        check(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Measures the size and encode time of every sprite encoding option, which is what SPRITE_SCALE and SPRITE_FORMAT
+were picked from.
+
+Run it from a directory with an akyuu.json and the rom and patch that it points to:
+
+    python benchmarks/sprite_encoding.py
+
+Every sprite is decompressed once up front, so only the encoding is timed. "before" is how sprites used to be
+encoded: scaled up 4x and saved with Pillow's default png settings.
+"""
+import hashlib
+import io
+import time
+
+from akyuu_bot.config import get_config
+from akyuu_bot.rom_api.rom import Pointer
+from akyuu_bot.rom_api.sprite_png import SPRITE_SIZE, decode_palette, decode_sprite, encode_sprite
+from akyuu_bot.rom_api.stats import SpriteData
+
+OPTIONS = [(scale, fmt) for fmt in ('png', 'webp') for scale in (1, 2, 4)]
+
+
+def before(indices: bytes, palette: bytes) -> bytes:
+    from PIL import Image
+
+    im = Image.frombytes('P', (SPRITE_SIZE, SPRITE_SIZE), indices)
+    im.putpalette(palette)
+    im = im.resize((SPRITE_SIZE * 4, SPRITE_SIZE * 4), Image.NEAREST)
+    out = io.BytesIO()
+    im.save(out, 'PNG', transparency=0)
+    return out.getvalue()
+
+
+def report(name: str, encode, decoded: list[tuple[bytes, bytes]]):
+    start = time.perf_counter()
+    encoded = [encode(indices, palette) for indices, palette in decoded]
+    seconds = (time.perf_counter() - start) / len(decoded)
+    total = sum(map(len, encoded))
+    print(f'{name:<12} {total / len(encoded):8.0f}B {total / 1024:10.1f}KiB {seconds * 1e6:10.0f}us')
+
+
+def main():
+    from akyuu_bot.bot.akyuu import AkyuuBot
+
+    conf = get_config()
+    with open(conf.bot_data.ROM_PATH, 'rb') as f:
+        rom = f.read()
+    with open(conf.bot_data.PATCH_PATH, 'rb') as f:
+        patch = f.read()
+    rom = AkyuuBot.patch_rom(rom, patch, hashlib.sha256(rom).hexdigest(), hashlib.sha256(patch).hexdigest())
+
+    stream = rom.create_stream()
+    sprite_table = rom.deref_array(Pointer[SpriteData](conf.offsets.SPRITE_OFFSET), conf.BONEKA_COUNT)
+    pal_table = rom.deref_array(Pointer[SpriteData](conf.offsets.PALETTE_OFFSET), conf.BONEKA_COUNT)
+    decoded = [(decode_sprite(stream, sprite.ptr), decode_palette(stream, pal.ptr))
+               for sprite, pal in zip(sprite_table[1:], pal_table[1:])]
+
+    print(f'{len(decoded)} sprites')
+    print(f"{'option':<12} {'average':>9} {'total':>13} {'per sprite':>12}")
+    report('before', before, decoded)
+    for scale, fmt in OPTIONS:
+        report(f'{fmt} x{scale}', lambda i, p: encode_sprite(i, p, scale, fmt), decoded)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Measures how long the bot takes to start.
+
+Run it from a directory with an akyuu.json and the rom and patch that it points to:
+
+    python benchmarks/startup.py [--top 20]
+
+It prints a `python -X importtime` report of everything the bot imports on startup, which of the
+lazily imported dependencies got imported anyway, and the wall clock time from starting a fresh
+interpreter to the first command being served. Logging in to Discord needs the network,
+so that part is left out of the wall clock time. The first run extracts everything and saves a snapshot,
+later runs serve the first command from that snapshot.
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+LAZY_MODULES = ('mega', 'Crypto', 'aiofiles', 'tenacity', 'PIL', 'requests', 'numpy')
+
+STARTUP_IMPORTS = '''
+from akyuu_bot.config import get_config
+get_config()
+import akyuu_bot.bot.akyuu
+from akyuu_bot.bot.extensions import sanity, boneka, stat_query, moves, dev_commands, help
+'''
+
+FIRST_COMMAND = '''
+import asyncio, sys, time
+from akyuu_bot.config import get_config
+
+class Context:
+    async def send(self, *args, **kwargs):
+        print(time.time())
+
+async def main():
+    get_config()
+    from akyuu_bot.bot.akyuu import AkyuuBot
+    from akyuu_bot.bot.extensions import sanity, boneka, stat_query, moves, dev_commands, help
+
+    # the Discord client itself needs the network to start, so only the bot's own state is set up
+    bot = AkyuuBot.__new__(AkyuuBot)
+    bot.init_state()
+    if not bot.load_snapshot():  # what __init__ does
+        await bot.load_data()  # what on_ready waits for if there's no snapshot yet
+    ext = object.__new__(boneka.BonekaExt)
+    ext.bot = bot
+    await ext.stats(Context(), bot.boneka_data[1].name)
+    print([m for m in %r if m in sys.modules], file=sys.stderr)
+
+asyncio.run(main())
+''' % (LAZY_MODULES,)
+
+
+def import_report(top: int):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_IMPORTS + f'''
+import sys
+print([m for m in {LAZY_MODULES!r} if m in sys.modules])
+'''], capture_output=True, text=True, check=True)
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+
+    print(f"{'cumulative (ms)':>16} {'self (ms)':>10}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f'{cumulative_us / 1000:16.1f} {self_us / 1000:10.1f}  {name}')
+    total = sum(self_us for _, self_us, _ in rows)
+    print(f'\n{len(rows)} modules imported in {total / 1000:.1f}ms')
+    print(f'lazy dependencies imported on startup: {proc.stdout.strip()}')
+
+
+def first_command():
+    start = time.time()
+    proc = subprocess.run([sys.executable, '-c', FIRST_COMMAND], capture_output=True, text=True, check=True)
+    served = float(proc.stdout.split()[-1])
+    print(f'first command served after {served - start:.3f}s')
+    print(f'lazy dependencies imported by then: {proc.stderr.strip().splitlines()[-1]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--top', type=int, default=20, help='how many of the slowest imports to show')
+    args = parser.parse_args()
+    import_report(args.top)
+    print()
+    first_command()
@@ -0,0 +1,113 @@
+"""
+Measures how long /filter and /top take to evaluate, on the real stat table and on a synthetic one.
+
+Run it from a directory with an akyuu.json and the rom and patch that it points to:
+
+    python benchmarks/stat_queries.py [--rows 100000]
+
+The real table is loaded the same way the bot does on startup (the saved snapshot if there is one).
+For comparison, each query is also run as a plain Python loop over the Boneka objects.
+"""
+import argparse
+import asyncio
+import timeit
+
+import numpy as np
+
+from akyuu_bot.config import get_config
+from akyuu_bot.rom_api.stat_table import StatTable, STAT_COLUMNS, STAT_ALIASES
+
+QUERIES = ('speed>100', 'speed>100 type=Fire', 'bst>=500 hp<100 type!=Normal')
+TOP = (('bst', 10), ('speed', 10), ('hp', 100))
+
+
+def python_filter(boneka, query: str):
+    """
+    What the query would cost as a loop over every Boneka
+    """
+    conditions = []
+    for part in query.split():
+        for op in ('>=', '<=', '!=', '>', '<', '='):
+            if op in part:
+                field, value = part.split(op, 1)
+                conditions.append((field, op, value))
+                break
+
+    def matches(b):
+        for field, op, value in conditions:
+            if field == 'type':
+                has = value.lower() in (b.stats.type_1.lower(), b.stats.type_2.lower())
+                ok = has if op == '=' else not has
+            else:
+                stats = {column: getattr(b.stats, column) for column in STAT_COLUMNS}
+                stats['bst'] = sum(stats.values())
+                x, y = stats[STAT_ALIASES[field]], int(value)
+                ok = {'>=': x >= y, '<=': x <= y, '!=': x != y, '>': x > y, '<': x < y, '=': x == y}[op]
+            if not ok:
+                return False
+        return True
+
+    return [b for b in boneka if matches(b)]
+
+
+def python_top(boneka, stat: str, count: int):
+    def key(b):
+        if stat == 'bst':
+            return sum(getattr(b.stats, column) for column in STAT_COLUMNS)
+        return getattr(b.stats, stat)
+
+    return sorted(boneka, key=key, reverse=True)[:count]
+
+
+def synthetic_table(rows: int, types: tuple[str, ...], abilities: tuple[str, ...]) -> StatTable:
+    rng = np.random.default_rng(0)
+    stats = {column: rng.integers(5, 256, rows) for column in STAT_COLUMNS}
+    type_pairs = [(types[a], types[b]) for a, b in rng.integers(0, len(types), (rows, 2))]
+    ability_pairs = [(abilities[a], abilities[b]) for a, b in rng.integers(0, len(abilities), (rows, 2))]
+    return StatTable.from_columns([f'Boneka {i}' for i in range(rows)], stats, type_pairs, ability_pairs)
+
+
+def report(name: str, func, number: int):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f'{name:<48} {seconds * 1e6:10.1f}us')
+
+
+def bench(table: StatTable, boneka=None):
+    number = max(1, 200_000 // len(table))
+    for query in QUERIES:
+        report(f'filter {query!r}', lambda: table.filter(query, 0, 15), number)
+        if boneka is not None:
+            report('  python loop', lambda: python_filter(boneka, query), number)
+    for stat, count in TOP:
+        report(f'top {stat} {count}', lambda: table.top(stat, 0, count), number)
+        if boneka is not None:
+            report('  python loop', lambda: python_top(boneka, stat, count), number)
+
+
+async def load_boneka():
+    from akyuu_bot.bot.akyuu import AkyuuBot
+
+    bot = AkyuuBot.__new__(AkyuuBot)
+    bot.init_state()
+    if not bot.load_snapshot():
+        await bot.load_data()
+    return bot.boneka_data, bot.stat_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000, help='rows in the synthetic table')
+    args = parser.parse_args()
+
+    get_config()
+    boneka, table = asyncio.run(load_boneka())
+    print(f'real table: {len(table)} rows')
+    bench(table, boneka)
+
+    synthetic = synthetic_table(args.rows, table.type_names, table.ability_names)
+    print(f'\nsynthetic table: {len(synthetic)} rows')
+    bench(synthetic)
+
+
+if __name__ == '__main__':
+    main()
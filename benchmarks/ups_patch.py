@@ -0,0 +1,155 @@
+"""
+Checks the ups_wrapper extension and the patched rom cache, and measures how long patching takes.
+
+It needs the extension built (pip install -e .), and runs offline from any directory:
+
+    python benchmarks/ups_patch.py [--size 16] [--threads 4]
+
+A patch is made here for a random --size MiB rom. It checks that:
+- the patch can be given as bytes, a memoryview or an mmap
+- the output wraps with memoryview without copying, read only, and is the patched rom
+- patches applied from --threads threads at once run in parallel, because the GIL is released while patching
+- the patched rom is mapped from the cache, whether it was just patched or already there
+- a cache hit counts as a use, so the patched rom cache evicts the least recently used rom
+
+It works in a temporary directory with its own akyuu.json. Exits with an error on the first check that fails.
+"""
+import argparse
+import json
+import mmap
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+def vlq(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        x = n & 0x7f
+        n >>= 7
+        if n == 0:
+            out.append(0x80 | x)
+            return bytes(out)
+        out.append(x)
+        n -= 1
+
+
+def make_patch(source: bytes, target: bytes) -> bytes:
+    """
+    A ups patch from `source` to `target`, which have to be the same size and end on a byte they share
+    """
+    import numpy as np
+
+    xor = np.bitwise_xor(np.frombuffer(source, np.uint8), np.frombuffer(target, np.uint8))
+    patch = bytearray(b'UPS1' + vlq(len(source)) + vlq(len(target)))
+    pos = 0
+    changed = np.flatnonzero(xor)
+    # split the changed bytes into runs of consecutive ones
+    for run in np.split(changed, np.flatnonzero(np.diff(changed) != 1) + 1) if len(changed) else ():
+        start, end = int(run[0]), int(run[-1]) + 1
+        patch += vlq(start - pos) + xor[start:end].tobytes()
+        patch.append(0)  # ends the hunk, and covers the equal byte after it
+        pos = end + 1
+    patch += zlib.crc32(source).to_bytes(4, 'little') + zlib.crc32(target).to_bytes(4, 'little')
+    patch += zlib.crc32(patch).to_bytes(4, 'little')
+    return bytes(patch)
+
+
+def sample_roms(rng: random.Random, size: int) -> tuple[bytes, bytes]:
+    source = rng.randbytes(size)
+    target = bytearray(source)
+    for _ in range(size // 1024):
+        start = rng.randrange(size - 64)
+        end = start + rng.randrange(1, 32)
+        target[start:end] = bytes(b ^ 0xff for b in target[start:end])
+    target[-1] = source[-1]
+    return source, bytes(target)
+
+
+def check_inputs(UpsPatch, source: bytes, target: bytes, patch: bytes):
+    with tempfile.TemporaryFile() as f:
+        f.write(patch)
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for name, given in (('bytes', patch), ('memoryview', memoryview(patch)), ('mmap', mapped)):
+                view = memoryview(UpsPatch(given).apply(source))
+                if not view.readonly or view.format != 'B' or view.nbytes != len(target):
+                    sys.exit(f'patching with {name}: the output is not a read only byte buffer of the right size')
+                if view != target:
+                    sys.exit(f'patching with {name}: the output is not the patched rom')
+                view.release()
+    print('patches given as bytes, memoryview and mmap all apply, to a read only buffer')
+
+
+def check_threads(UpsPatch, source: bytes, patch: bytes, threads: int):
+    ups = UpsPatch(patch)
+    start = time.perf_counter()
+    for _ in range(threads):
+        ups.apply(source)
+    serial = time.perf_counter() - start
+
+    with ThreadPoolExecutor(threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: ups.apply(source), range(threads)))
+        parallel = time.perf_counter() - start
+    print(f'{threads} patches: {serial * 1000:.0f}ms one after another, {parallel * 1000:.0f}ms at once')
+    if (os.cpu_count() or 1) > 1 and threads > 1 and parallel > serial * 0.9:
+        sys.exit('patching in threads is no faster, so the GIL is being held while patching')
+
+
+def check_cache(source: bytes, target: bytes, patch: bytes):
+    from akyuu_bot.bot.akyuu import AkyuuBot
+    from akyuu_bot.config import config
+
+    config.bot_data.PATCHED_ROM_CACHE_SIZE = 2
+    cache_dir = config.bot_data.PATCHED_ROM_CACHE_DIR
+    for case in ('patched', 'cached'):
+        rom = AkyuuBot.patch_rom(source, patch, 'rom', 'mapped')
+        if not isinstance(rom.data.obj, mmap.mmap) or rom.data != target:
+            sys.exit(f'the {case} rom is not the patched rom mapped from the cache')
+        stream = rom.create_stream()
+        stream.seek(len(target) // 2)
+        if not isinstance(stream, mmap.mmap) or stream.read(16) != target[len(target) // 2:][:16]:
+            sys.exit(f'the {case} rom gives a stream that copies it, or reads the wrong bytes')
+    print('patched and cached roms are mapped from the cache, and so are their streams')
+
+    for i, name in enumerate(('a', 'b')):
+        AkyuuBot.patch_rom(source, patch, 'rom', name)
+        then = time.time() - 100 + i
+        os.utime(os.path.join(cache_dir, f'rom_{name}.gba'), (then, then))
+    AkyuuBot.patch_rom(source, patch, 'rom', 'a')  # hit, so 'b' is now the least recently used
+    AkyuuBot.patch_rom(source, patch, 'rom', 'c')
+    cached = sorted(os.listdir(cache_dir))
+    if cached != ['rom_a.gba', 'rom_c.gba']:
+        sys.exit(f'the cache evicted the wrong rom, it has {cached}')
+    print('the cache keeps the recently used roms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=16, help='size of the rom in MiB')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from akyuu_bot.ups_wrapper import UpsPatch
+
+    source, target = sample_roms(random.Random(args.seed), args.size * 1024 * 1024)
+    patch = make_patch(source, target)
+    print(f'patch: {len(patch) / 1024:.0f}KiB for a {args.size}MiB rom')
+    check_inputs(UpsPatch, source, target, patch)
+    check_threads(UpsPatch, source, patch, args.threads)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # the bot reads akyuu.json from here
+        with open('akyuu.json', 'w') as f:
+            json.dump({'bot_data': {'TOKEN': ''}}, f)
+        check_cache(source, target, patch)
+
+
+if __name__ == '__main__':
+    main()